@@ -0,0 +1,31 @@
+""" stress test of astoid parsing, linking and walking on synthetic deeply nested modules
+The tokenizer refuses more than 100 levels of indentation, so depths beyond that are reached with elif chains,
+which ast represents as an If nested inside the orelse of the previous If
+"""
+import sys, os.path, time
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import astoid
+from corpus import generate_nested
+
+def time_it(func,*args,repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return result,best
+
+def main(depths=(25,50,99),elif_depths=(100,500,2000)):
+    print('%-5s %6s %8s %12s %12s %14s' % ('kind','depth','astoids','parse (ms)','walk (ms)','walk/node (us)'))
+    for kind,kind_depths in [('if',depths),('def',depths),('try',depths),('elif',elif_depths)]:
+        for depth in kind_depths:
+            source = generate_nested(depth,kind)
+            root,parse_time = time_it(astoid.parse,source)
+            astoids,walk_time = time_it(lambda: list(root.walk()))
+            astoid.determine_successor(root)
+            print('%-5s %6d %8d %12.2f %12.2f %14.3f' % (kind,depth,len(astoids),parse_time*1000,walk_time*1000,walk_time*1e6/len(astoids)))
+
+if __name__ == '__main__':
+    main()
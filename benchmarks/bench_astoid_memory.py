@@ -0,0 +1,47 @@
+""" compares the memory held by an astoid tree, an AstoidTable and the plain ast tree for a large generated module
+"""
+import sys, os.path, gc, tracemalloc, ast
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import astoid
+
+def generate_module(n_functions=2000):
+    lines = []
+    for i in range(n_functions):
+        lines.append('def f%d(x):\n' % i)
+        lines.append('    """docstring %d"""\n' % i)
+        lines.append('    if x > %d:\n' % i)
+        lines.append('        y = x - %d\n' % i)
+        lines.append('    elif x < 0:\n')
+        lines.append('        y = -x\n')
+        lines.append('    else:\n')
+        lines.append('        y = x\n')
+        lines.append('    return y\n')
+        lines.append('\n')
+    return ''.join(lines)
+
+def measure(func,*args):
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    gc.collect()
+    current,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result,current,peak
+
+def main(n_functions=2000):
+    source = generate_module(n_functions)
+    n_lines = source.count('\n')
+    tree,ast_bytes,ast_peak = measure(ast.parse,source)
+    del tree
+    root,astoid_bytes,astoid_peak = measure(astoid.parse,source)
+    n_astoids = sum(1 for _ in root.walk())
+    del root
+    table,table_bytes,table_peak = measure(astoid.parse_table,source)
+    del table
+    print('module: %d lines, %d astoids' % (n_lines,n_astoids))
+    print('%-14s %12s %12s %10s' % ('representation','retained','peak','vs ast'))
+    for name,retained,peak in [('ast',ast_bytes,ast_peak),('Astoid',astoid_bytes,astoid_peak),('AstoidTable',table_bytes,table_peak)]:
+        print('%-14s %12d %12d %9.2fx' % (name,retained,peak,retained/ast_bytes))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
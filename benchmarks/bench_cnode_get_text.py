@@ -0,0 +1,35 @@
+""" measures bulk extraction of the source of every function in a package: joining get_lines() vs get_text() on the shared SourceBuffer
+"""
+import sys, os.path, time, tracemalloc
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import cnode
+
+def function_cnodes(root_cnode):
+    return [c for c in root_cnode.subtree() if isinstance(c,cnode.CnodeFunction)]
+
+def measure(extract,cnodes,repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for c in cnodes:
+            extract(c)
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    tracemalloc.start()
+    texts = [extract(c) for c in cnodes]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best,peak
+
+def main(path):
+    root_cnode = cnode.cnode_load(path)
+    cnodes = function_cnodes(root_cnode)
+    print('%d functions' % len(cnodes))
+    print('%-22s %12s %14s' % ('extraction','time (ms)','peak (KiB)'))
+    for name,extract in [('get_lines()',lambda c: c.get_lines()),('join get_lines()',lambda c: ''.join(c.get_lines())),('get_text()',lambda c: c.get_text()),('get_span()',lambda c: c.get_span())]:
+        elapsed,peak = measure(extract,cnodes)
+        print('%-22s %12.2f %14.1f' % (name,elapsed*1000,peak/1024))
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.__file__)+'/email')
@@ -0,0 +1,38 @@
+""" measures lazy cnode trees: looking up one definition in a package, and the overhead of building everything lazily
+"""
+import sys, os.path, time
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import cnode, parse_cache
+from symbol_index import SymbolIndex, find_cnode
+
+def measure(run,repeat=3):
+    best = None
+    for i in range(repeat):
+        #every run reads and parses the files again
+        parse_cache.clear_cache()
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best,result
+
+def built_modules(root_cnode):
+    return sum(1 for c in cnode.built_subtree(root_cnode) if isinstance(c,cnode.CnodeModule) and c._loader is None)
+
+def main(path,target):
+    print('%-30s %12s %16s' % ('load','time (ms)','modules built'))
+    elapsed,root_cnode = measure(lambda: cnode.cnode_load(path))
+    print('%-30s %12.2f %16d' % ('eager',elapsed*1000,built_modules(root_cnode)))
+    elapsed,root_cnode = measure(lambda: (lambda r: (SymbolIndex(r)[target],r)[1])(cnode.cnode_load(path)))
+    print('%-30s %12.2f %16d' % ('eager + SymbolIndex lookup',elapsed*1000,built_modules(root_cnode)))
+    elapsed,root_cnode = measure(lambda: (lambda r: (find_cnode(r,target),r)[1])(cnode.cnode_load(path,lazy=True)))
+    print('%-30s %12.2f %16d' % ('lazy + find_cnode',elapsed*1000,built_modules(root_cnode)))
+    elapsed,root_cnode = measure(lambda: (lambda r: (list(r.subtree()),r)[1])(cnode.cnode_load(path,lazy=True)))
+    print('%-30s %12.2f %16d' % ('lazy + build everything',elapsed*1000,built_modules(root_cnode)))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        main(sys.argv[1],sys.argv[2])
+    else:
+        main(os.path.dirname(os.__file__)+'/email','email.message.Message.get_payload')
@@ -0,0 +1,58 @@
+""" measures peak RSS of loading a large generated module with the default read+cache path vs mapped=True
+Each mode runs in a fresh subprocess so the peaks do not mask each other
+"""
+import sys, os, os.path, time, tempfile, subprocess, resource
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+
+def generate_module(n_messages,n_comments=40):
+    #shaped like protobuf/ORM output: many small classes with long literal tables and generator comments
+    parts = []
+    for i in range(n_messages):
+        parts.append(''.join('# @@protoc_insertion_point(message_%d_field_%d) generated from schema.proto, do not edit\n' % (i,j) for j in range(n_comments)))
+        parts.append('class Message%d():\n    """ generated message %d """\n    FIELDS = %r\n    def __init__(self,**kwargs):\n        for name in self.FIELDS:\n            setattr(self,name,kwargs.get(name))\n\n' % (i,i,['field_%d_%d' % (i,j) for j in range(20)]))
+    return ''.join(parts)
+
+def peak_rss_kib():
+    #ru_maxrss is in KiB on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak//1024 if sys.platform == 'darwin' else peak
+
+def rss_split_kib():
+    #(anonymous,file backed) resident KiB after loading; mapped source pages are file backed and can be dropped by the kernel
+    fields = {}
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                key,_,value = line.partition(':')
+                if key.startswith('Rss'):
+                    fields[key] = value.split()[0]
+    return int(fields.get('RssAnon',-1)),int(fields.get('RssFile',-1))
+
+def child(mode,path):
+    import cnode
+    baseline = peak_rss_kib()
+    anon_baseline,file_baseline = rss_split_kib()
+    start = time.perf_counter()
+    module_cnode = cnode.cnode_load(path,mapped=(mode == 'mapped'))
+    elapsed = time.perf_counter()-start
+    n_cnodes = sum(1 for c in module_cnode.subtree())
+    anon,file = rss_split_kib()
+    print('%s %d %d %d %d %f' % (mode,peak_rss_kib()-baseline,anon-anon_baseline,file-file_baseline,n_cnodes,elapsed))
+
+def main(n_messages=5000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir,'generated_pb2.py')
+        with open(path,'w') as f:
+            f.write(generate_module(n_messages))
+        print('%.1f MiB module' % (os.path.getsize(path)/2**20))
+        print('%-10s %16s %12s %12s %10s %10s' % ('mode','peak RSS (MiB)','anon (MiB)','file (MiB)','cnodes','load (s)'))
+        for mode in ['read','mapped']:
+            output = subprocess.run([sys.executable,__file__,'--child',mode,path],capture_output=True,text=True,check=True).stdout
+            mode,peak,anon,file,n_cnodes,elapsed = output.split()
+            print('%-10s %16.1f %12.1f %12.1f %10s %10.2f' % (mode,int(peak)/1024,int(anon)/1024,int(file)/1024,n_cnodes,float(elapsed)))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2],sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
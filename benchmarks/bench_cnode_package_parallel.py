@@ -0,0 +1,28 @@
+""" times CnodePackage loading of a generated package serially and with process pools of increasing size
+"""
+import sys, os, os.path, time, tempfile, shutil
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import cnode
+from corpus import generate_package
+
+def main(n_modules=64):
+    root = tempfile.mkdtemp()
+    try:
+        package_path = generate_package(root,n_modules)
+        cpu_count = os.cpu_count() or 1
+        worker_counts = [None]+sorted(set([1,2,4,8,cpu_count]))
+        print('%d modules, %d cpus' % (n_modules,cpu_count))
+        print('%-8s %10s %8s' % ('workers','time (s)','speedup'))
+        serial_time = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            cnode.cnode_load(package_path,workers=workers)
+            elapsed = time.perf_counter()-start
+            if serial_time is None:
+                serial_time = elapsed
+            print('%-8s %10.3f %7.2fx' % ('serial' if workers is None else workers,elapsed,serial_time/elapsed))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
@@ -0,0 +1,39 @@
+""" measures what parse state machine tracing costs: off (default), a no-op structured callback, and debug log formatting
+"""
+import sys, os.path, time
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import astoid, cnode
+
+def generate_module(n_functions):
+    return ''.join('class C%d():\n    def m(self,x):\n        y = x\n        return y\n\ndef f%d(x):\n    return x\n\n' % (i,i) for i in range(n_functions))
+
+def time_build(source,repeat=3):
+    best = None
+    for i in range(repeat):
+        astoid_tree = astoid.parse(source)
+        start = time.perf_counter()
+        cnode.build_module('generated.py',source,astoid_tree)
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def silent_log_trace(step):
+    #formats every message like log_trace but discards the result, so no log output is produced
+    for key in ['astoid','state','starting_cnode','parent','prev_sibling','predecessor','stack','cnode','next_state']:
+        '%s' % (step[key],)
+
+def main(n_functions=100):
+    source = generate_module(n_functions)
+    print('%d lines' % source.count('\n'))
+    print('%-22s %12s' % ('tracing','build (ms)'))
+    for name,callback in [('off',None),('no-op callback',lambda step: None),('formatted messages',silent_log_trace)]:
+        cnode.set_trace(callback)
+        try:
+            elapsed = time_build(source)
+        finally:
+            cnode.set_trace(None)
+        print('%-22s %12.2f' % (name,elapsed*1000))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
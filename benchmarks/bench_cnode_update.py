@@ -0,0 +1,25 @@
+""" compares CnodeModule.update after a one-function edit with rebuilding the whole module tree
+"""
+import sys, os.path, time
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import astoid, cnode
+
+def generate_module(n_functions):
+    return ''.join('def f%d(x):\n    if x > %d:\n        return x\n    return -x\n\n' % (i,i) for i in range(n_functions))
+
+def main(sizes=(50,200,800)):
+    print('%-10s %14s %14s %8s' % ('functions','rebuild (ms)','update (ms)','speedup'))
+    for n_functions in sizes:
+        source = generate_module(n_functions)
+        edited = source.replace('def f%d(x):\n' % (n_functions//2),'def f%d(x):\n    x += 1\n' % (n_functions//2))
+        module_cnode = cnode.build_module('generated.py',source,astoid.parse(source))
+        start = time.perf_counter()
+        cnode.build_module('generated.py',edited,astoid.parse(edited))
+        rebuild_time = time.perf_counter()-start
+        start = time.perf_counter()
+        module_cnode.update(edited)
+        update_time = time.perf_counter()-start
+        print('%-10d %14.2f %14.2f %7.1fx' % (n_functions,rebuild_time*1000,update_time*1000,rebuild_time/update_time))
+
+if __name__ == '__main__':
+    main()
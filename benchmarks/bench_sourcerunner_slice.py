@@ -0,0 +1,38 @@
+""" measures the startup of running one function of a module with expensive top-level blocks:
+importing the module vs SourceRunner executing only the statements the function depends on
+"""
+import sys, os, os.path, time, tempfile, importlib
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import sourcerunner
+
+def generate_module(n_blocks,block_seconds):
+    parts = ['import time, math\n']
+    for i in range(n_blocks):
+        #stands in for opening connections or loading models at import time
+        parts.append('RESOURCE_%d = time.sleep(%r)\n' % (i,block_seconds))
+        parts.append('def use_resource_%d():\n    return RESOURCE_%d\n' % (i,i))
+    parts.append('SCALE = 2\ndef helper(x):\n    return math.sqrt(x)*SCALE\ndef target(x):\n    return helper(x)+1\n')
+    return ''.join(parts)
+
+def main(n_blocks=10,block_seconds=0.05):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir,'expensive_module.py'),'w') as f:
+            f.write(generate_module(n_blocks,block_seconds))
+        sys.path.insert(0,tmp_dir)
+        print('%-28s %12s' % ('method','time (ms)'))
+        start = time.perf_counter()
+        module = importlib.import_module('expensive_module')
+        module.target(4)
+        print('%-28s %12.2f' % ('import module',(time.perf_counter()-start)*1000))
+        start = time.perf_counter()
+        runner = sourcerunner.resolve('expensive_module.target')
+        runner.run(4)
+        print('%-28s %12.2f' % ('SourceRunner (first run)',(time.perf_counter()-start)*1000))
+        start = time.perf_counter()
+        runner = sourcerunner.resolve('expensive_module.target')
+        runner.run(4)
+        print('%-28s %12.2f' % ('SourceRunner (cached code)',(time.perf_counter()-start)*1000))
+        print('%d of %d top-level statements executed' % (len(runner.statements()),len(runner.ast_lineage[0].body)))
+
+if __name__ == '__main__':
+    main(*[int(arg) if i == 0 else float(arg) for i,arg in enumerate(sys.argv[1:])])
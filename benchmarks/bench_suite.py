@@ -0,0 +1,168 @@
+""" benchmark suite of the parse, link, injection and resolution pipelines on the synthetic corpora of corpus.py
+    python bench_suite.py run [results.json] [scale] [name filter]
+    python bench_suite.py compare base.json new.json
+run prints a table and optionally writes the results as JSON, with the commit and python version they were measured at;
+scale multiplies the corpus sizes and the name filter selects the cases whose names contain it
+Each case reports the best and median wall time over its runs, the peak memory traced during one run (tracemalloc),
+and the bytes and memory blocks its result holds on to afterwards, which counts the objects it allocated
+"""
+import sys, os, os.path, gc, json, platform, shutil, statistics, subprocess, tempfile, time, tracemalloc
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+import astoid, cnode, parse_cache, sourcerunner, target_resolver
+from injector import DoctestInjector
+from corpus import generate_nested, generate_wide_module, generate_try_ladder, generate_package
+
+def measure(run,reset=None,repeat=5):
+    """
+    Returns the measurements of calling run(), calling reset() before every call to undo caching
+    """
+    times = []
+    for i in range(repeat):
+        if reset is not None:
+            reset()
+        gc.collect()
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter()-start)
+        del result
+    if reset is not None:
+        reset()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    result = run()
+    gc.collect()
+    blocks = sys.getallocatedblocks()-blocks
+    del result
+    if reset is not None:
+        reset()
+    gc.collect()
+    tracemalloc.start()
+    result = run()
+    gc.collect()
+    retained,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {
+            'best_ms':min(times)*1000,
+            'median_ms':statistics.median(times)*1000,
+            'peak_kib':peak/1024,
+            'retained_kib':retained/1024,
+            'retained_blocks':blocks,
+            'repeat':repeat,
+            }
+
+def write_module(folder,name,source):
+    path = os.path.join(folder,name+'.py')
+    with open(path,'w') as f:
+        f.write(source)
+    return path
+
+def cold():
+    #forget every parsed file, so that parsing and everything memoized on the parsed trees is redone
+    parse_cache.clear_cache()
+
+def cases(folder,scale=1.0):
+    """
+    Yields (name,size,run,reset) for every benchmark case, writing the files they need into folder
+    size describes the corpus, in lines for modules and in modules for packages
+    """
+    n = lambda count: max(1,int(count*scale))
+    sources = {
+            'wide':generate_wide_module(n(2000)),
+            'elif_chain':generate_nested(n(1000),'elif'),
+            'nested_if':generate_nested(90,'if'), #the tokenizer refuses 100 levels of indentation
+            'try_ladder':generate_try_ladder(n(200),n(10)),
+            }
+    paths = {name:write_module(folder,'bench_corpus_'+name,source) for name,source in sources.items()}
+    for name,source in sources.items():
+        yield 'astoid.parse/'+name,'%d lines' % source.count('\n'),(lambda source=source: astoid.parse(source)),None
+    for name,path in paths.items():
+        yield 'cnode.parse_module/'+name,'%d lines' % sources[name].count('\n'),(lambda path=path: cnode.parse_module(path)),cold
+
+    package_path = generate_package(folder,n(32),20,2,'bench_corpus_package')
+    n_modules = len(cnode.package_module_paths(package_path))
+    yield 'CnodePackage/package','%d modules' % n_modules,(lambda: cnode.CnodePackage(package_path)),cold
+    yield 'CnodePackage/package cached','%d modules' % n_modules,(lambda: cnode.CnodePackage(package_path)),None
+
+    n_functions = n(2000)
+    last = 'bench_corpus_wide.f%d' % (n_functions-1 if n_functions % 4 != 0 else n_functions-2)
+    sys.path.insert(0,folder)
+    yield 'DoctestInjector/init wide','%d lines' % sources['wide'].count('\n'),(lambda: DoctestInjector(last)),cold
+    injector = DoctestInjector(last)
+    injector.middle = ['>>> %s(%d)\n%d\n' % (last.rpartition('.')[2],i,i) for i in range(n(200))]
+    yield 'DoctestInjector.source/wide','%d doctest lines' % len(injector.middle),injector.source,None
+
+    targets = [last,'bench_corpus_wide.C3.method','bench_corpus_package.subpackage_001.module_%03d.C%d.method' % (n(32)-1,19)]
+    resolve_all = lambda: [sourcerunner.resolve(target,folder) for target in targets]
+    reset_resolution = lambda: (cold(),target_resolver.get_resolver(folder).clear())
+    yield 'sourcerunner.resolve/cold','%d targets' % len(targets),resolve_all,reset_resolution
+    yield 'sourcerunner.resolve/warm','%d targets' % len(targets),resolve_all,None
+
+def git_commit():
+    try:
+        return subprocess.run(['git','rev-parse','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def run(scale=1.0,name_filter=''):
+    """
+    Runs the cases and returns the results as a JSON serializable dictionary
+    """
+    #measure the work itself, not the on-disk parse cache
+    parse_cache.configure(cache_dir=None)
+    folder = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    results = {}
+    try:
+        #DoctestInjector only touches files below the working directory
+        os.chdir(folder)
+        print('%-36s %16s %10s %10s %11s %12s %10s' % ('case','size','best (ms)','median','peak (KiB)','retained','blocks'))
+        for name,size,case_run,reset in cases(folder,scale):
+            if name_filter not in name:
+                continue
+            result = measure(case_run,reset)
+            result['size'] = size
+            results[name] = result
+            print('%-36s %16s %10.2f %10.2f %11.1f %12.1f %10d' % (name,size,result['best_ms'],result['median_ms'],result['peak_kib'],result['retained_kib'],result['retained_blocks']))
+    finally:
+        os.chdir(cwd)
+        if folder in sys.path:
+            sys.path.remove(folder)
+        shutil.rmtree(folder)
+    return {
+            'commit':git_commit(),
+            'python':sys.version,
+            'platform':platform.platform(),
+            'scale':scale,
+            'created':time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results':results,
+            }
+
+def compare(base,new,threshold=0.1):
+    """
+    Prints the ratio new/base of the time and memory of every case the two runs share, marking changes beyond threshold
+    """
+    print('base %s, new %s' % (base.get('commit'),new.get('commit')))
+    print('%-36s %10s %10s %8s %12s %12s %8s' % ('case','base (ms)','new (ms)','time','base (KiB)','new (KiB)','peak'))
+    for name,base_result in base['results'].items():
+        new_result = new['results'].get(name)
+        if new_result is None:
+            continue
+        time_ratio = new_result['best_ms']/base_result['best_ms'] if base_result['best_ms'] > 0 else 1.0
+        peak_ratio = new_result['peak_kib']/base_result['peak_kib'] if base_result['peak_kib'] > 0 else 1.0
+        flag = lambda ratio: '+' if ratio > 1+threshold else '-' if ratio < 1-threshold else ' '
+        print('%-36s %10.2f %10.2f %7.2f%s %12.1f %12.1f %7.2f%s' % (name,base_result['best_ms'],new_result['best_ms'],time_ratio,flag(time_ratio),base_result['peak_kib'],new_result['peak_kib'],peak_ratio,flag(peak_ratio)))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        with open(sys.argv[2]) as f:
+            base = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        compare(base,new)
+    else:
+        output_path = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != '-' else None
+        results = run(float(sys.argv[3]) if len(sys.argv) > 3 else 1.0,sys.argv[4] if len(sys.argv) > 4 else '')
+        if output_path is not None:
+            with open(output_path,'w') as f:
+                json.dump(results,f,indent=1,sort_keys=True)
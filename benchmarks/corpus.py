@@ -0,0 +1,75 @@
+""" synthetic source corpora shared by the benchmarks
+Every generator is deterministic, so results can be compared across commits
+"""
+import os, os.path
+
+def generate_nested(depth,kind='if'):
+    """
+    One statement nested depth levels deep in if, def or try statements, or an if/elif chain of depth branches
+    The tokenizer refuses more than 100 levels of indentation, so depths beyond that are only possible with elif chains,
+    which ast represents as an If nested inside the orelse of the previous If
+    """
+    lines = []
+    if kind == 'elif':
+        lines.append('if x == 0:\n    x = 0\n')
+        for level in range(1,depth):
+            lines.append('elif x == %d:\n    x = %d\n' % (level,level))
+        lines.append('else:\n    x = -1\n')
+        return ''.join(lines)
+    for level in range(depth):
+        indentation = ' '*level
+        if kind == 'if':
+            lines.append('%sif x > %d:\n' % (indentation,level))
+        elif kind == 'def':
+            lines.append('%sdef f%d(x):\n' % (indentation,level))
+        elif kind == 'try':
+            lines.append('%stry:\n' % indentation)
+        else:
+            raise Exception('Unknown nesting kind: %s' % kind)
+    lines.append('%sx = 0\n' % (' '*depth))
+    if kind == 'try':
+        for level in reversed(range(depth)):
+            lines.append('%sexcept Exception:\n%s pass\n' % (' '*level,' '*level))
+    return ''.join(lines)
+
+def generate_wide_module(n_functions):
+    """
+    A flat module of n_functions small documented functions and classes, the shape of most library code
+    """
+    parts = ['import os, sys\n\nCONSTANT = 1\n\n']
+    for i in range(n_functions):
+        if i % 4 == 3:
+            parts.append('class C%d():\n    """ class %d """\n    def method(self,x):\n        return x+%d\n\n' % (i,i,i))
+        else:
+            parts.append('def f%d(x):\n    """ function %d """\n    if x > %d:\n        return x-%d\n    return x\n\n' % (i,i,i,i))
+    return ''.join(parts)
+
+def generate_try_ladder(n_handlers,n_blocks=1):
+    """
+    n_blocks top-level try statements, each with n_handlers except clauses, an else and a finally
+    """
+    parts = []
+    for block in range(n_blocks):
+        parts.append('try:\n    value = compute(%d)\n' % block)
+        for i in range(n_handlers):
+            parts.append('except Error%d as e:\n    value = handle(e,%d)\n' % (i,i))
+        parts.append('else:\n    value += 1\nfinally:\n    cleanup(%d)\n\n' % block)
+    return ''.join(parts)
+
+def generate_package(root,n_modules=64,n_functions=40,n_subpackages=0,name='generated_package'):
+    """
+    Writes a package of n_modules modules under root, plus n_subpackages subpackages of n_modules modules each, and returns its path
+    """
+    package_path = os.path.join(root,name)
+    os.makedirs(package_path)
+    with open(os.path.join(package_path,'__init__.py'),'w') as f:
+        f.write('')
+    for i in range(n_modules):
+        with open(os.path.join(package_path,'module_%03d.py' % i),'w') as f:
+            f.write('import os\n\nCONSTANT = %d\n\n' % i)
+            for j in range(n_functions):
+                f.write('class C%d():\n    def method(self,x):\n        if x:\n            return x+%d\n        return None\n\n' % (j,j))
+                f.write('def f%d(x):\n    for i in range(x):\n        x += i\n    return x\n\n' % j)
+    for i in range(n_subpackages):
+        generate_package(package_path,n_modules,n_functions,0,'subpackage_%03d' % i)
+    return package_path
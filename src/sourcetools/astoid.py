@@ -1,7 +1,9 @@
 """ astoid is ast with more features
 """
 from enum import Enum,auto
-import ast, sys
+from array import array
+from source_buffer import SourceBuffer
+import ast, copy, sys
 def iterate_with_siblings(iterable):
     """
     Yields triplets of an item with its adjacent siblings
@@ -27,14 +29,42 @@ class CodeClause(Enum):
     EXCEPT=auto()
     FINALLY=auto()
 
-def parse(source_text):
-    source_lines = source_text.splitlines(keepends=True)
-    ast_node = ast.parse(source_text)
+def parse(source_text,ast_node=None):
+    """
+    Builds the astoid tree for source_text, or returns None if it contains no statements
+    An already parsed ast tree of the same source may be passed as ast_node to skip ast.parse
+    """
+    source_lines = source_text if isinstance(source_text,SourceBuffer) else SourceBuffer(source_text)
+    if ast_node is None:
+        ast_node = ast.parse(source_lines.get_text())
     root_astoid,predecessor_astoid = _parse(source_lines,ast_node)
+    if root_astoid is None:
+        #empty module
+        return None
     predecessor_astoid.successor = None
+    root_astoid.prev_sibling = None
+    root_astoid.next_sibling = None
     introduce_siblings(root_astoid)
     return root_astoid
 def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_astoid=None):
+    """
+    Drives _parse_steps with an explicit stack instead of recursion so nesting depth is not bounded by the recursion limit
+    Each step generator yields the arguments for parsing one child statement and is resumed with that child's (first_astoid,predecessor_astoid)
+    """
+    stack = [_parse_steps(source_lines,ast_node,parent_astoid,homeroom,predecessor_astoid)]
+    result = None
+    while True:
+        try:
+            child_args = stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            result = stop.value
+            if len(stack) == 0:
+                return result
+        else:
+            result = None
+            stack.append(_parse_steps(source_lines,*child_args))
+def _parse_steps(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_astoid=None):
     if homeroom is None:
         homeroom = []
         root=True
@@ -50,9 +80,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
             homeroom.append(astoid)
             predecessor_astoid = astoid
             for child_ast_node in ast_node.body:
-                astoid,predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
     elif isinstance(ast_node,(ast.For,ast.AsyncFor,ast.While)):
         #body and orelse
         if len(ast_node.body) > 0:
@@ -62,9 +92,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
             homeroom.append(astoid)
             predecessor_astoid = astoid
             for child_ast_node in ast_node.body:
-                astoid,predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
         if len(ast_node.orelse) > 0:
             astoid = Astoid(source_lines,ast_node,parent_astoid,CodeClause.ELSE,homeroom,predecessor_astoid)
             if first_astoid is None:
@@ -72,9 +102,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
             homeroom.append(astoid)
             predecessor_astoid = astoid
             for child_ast_node in ast_node.orelse:
-                astoid, predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
     elif isinstance(ast_node,ast.If):
         #body and orelse - special handling for elif
         if len(ast_node.body) > 0:
@@ -100,18 +130,18 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
                 predecessor_astoid = astoid
             homeroom.append(astoid)
             for child_ast_node in ast_node.body:
-                astoid,predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
         if len(ast_node.orelse) > 0:
             astoid = Astoid(source_lines,ast_node,parent_astoid,CodeClause.ELSE,homeroom,predecessor_astoid)
             if first_astoid is None:
                 first_astoid = astoid
             predecessor_astoid = astoid
             for child_ast_node in ast_node.orelse:
-                astoid, predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
 
                 
             #check if there was actually an else, not just elifs
@@ -130,9 +160,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
             homeroom.append(astoid)
             predecessor_astoid = astoid
             for child_ast_node in ast_node.body:
-                astoid, predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
         if len(ast_node.handlers) > 0:
             for handler_ast_node in ast_node.handlers:
                 if len(handler_ast_node.body) > 0:
@@ -142,9 +172,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
                     homeroom.append(astoid)
                     predecessor_astoid = astoid
                     for child_ast_node in handler_ast_node.body:
-                        astoid,predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                        child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                         if first_astoid is None:
-                            first_astoid = astoid
+                            first_astoid = child_astoid
         if len(ast_node.orelse) > 0:
             astoid = Astoid(source_lines,ast_node,parent_astoid,CodeClause.ELSE,homeroom,predecessor_astoid)
             if first_astoid is None:
@@ -152,9 +182,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
             predecessor_astoid = astoid
             homeroom.append(astoid)
             for child_ast_node in ast_node.orelse:
-                astoid,predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
         if len(ast_node.finalbody) > 0:
             astoid = Astoid(source_lines,ast_node,parent_astoid,CodeClause.FINALLY,homeroom,predecessor_astoid)
             if first_astoid is None:
@@ -162,9 +192,9 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
             homeroom.append(astoid)
             predecessor_astoid = astoid
             for child_ast_node in ast_node.finalbody:
-                astoid,predecessor_astoid = _parse(source_lines=source_lines,ast_node=child_ast_node,parent_astoid=astoid,homeroom=astoid.children,predecessor_astoid=predecessor_astoid)
+                child_astoid,predecessor_astoid = yield (child_ast_node,astoid,astoid.children,predecessor_astoid)
                 if first_astoid is None:
-                    first_astoid = astoid
+                    first_astoid = child_astoid
     else:
         astoid = Astoid(source_lines,ast_node,parent_astoid,None,homeroom,predecessor_astoid)
         if first_astoid is None:
@@ -175,50 +205,54 @@ def _parse(source_lines,ast_node,parent_astoid=None,homeroom=None,predecessor_as
     return first_astoid, predecessor_astoid
 
 def introduce_siblings(astoid):
-    for prev_sibling,curr_sibling,next_sibling in iterate_with_siblings(astoid.children):
-        introduce_siblings(curr_sibling)
-        curr_sibling.prev_sibling = prev_sibling
-        curr_sibling.next_sibling = next_sibling
+    stack = [astoid]
+    while len(stack) > 0:
+        astoid = stack.pop()
+        for prev_sibling,curr_sibling,next_sibling in iterate_with_siblings(astoid.children):
+            stack.append(curr_sibling)
+            curr_sibling.prev_sibling = prev_sibling
+            curr_sibling.next_sibling = next_sibling
 
 def determine_successor(astoid):
-    for child in astoid.children:
-        determine_successor(child)
-    if len(astoid.children) > 0:
-        astoid.successor = astoid.children[0]
-    else:
-        if astoid.next_sibling is not None:
-            astoid.successor = astoid.next_sibling
+    #each astoid's successor only depends on the tree structure, so they can be determined in any order
+    for astoid in astoid.walk():
+        if len(astoid.children) > 0:
+            astoid.successor = astoid.children[0]
         else:
-            ancestor = astoid.parent
-            while ancestor is not None:
-                if ancestor.next_sibling is not None:
-                    astoid.successor = ancestor.next_sibling
-                    break
-                else:
-                    ancestor = ancestor.parent
+            if astoid.next_sibling is not None:
+                astoid.successor = astoid.next_sibling
             else:
-                astoid.successor = None
+                ancestor = astoid.parent
+                while ancestor is not None:
+                    if ancestor.next_sibling is not None:
+                        astoid.successor = ancestor.next_sibling
+                        break
+                    else:
+                        ancestor = ancestor.parent
+                else:
+                    astoid.successor = None
 def determine_predecessor(astoid):
-    for child in astoid.children:
-        determine_predecessor(child)
-    if astoid.prev_sibling is not None:
-        target = astoid.prev_sibling
-        while len(target.children) > 0:
-            target = target.children[-1]
-        astoid.predecessor = target
-    else:
-        if astoid.parent is not None:
-            astoid.predecessor = astoid.parent
+    #each astoid's predecessor only depends on the tree structure, so they can be determined in any order
+    for astoid in astoid.walk():
+        if astoid.prev_sibling is not None:
+            target = astoid.prev_sibling
+            while len(target.children) > 0:
+                target = target.children[-1]
+            astoid.predecessor = target
         else:
-            astoid.predecessor = None
+            if astoid.parent is not None:
+                astoid.predecessor = astoid.parent
+            else:
+                astoid.predecessor = None
 
 
 class Astoid():
+    __slots__ = ('source_lines','ast_node','clause','parent','homeroom','children','prev_sibling','next_sibling','successor','predecessor','cnode','line_index','col_offset','shift')
     def __init__(self,source_lines,ast_node,parent_astoid,clause,homeroom,predecessor):
         self.source_lines = source_lines
         self.ast_node = ast_node
+        self.shift = None #pending LineShifts/StatementShift that holds ast_node back until it is used
         self.clause = clause
-        self.type = (type(ast_node),clause)
         self.parent = parent_astoid
         self.homeroom = homeroom
         self.children = []
@@ -233,7 +267,8 @@ class Astoid():
                 predecessor.successor = self
             else:
                 if self.type == (ast.If,CodeClause.ELIF) and predecessor.successor.type == (ast.If,CodeClause.ELSE):
-                    pass
+                    #the elif cuts in front of the else clause that holds it in the ast, which is only kept if it has statements of its own
+                    predecessor.successor = self
                 else:
                     raise Exception('Multiple successors')
         if not isinstance(ast_node,ast.Module):
@@ -249,24 +284,297 @@ class Astoid():
             line_str = ast_node.value.s.splitlines(keepends=True)[0] #grab string content after triple quote start of string in that line
             self.col_offset = len(line)-len(line_str)-3 #calculate start of triple quote in first line
                 
+    def __getattr__(self,name):
+        #only reached for unset slots, such as the ast_node of an astoid whose statement has a pending line shift
+        if name == 'ast_node' and self.shift is not None:
+            self.shift.apply()
+            return self.ast_node
+        raise AttributeError('%s object has no attribute %s' % (type(self).__name__,repr(name)))
+    @property
+    def type(self):
+        #computed on access instead of stored to keep the per-node footprint small
+        return (type(self.ast_node),self.clause)
+    def __str__(self):
+        return 'Astoid(%s,%s)' % (type(self.ast_node).__name__,repr(self.clause))
+    def __repr__(self):
+        return '<' + str(self) + '>'
+
+    def walk(self):
+        stack = [self]
+        while len(stack) > 0:
+            astoid = stack.pop()
+            yield astoid
+            stack.extend(reversed(astoid.children))
+    def skip_next(self):
+        if self.next_sibling is not None:
+            return self.next_sibling
+        return self.successor
+    def skip_prev(self):
+        if self.prev_sibling is not None:
+            return self.prev_sibling
+        return self.predecessor
+
+class LineShifts():
+    """
+    Line number shifts of the top-level statements of a module ast that are only applied once the ast is used
+    The line indices of astoids are shifted right away, but the astoids of a shifted statement give up their ast_node
+    until one of them is used; the statement is then copied (it may be shared through the parse cache) and shifted as a whole
+    module is the module ast of root_astoid, whose statements listed in owned are not shared and are shifted in place
+    """
+    def __init__(self,root_astoid,module,owned=()):
+        self.root = root_astoid
+        self.module = module
+        self.owned = set(id(statement) for statement in owned)
+        self.pending = {} #id(statement) -> StatementShift
+        root_astoid.ast_node = module
+    def offset(self,statement):
+        """
+        Returns the shift still to be applied to the line numbers of a top-level statement
+        """
+        shift = self.pending.get(id(statement))
+        return 0 if shift is None else shift.delta
+    def add(self,statement,delta,astoids):
+        """
+        Shifts a top-level statement, whose astoids are given, by delta lines
+        """
+        shift = self.pending.get(id(statement))
+        if shift is None:
+            shift = self.pending[id(statement)] = StatementShift(self,statement,astoids)
+        shift.delta += delta
+        if self.root.shift is None:
+            #the module ast lists the statements, so it is held back as well
+            del self.root.ast_node
+            self.root.shift = self
+    def replace(self,statements,new_statements):
+        """
+        Forgets the top-level statements that an edit replaced with new_statements, which are owned
+        The astoids of the replaced statements get their unshifted ast back
+        """
+        for statement in statements:
+            shift = self.pending.pop(id(statement),None)
+            if shift is not None:
+                shift.restore()
+            self.owned.discard(id(statement))
+        self.owned.update(id(statement) for statement in new_statements)
+        self.settle()
+    def apply(self):
+        #the module ast is used: shift every pending statement
+        body = self.module.body
+        for index,statement in enumerate(body):
+            shift = self.pending.get(id(statement))
+            if shift is not None:
+                body[index] = shift.shifted()
+        self.settle()
+    def settle(self):
+        if len(self.pending) == 0 and self.root.shift is not None:
+            self.root.shift = None
+            self.root.ast_node = self.module
+
+class StatementShift():
+    """
+    Pending shift of one top-level statement of LineShifts
+    """
+    __slots__ = ('shifts','statement','delta','astoids')
+    def __init__(self,shifts,statement,astoids):
+        self.shifts = shifts
+        self.statement = statement
+        self.delta = 0
+        self.astoids = []
+        for astoid in astoids:
+            self.astoids.append((astoid,astoid.ast_node))
+            del astoid.ast_node
+            astoid.shift = self
+    def restore(self):
+        for astoid,ast_node in self.astoids:
+            astoid.ast_node = ast_node
+            astoid.shift = None
+    def shifted(self):
+        #returns the shifted statement and gives its astoids their shifted ast nodes
+        shifts = self.shifts
+        del shifts.pending[id(self.statement)]
+        if id(self.statement) in shifts.owned:
+            statement = self.statement
+            copies = None
+        else:
+            copies = {}
+            statement = copy.deepcopy(self.statement,copies)
+            shifts.owned.add(id(statement))
+        ast.increment_lineno(statement,self.delta)
+        for astoid,ast_node in self.astoids:
+            astoid.ast_node = ast_node if copies is None else copies[id(ast_node)]
+            astoid.shift = None
+        return statement
+    def apply(self):
+        #one astoid of the statement is used: shift only this statement
+        body = self.shifts.module.body
+        body[body.index(self.statement)] = self.shifted()
+        self.shifts.settle()
+
+NO_INDEX = -1 #stored in AstoidTable link columns in place of None (or an unset ...)
+
+class AstoidTable():
+    """
+    Struct-of-arrays representation of an astoid tree
+    Nodes are numbered in walk() order; links between nodes are stored as indices in array('i') columns
+    Individual nodes are accessed through lightweight AstoidView objects
+    """
+    def __init__(self,source_lines):
+        self.source_lines = source_lines
+        self.ast_nodes = []
+        self.clauses = []
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.prev_sibling = array('i')
+        self.next_sibling = array('i')
+        self.successor = array('i')
+        self.predecessor = array('i')
+        self.line_index = array('i')
+        self.col_offset = array('i')
+        self.cnodes = {} #sparse index -> cnode mapping, only filled in when a cnode claims an astoid
+
+    @classmethod
+    def from_astoid(cls,root_astoid):
+        table = cls(root_astoid.source_lines)
+        astoids = list(root_astoid.walk())
+        index_of = {id(astoid):index for index,astoid in enumerate(astoids)}
+        def link(astoid):
+            if astoid is None or astoid is ...:
+                return NO_INDEX
+            return index_of.get(id(astoid),NO_INDEX)
+        for astoid in astoids:
+            table.ast_nodes.append(astoid.ast_node)
+            table.clauses.append(astoid.clause)
+            table.parent.append(link(astoid.parent))
+            table.first_child.append(link(astoid.children[0]) if len(astoid.children) > 0 else NO_INDEX)
+            table.prev_sibling.append(link(astoid.prev_sibling))
+            table.next_sibling.append(link(astoid.next_sibling))
+            table.successor.append(link(astoid.successor))
+            table.predecessor.append(link(astoid.predecessor))
+            table.line_index.append(NO_INDEX if astoid.line_index is None else astoid.line_index)
+            table.col_offset.append(NO_INDEX if astoid.col_offset is None else astoid.col_offset)
+        return table
+
+    def __len__(self):
+        return len(self.ast_nodes)
+    def __getitem__(self,index):
+        if index < 0 or index >= len(self.ast_nodes):
+            raise IndexError('Astoid index out of range: %d' % index)
+        return AstoidView(self,index)
+    def view(self,index):
+        if index == NO_INDEX:
+            return None
+        return AstoidView(self,index)
+    def root(self):
+        return self.view(0 if len(self.ast_nodes) > 0 else NO_INDEX)
+
+class AstoidView():
+    """
+    Lightweight handle onto one row of an AstoidTable exposing the same navigation as Astoid
+    """
+    __slots__ = ('table','index')
+    def __init__(self,table,index):
+        self.table = table
+        self.index = index
+    def __eq__(self,other):
+        return isinstance(other,AstoidView) and other.table is self.table and other.index == self.index
+    def __hash__(self):
+        return hash((id(self.table),self.index))
+
+    @property
+    def source_lines(self):
+        return self.table.source_lines
+    @property
+    def ast_node(self):
+        return self.table.ast_nodes[self.index]
+    @property
+    def clause(self):
+        return self.table.clauses[self.index]
+    @property
+    def type(self):
+        return (type(self.table.ast_nodes[self.index]),self.table.clauses[self.index])
+    @property
+    def parent(self):
+        return self.table.view(self.table.parent[self.index])
+    @property
+    def homeroom(self):
+        parent = self.parent
+        if parent is None:
+            return [self]
+        return parent.children
+    @property
+    def children(self):
+        children = []
+        child_index = self.table.first_child[self.index]
+        while child_index != NO_INDEX:
+            children.append(AstoidView(self.table,child_index))
+            child_index = self.table.next_sibling[child_index]
+        return children
+    @property
+    def prev_sibling(self):
+        return self.table.view(self.table.prev_sibling[self.index])
+    @property
+    def next_sibling(self):
+        return self.table.view(self.table.next_sibling[self.index])
+    @property
+    def successor(self):
+        return self.table.view(self.table.successor[self.index])
+    @property
+    def predecessor(self):
+        return self.table.view(self.table.predecessor[self.index])
+    @property
+    def line_index(self):
+        line_index = self.table.line_index[self.index]
+        return None if line_index == NO_INDEX else line_index
+    @property
+    def col_offset(self):
+        col_offset = self.table.col_offset[self.index]
+        return None if col_offset == NO_INDEX else col_offset
+    @property
+    def cnode(self):
+        return self.table.cnodes.get(self.index)
+    @cnode.setter
+    def cnode(self,cnode):
+        self.table.cnodes[self.index] = cnode
+
     def __str__(self):
         return 'Astoid(%s,%s)' % (type(self.ast_node).__name__,repr(self.clause))
     def __repr__(self):
         return '<' + str(self) + '>'
 
     def walk(self):
-        yield self
-        for child in self.children:
-            yield from child.walk()
+        #rows are stored in walk order, so a subtree is the contiguous run of rows up to the next row outside of it
+        table = self.table
+        end = self.index+1
+        ancestor_index = self.index
+        while ancestor_index != NO_INDEX:
+            if table.next_sibling[ancestor_index] != NO_INDEX:
+                end = table.next_sibling[ancestor_index]
+                break
+            ancestor_index = table.parent[ancestor_index]
+        else:
+            end = len(table)
+        for index in range(self.index,end):
+            yield AstoidView(table,index)
     def skip_next(self):
         if self.next_sibling is not None:
             return self.next_sibling
-        return self.sucessor
+        return self.successor
     def skip_prev(self):
         if self.prev_sibling is not None:
             return self.prev_sibling
         return self.predecessor
 
+def parse_table(source_text):
+    """
+    Parses source text into a compact AstoidTable instead of a tree of Astoid objects
+    Source without statements gives an empty table
+    """
+    source_lines = source_text if isinstance(source_text,SourceBuffer) else SourceBuffer(source_text)
+    root_astoid = parse(source_lines)
+    if root_astoid is None:
+        return AstoidTable(source_lines)
+    return AstoidTable.from_astoid(root_astoid)
+
 if __name__ == '__main__':
     import os
     os.environ['PYTHONINSPECT'] = '1'
@@ -0,0 +1,115 @@
+""" async_cnode loads cnode trees from asyncio code without blocking the event loop
+Files are listed, read and parsed in an executor with a bounded number of modules in flight, and modules can be consumed as they finish
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from importlib.util import find_spec
+from cnode import parse_module, compact_module, expand_module, package_module_paths, cnode_load, CnodePackage
+import asyncio, os, os.path
+
+def list_modules(path):
+    #the module paths of a package folder in package order, or the module file itself
+    return package_module_paths(path) if os.path.isdir(path) else [path]
+
+async def aparse_module(path,executor=None,mapped=False,lazy=False):
+    """
+    Async counterpart of parse_module: returns the standalone CnodeModule of a python file, read and parsed in executor
+    executor=None uses the default executor of the event loop (threads), which keeps the loop free but shares the GIL;
+    with a ProcessPoolExecutor the module is parsed in another process and rebuilt from its compact form (as cnode_load with workers)
+    lazy=True returns a module whose definitions are built on first use, in the calling thread; executor is ignored then
+    """
+    loop = asyncio.get_running_loop()
+    if lazy:
+        return await loop.run_in_executor(None,partial(parse_module,path,mapped=mapped,lazy=True))
+    if isinstance(executor,ProcessPoolExecutor):
+        return expand_module(await loop.run_in_executor(executor,partial(compact_module,path,mapped)))
+    return await loop.run_in_executor(executor,partial(parse_module,path,mapped=mapped))
+
+async def astream_modules(path,executor=None,limit=None,mapped=False):
+    """
+    Yields the standalone CnodeModule of every module of a package folder (or of one module file) as soon as it is parsed,
+    so in completion order rather than package order
+    At most limit modules (by default one per cpu) are read and parsed at a time; see aparse_module for executor
+    Leaving the loop early cancels the modules that are not finished yet
+    """
+    loop = asyncio.get_running_loop()
+    module_paths = await loop.run_in_executor(None,list_modules,path)
+    limit = limit or os.cpu_count() or 1
+    pending = set()
+    index = 0
+    try:
+        while index < len(module_paths) or len(pending) > 0:
+            while index < len(module_paths) and len(pending) < limit:
+                pending.add(asyncio.ensure_future(aparse_module(module_paths[index],executor,mapped)))
+                index += 1
+            done,pending = await asyncio.wait(pending,return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+def attach_module(modules,path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None):
+    """
+    Module loader for CnodePackage that links the already parsed standalone CnodeModule of path (popped from modules)
+    into the package the way Cnode.__init__ links a new cnode; modules that were not parsed yet are parsed here
+    """
+    if path not in modules:
+        #appeared after the modules were listed
+        return parse_module(path,parent_cnode,prev_sibling_cnode,predecessor_cnode)
+    module_cnode = modules.pop(path)
+    module_cnode.parent = parent_cnode
+    parent_cnode.children.append(module_cnode)
+    module_cnode.prev_sibling = prev_sibling_cnode
+    if prev_sibling_cnode is not None:
+        prev_sibling_cnode.next_sibling = module_cnode
+    module_cnode.predecessor = predecessor_cnode
+    predecessor_cnode.successor = module_cnode
+    return module_cnode
+
+async def acnode_load(path,executor=None,limit=None,mapped=False,lazy=False):
+    """
+    Async counterpart of cnode_load: loads the cnode tree of a package folder or a module file without blocking the event loop
+    The modules are parsed as by astream_modules and then linked into the package in an executor thread
+    lazy=True only lists the modules (as cnode_load(path,lazy=True)), so each one is parsed in the calling thread when first used
+    """
+    loop = asyncio.get_running_loop()
+    if lazy:
+        return await loop.run_in_executor(None,partial(cnode_load,path,mapped=mapped,lazy=True))
+    modules = {}
+    async for module_cnode in astream_modules(path,executor,limit,mapped):
+        modules[module_cnode.path] = module_cnode
+    if path in modules:
+        #module
+        return modules[path]
+    return await loop.run_in_executor(None,partial(CnodePackage,path,module_loader=partial(attach_module,modules)))
+
+async def acnode_import(name,executor=None,limit=None,mapped=False,lazy=False):
+    """
+    Async counterpart of cnode_import; finding the module may import its parent packages, which happens in an executor thread
+    """
+    spec = await asyncio.get_running_loop().run_in_executor(None,find_spec,name)
+    if spec is None:
+        raise Exception('Not an importable name: %s' % name)
+    path = spec.origin
+    if os.path.basename(path).lower() == '__init__.py':
+        #package
+        path = os.path.dirname(path)
+    return await acnode_load(path,executor,limit,mapped,lazy)
+
+if __name__ == '__main__':
+    import sys, time
+    async def main(path):
+        start = time.perf_counter()
+        ticks = 0
+        async def ticker():
+            #counts how often the event loop got to run while the tree was loading
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+        ticking = asyncio.ensure_future(ticker())
+        root_cnode = await acnode_load(path)
+        ticking.cancel()
+        print('%s loaded in %.3f s, event loop ran %d times meanwhile' % (root_cnode,time.perf_counter()-start,ticks))
+    asyncio.run(main(sys.argv[1]))
@@ -3,16 +3,20 @@
 
 from enum import Enum, auto
 import ast, re
-from astoid import parse as astoid_parse, CodeClause
+from astoid import parse as astoid_parse, CodeClause, Astoid, AstoidTable, LineShifts
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from bisect import bisect_right
+import parse_cache
+from source_buffer import SourceBuffer
 import tokenize, token, sys, os, os.path, traceback, pdb
 from importlib.util import find_spec
-import logarhythm
-
-logger = logarhythm.getLogger()
-logger.level = logarhythm.DEBUG
 
 wspace_re = re.compile('^\\s*')
 
+trace_callback = None #called with a dict describing every step of the parse state machine, see set_trace()
+_trace_logger = None
+
 
 class ParseState(Enum):
     NEWBLOCK=auto()
@@ -21,46 +25,100 @@ class ParseState(Enum):
     DONE=auto()
 
 
-def parse_module(path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None):
+def parse_module(path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None,mapped=False,lazy=False):
+    """
+    Builds the CnodeModule of a python file
+    With mapped=True the file is read through a memory map and its lines are decoded on access,
+    bypassing the parse cache - meant for very large (e.g. generated) modules
+    With lazy=True the children of definitions are only built when they are first used (see Cnode.load)
+    """
     if os.path.splitext(path)[1].lower() not in ['.py','.pyw']:
         raise Exception('parse() must be called against a python script file')
-    with open(path,'r') as f:
-        source = f.read()
-    astoid_tree = astoid_parse(source)
-    source_lines = astoid_tree.source_lines
+    if mapped:
+        source = SourceBuffer.map_file(path)
+        ast_tree = ast.parse(source.read_bytes() if source.path is not None else source.text,filename=path)
+    else:
+        source,ast_tree = parse_cache.load(path)
+    astoid_tree = astoid_parse(source,ast_tree)
+    return build_module(path,source,astoid_tree,parent_cnode,prev_sibling_cnode,predecessor_cnode,lazy)
+
+def set_trace(callback=...):
+    """
+    Turns on tracing of the parse state machine; callback receives one dict per step with the keys
+    astoid, state, next_state, starting_cnode, cnode, parent, prev_sibling, predecessor and stack
+    Without a callback the steps are written as debug log messages; set_trace(None) turns tracing off again
+    """
+    global trace_callback
+    trace_callback = log_trace if callback is ... else callback
+
+def log_trace(step):
+    global _trace_logger
+    if _trace_logger is None:
+        try:
+            import logarhythm
+            _trace_logger = logarhythm.getLogger()
+            _trace_logger.level = logarhythm.DEBUG
+        except ImportError:
+            import logging
+            _trace_logger = logging.getLogger(__name__)
+            _trace_logger.setLevel(logging.DEBUG)
+    _trace_logger.debug('Astoid: %s' % step['astoid'])
+    _trace_logger.debug('State: %s' % step['state'])
+    _trace_logger.debug('Starting Cnode: %s' % step['starting_cnode'])
+    _trace_logger.debug('Parent: %s' % step['parent'])
+    _trace_logger.debug('Prev sibling: %s' % step['prev_sibling'])
+    _trace_logger.debug('Predecessor: %s' % step['predecessor'])
+    _trace_logger.debug('Stack: %s' % step['stack'])
+    _trace_logger.debug('Ending Cnode: %s' % step['cnode'])
+    _trace_logger.debug('-------> %s\n' % step['next_state'])
+
+def leaves_parent(astoid,parent_cnode):
+    """
+    True if the astoid is not inside the body of parent_cnode, i.e. it does not start to the right of the parent's header
+    Comparing against the parent rather than the previous sibling keeps definitions nested in if/for/with bodies inside their enclosing definition
+    """
+    if astoid.col_offset is None or parent_cnode is None or parent_cnode.indentation is None or parent_cnode.indentation is ...:
+        return False
+    return astoid.col_offset <= len(parent_cnode.indentation)
+
+def build_module(path,source,astoid_tree,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None,lazy=False):
+    """
+    Runs the cnode state machine over an already parsed astoid tree of source and returns the CnodeModule
+    With lazy=True the definitions are left unbuilt, to be built by Cnode.load when their children are first used
+    """
+    if astoid_tree is None:
+        #empty module (e.g. an empty __init__.py) has no astoids to drive the state machine
+        module_cnode = CnodeModule(path,parent_cnode,prev_sibling_cnode,predecessor_cnode)
+        module_cnode.line_index = None
+        module_cnode.indentation = None
+        module_cnode.source_lines = source if isinstance(source,SourceBuffer) else SourceBuffer(source)
+        return module_cnode
+    return build_cnodes(path,lazy_walk([astoid_tree]) if lazy else astoid_tree.walk(),parent_cnode,prev_sibling_cnode,predecessor_cnode,None,lazy)
+
+def build_cnodes(path,astoid_tree_walk,parent_cnode,prev_sibling_cnode,predecessor_cnode,module_cnode,lazy):
+    """
+    Runs the cnode state machine over the astoids yielded by astoid_tree_walk, creating cnodes below parent_cnode
+    Returns the CnodeModule created for a module astoid, or module_cnode, which the cnodes created are part of
+    """
     stack = []
     cnode = None
-    module_cnode = None
-
-    astoid_tree_walk = astoid_tree.walk()
 
     state = ParseState.NEWBLOCK
     astoid = None
     get_next = True
+    trace = trace_callback
     while state != ParseState.DONE:
         if get_next:
             try:
                 astoid = next(astoid_tree_walk)
             except StopIteration:
-                logger.debug('Walk stop iteration')
                 state = ParseState.DONE
                 astoid = None
         get_next = True #default for next iteration will be to get next unless explicitly told otherwise below in this iteration
-        logger.debug('Astoid: %s' % astoid)
-        logger.debug('State: %s' % state)
-        logger.debug('Starting Cnode: %s' % cnode)
-        logger.debug('Parent: %s' % parent_cnode)
-        logger.debug('Prev sibling: %s' % prev_sibling_cnode)
-        logger.debug('Predecessor: %s' % predecessor_cnode)
-        logger.debug('Stack: %s' % stack)
+        if trace is not None:
+            step = {'astoid':astoid,'state':state,'starting_cnode':cnode,'parent':parent_cnode,'prev_sibling':prev_sibling_cnode,'predecessor':predecessor_cnode,'stack':list(stack)}
         if state == ParseState.NEWBLOCK:
-            if astoid.line_index is not None:
-                first_line = astoid.source_lines[astoid.line_index]
-                indentation = wspace_re.search(first_line).group(0)
-            else:
-                indentation = None
-            logger.debug('Indentation: %s' % repr(indentation))
-            if indentation is not None and prev_sibling_cnode is not None and prev_sibling_cnode.indentation is not None and prev_sibling_cnode.indentation != indentation and prev_sibling_cnode.indentation.startswith(indentation):
+            if leaves_parent(astoid,parent_cnode):
                 next_state = ParseState.ENDBLOCK
             else:
                 ast_type,clause = astoid.type
@@ -76,14 +134,10 @@ def parse_module(path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnod
                     else:
                         cnode = cnode_class(parent_cnode,prev_sibling_cnode,predecessor_cnode,module_cnode)
                         next_state = cnode.add_astoid(astoid,state)
+                        if lazy:
+                            defer_children(cnode)
         elif state == ParseState.BUILD:
-            if astoid.line_index is not None:
-                first_line = astoid.source_lines[astoid.line_index]
-                indentation = wspace_re.search(first_line).group(0)
-            else:
-                indentation = None
-            logger.debug('Indentation: %s' % repr(indentation))
-            if indentation is not None and prev_sibling_cnode is not None and prev_sibling_cnode.indentation is not None and prev_sibling_cnode.indentation != indentation and prev_sibling_cnode.indentation.startswith(indentation):
+            if leaves_parent(astoid,parent_cnode):
                 next_state = ParseState.ENDBLOCK
             else:
                 ast_type,clause = astoid.type
@@ -94,15 +148,21 @@ def parse_module(path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnod
                     prev_sibling_cnode = cnode
                     cnode = cnode_class(parent_cnode,prev_sibling_cnode,predecessor_cnode,module_cnode)
                     next_state = cnode.add_astoid(astoid,state)
+                    if lazy:
+                        defer_children(cnode)
         elif state == ParseState.DONE:
             next_state = ParseState.DONE
         else:
             raise Exception('Invalid state: %s' % repr(state))
 
-        logger.debug('Ending Cnode: %s' % cnode)
-        logger.debug('-------> %s\n' % (next_state))
+        if trace is not None:
+            step['cnode'] = cnode
+            step['next_state'] = next_state
+            trace(step)
 
-        predecessor_cnode = cnode
+        if cnode is not None:
+            #cnode is None while popping out of several blocks at once - keep the last cnode created as the predecessor
+            predecessor_cnode = cnode
         if next_state == ParseState.NEWBLOCK:
             stack.append(cnode)
             parent_cnode = cnode
@@ -127,7 +187,87 @@ def parse_module(path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnod
         state = next_state
     return module_cnode
 
+def lazy_walk(astoids):
+    #astoid walk that does not enter the astoids of definitions left unbuilt
+    stack = list(reversed(astoids))
+    while len(stack) > 0:
+        astoid = stack.pop()
+        yield astoid
+        if astoid.cnode is None or astoid.cnode._loader is None:
+            stack.extend(reversed(astoid.children))
+
+lazy_attributes = frozenset(['children','astoids','source_lines','line_index','indentation'])
+
+def defer_children(def_cnode):
+    """
+    Leaves the children of a CnodeDef unbuilt; until Cnode.load builds them its successor is the cnode following its body
+    """
+    del def_cnode.children
+    def_cnode._loader = load_def
+
+def load_def(def_cnode):
+    following = def_cnode.successor
+    def_cnode.children = []
+    def_cnode.successor = None
+    build_cnodes(def_cnode.module.path,lazy_walk(def_cnode.astoids[0].children),def_cnode,None,def_cnode,def_cnode.module,True)
+    relink_successor(def_cnode,following)
+
+def lazy_module(path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None,mapped=False):
+    """
+    Module loader for CnodePackage that creates an unbuilt CnodeModule: the file is only parsed when the children, astoids,
+    lines or line index of the module are first used, and its definitions are then built lazily as well
+    """
+    module_cnode = CnodeModule(path,parent_cnode,prev_sibling_cnode,predecessor_cnode)
+    for name in ['children','astoids','line_index','indentation']:
+        delattr(module_cnode,name)
+    module_cnode._loader = partial(load_module,mapped=mapped)
+    return module_cnode
+
+def load_module(module_cnode,mapped=False):
+    built = parse_module(module_cnode.path,mapped=mapped,lazy=True)
+    following = module_cnode.successor
+    module_cnode.astoids = built.astoids
+    module_cnode.children = built.children
+    module_cnode.line_index = built.line_index
+    module_cnode.indentation = built.indentation
+    module_cnode.source_lines = built.source_lines
+    for astoid in built.astoids:
+        astoid.cnode = module_cnode
+    for child in built.children:
+        child.parent = module_cnode
+        for cnode in built_subtree(child):
+            cnode.module = module_cnode
+    module_cnode.successor = built.successor
+    if built.successor is not None:
+        built.successor.predecessor = module_cnode
+    relink_successor(module_cnode,following)
+
+def built_subtree(cnode):
+    #like Cnode.subtree() but without building lazy cnodes
+    stack = [cnode]
+    while len(stack) > 0:
+        cnode = stack.pop()
+        yield cnode
+        if cnode._loader is None:
+            stack.extend(reversed(cnode.children))
+
+def linked_final(cnode):
+    """
+    Returns the last descendant of cnode that is built, i.e. the cnode whose successor follows the subtree of cnode
+    """
+    while cnode._loader is None and len(cnode.children) > 0:
+        cnode = cnode.children[-1]
+    return cnode
+
+def relink_successor(cnode,following):
+    #after building the children of cnode, the cnode following it comes after its new last descendant
+    final = linked_final(cnode)
+    final.successor = following
+    if following is not None:
+        following.predecessor = final
+
 class Cnode():
+    _loader = None #set on lazy cnodes whose children are not built yet, see load()
     def __init__(self,parent,prev_sibling=None,predecessor=None,module=None):
         self.parent = parent
         if parent is not None:
@@ -151,6 +291,25 @@ class Cnode():
         self.predecessor = predecessor
         self.successor = None #may be overwritten by successor
         self.module=module
+    def __getattr__(self,name):
+        #only reached for attributes the instance does not have, such as the children of a lazy cnode that is not built yet
+        if name in lazy_attributes and self.__dict__.get('_loader') is not None:
+            self.load()
+            return getattr(self,name)
+        raise AttributeError('%s object has no attribute %s' % (type(self).__name__,repr(name)))
+    def load(self):
+        """
+        Builds a lazy cnode: parses the file of a module loaded with cnode_load(lazy=True) or builds the children of a definition
+        This happens by itself when the children, astoids or lines of the cnode are used, so it is only needed to build ahead of time
+        """
+        loader = self.__dict__.get('_loader')
+        if loader is not None:
+            self._loader = None
+            try:
+                loader(self)
+            except:
+                self._loader = loader
+                raise
     def init(self,first_astoid,next_parse_state):
         #run immediately after the first astoid is added
         first_astoid = self.astoids[0]
@@ -189,17 +348,46 @@ class Cnode():
         target = self
         while target is not None:
             yield target
+            if target._loader is not None:
+                #the successor of a lazy cnode skips its contents until it is built
+                target.load()
             target = target.successor
+    def subtree(self):
+        #only self and its descendants, unlike walk() which continues through the successors of self
+        stack = [self]
+        while len(stack) > 0:
+            cnode = stack.pop()
+            yield cnode
+            stack.extend(reversed(cnode.children))
     def get_lines(self):
+        """
+        Returns the source lines of the cnode as a list
+        """
+        return list(self.get_line_span())
+    def get_line_span(self):
+        """
+        Returns the source lines of the cnode as a source_buffer.LineSpan, a view that copies nothing until its lines are read
+        """
+        self.load()
         if self.successor is not None:
             return self.source_lines[self.line_index:self.successor.line_index]
         else:
             return self.source_lines[self.line_index:]
+    def get_span(self):
+        """
+        Returns the (start,end) character offsets of get_lines() within the module source text
+        """
+        return self.get_line_span().span()
+    def get_text(self):
+        """
+        Returns the source text of get_lines() as a single slice of the module source text
+        """
+        return self.get_line_span().get_text()
 
 
 
 class CnodePackage(Cnode):
-    def __init__(self,path,parent=None,prev_sibling=None,predecessor=None):
+    def __init__(self,path,parent=None,prev_sibling=None,predecessor=None,module_loader=parse_module):
         if not os.path.isdir(path) or not os.path.exists(os.path.join(path,'__init__.py')):
             raise Exception('Path is not a valid package path: %s' % path)
         self.path = path
@@ -207,18 +395,13 @@ class CnodePackage(Cnode):
 
         child_prev_sibling = None
         child_predecessor = self
-        for item_name in sorted(os.listdir(path)):
-            item_path = os.path.join(path,item_name)
+        for item_path in package_items(path):
             if os.path.isdir(item_path):
-                if os.path.exists(os.path.join(item_path,'__init__.py')):
-                    child = CnodePackage(item_path,self,child_prev_sibling,child_predecessor)
-                    child_prev_sibling = child
-                    child_predecessor = child.final()
+                child = CnodePackage(item_path,self,child_prev_sibling,child_predecessor,module_loader)
             else:
-                if os.path.splitext(filename)[1].lower() in ['.py','.pyw']:
-                    child = parse(os.path.join(path,filename),self,child_prev_sibling,child_predecessor)
-                    child_prev_sibling = child
-                    child_predecessor = child.final()
+                child = module_loader(item_path,self,child_prev_sibling,child_predecessor)
+            child_prev_sibling = child
+            child_predecessor = linked_final(child)
         self.indentation = None
         self.line_index = None
         self.astoids = None
@@ -233,6 +416,7 @@ class CnodePackage(Cnode):
 
 
 class CnodeModule(Cnode):
+    _shifts = None #LineShifts of the module ast once update() has edited it, as it is otherwise shared through the parse cache
     def __init__(self,path,parent=None,prev_sibling=None,predecessor=None):
         if os.path.isdir(path) or os.path.splitext(path)[1].lower() not in ['.py','.pyw']:
             raise Exception('Path is not a valid module path: %s' % path)
@@ -248,6 +432,221 @@ class CnodeModule(Cnode):
     def __str__(self):
         return 'CnodeModule(%s)' % repr(os.path.basename(self.path))
 
+    def update(self,new_source):
+        """
+        Brings the tree up to date with new_source by reparsing only the top-level children spanned by the changed lines
+        Untouched children are kept (shifted to their new line numbers) and the reparsed ones are spliced into
+        the parent/sibling/successor links of both the cnode and astoid trees
+        The ast of the statements after the edit is only shifted when it is next used (see astoid.LineShifts)
+        Returns (removed_children,added_children); raises SyntaxError and leaves the tree unchanged if new_source is invalid
+        """
+        old_lines = self.source_lines
+        new_lines = SourceBuffer(new_source)
+        children = self.children
+        starts = [0]+[child.line_index for child in children[1:]]
+        incremental = len(children) > 0 and len(self.astoids) > 0 and isinstance(self.astoids[0],Astoid)
+        #the block of an else or except clause takes the line of its if/for/try, so children holding definitions
+        #of such a clause are out of line order and cannot be bisected
+        incremental = incremental and all(starts[index] <= starts[index+1] for index in range(len(starts)-1))
+        if incremental:
+            #the changed lines lie between the common prefix and common suffix of the old and new lines
+            prefix,suffix = _common_lines(old_lines,new_lines)
+            if prefix == len(old_lines) == len(new_lines):
+                return [],[]
+            i1,i2 = prefix,len(old_lines)-suffix
+            first = bisect_right(starts,i1)-1
+            if i1 == i2:
+                #pure insertion at the boundary of a child may belong to either side
+                last = first
+                if i1 == starts[first] and first > 0:
+                    first -= 1
+            else:
+                last = bisect_right(starts,i2-1)-1
+            #decorator lines belong to the line range of the child before the decorated definition
+            while first > 0 and _is_decorated(children[first]):
+                first -= 1
+            while last+1 < len(children) and _is_decorated(children[last+1]):
+                last += 1
+            #the range must start and end at top-level statements, which the children of else/except clauses
+            #(e.g. a def in the else of a top-level try) do not, and neighbouring blocks may have to merge with
+            #the reparsed region into one block
+            if self._shifts is not None and self._shifts.root is self.astoids[0]:
+                shifts = self._shifts
+                statement_starts = set(_statement_start(statement)+shifts.offset(statement) for statement in shifts.module.body)
+            else:
+                statement_starts = set(_statement_start(statement) for statement in self.astoids[0].ast_node.body)
+            widened = True
+            while widened:
+                widened = False
+                if first > 0 and (starts[first] not in statement_starts or isinstance(children[first-1],CnodeBlock)):
+                    first -= 1
+                    widened = True
+                if last+1 < len(children) and (starts[last+1] not in statement_starts or isinstance(children[last+1],CnodeBlock)):
+                    last += 1
+                    widened = True
+            try:
+                return self._splice(first,last,new_lines)
+            except SyntaxError:
+                #the edit may reach beyond the affected range (e.g. a new decorator of the next definition) - fall back to the whole module
+                pass
+        return self._splice(0,len(children)-1,new_lines)
+
+    def _splice(self,first,last,new_lines):
+        old_lines = self.source_lines
+        children = self.children
+        region_start = 0 if first == 0 else children[first].line_index
+        region_end = children[last+1].line_index if last+1 < len(children) else len(old_lines)
+        delta = len(new_lines)-len(old_lines)
+        tree = ast.parse(new_lines.get_text(region_start,region_end+delta))
+        ast.increment_lineno(tree,region_start)
+        snippet_root = astoid_parse(new_lines,tree)
+        snippet_module = build_module(self.path,new_lines,snippet_root)
+        new_children = list(snippet_module.children)
+
+        new_astoids = [] if snippet_root is None else list(snippet_root.children)
+        for astoid in new_astoids:
+            for descendant in astoid.walk():
+                descendant.source_lines = self.source_lines
+        if isinstance(self.astoids[0] if len(self.astoids) > 0 else None,Astoid):
+            #astoid tree
+            root_astoid = self.astoids[0]
+            root_children = root_astoid.children
+            a = 0
+            while a < len(root_children) and root_children[a].line_index < region_start:
+                a += 1
+            b = a
+            while b < len(root_children) and root_children[b].line_index < region_end:
+                b += 1
+            if self._shifts is None or self._shifts.root is not root_astoid:
+                #the module ast is edited below, but it is shared with every other user of the parse cache - edit a shallow
+                #copy instead, whose statements are copied one at a time when they have to be shifted
+                shared = root_astoid.ast_node
+                self._shifts = LineShifts(root_astoid,ast.Module(body=list(shared.body),type_ignores=shared.type_ignores))
+            shifts = self._shifts
+            module_body = shifts.module.body
+            c = 0
+            while c < len(module_body) and module_body[c].lineno-1+shifts.offset(module_body[c]) < region_start:
+                c += 1
+            d = c
+            while d < len(module_body) and module_body[d].lineno-1+shifts.offset(module_body[d]) < region_end:
+                d += 1
+            #shift everything after the reparsed region; the ast of the statements there is only shifted once it is used
+            if delta != 0:
+                statement_astoids = [[] for statement in module_body[d:]]
+                owner = 0
+                for astoid in root_children[b:]:
+                    #the top-level astoid of an elif clause belongs to the if statement before it
+                    while owner+1 < len(statement_astoids) and module_body[d+owner+1].lineno-1+shifts.offset(module_body[d+owner+1]) <= astoid.line_index:
+                        owner += 1
+                    for descendant in astoid.walk():
+                        descendant.line_index += delta
+                        statement_astoids[owner].append(descendant)
+                for statement,astoids in zip(module_body[d:],statement_astoids):
+                    shifts.add(statement,delta,astoids)
+                for child in children[last+1:]:
+                    for cnode in built_subtree(child):
+                        cnode.line_index += delta
+            shifts.replace(module_body[c:d],tree.body)
+            module_body[c:d] = tree.body
+            for astoid in new_astoids:
+                astoid.parent = root_astoid
+                astoid.homeroom = root_children
+            root_children[a:b] = new_astoids
+            for index in range(max(a-1,0),min(a+len(new_astoids)+1,len(root_children))):
+                root_children[index].prev_sibling = root_children[index-1] if index > 0 else None
+                root_children[index].next_sibling = root_children[index+1] if index+1 < len(root_children) else None
+            before = _last_astoid(root_children[a-1]) if a > 0 else root_astoid
+            after = root_children[a+len(new_astoids)] if a+len(new_astoids) < len(root_children) else None
+            if len(new_astoids) > 0:
+                before.successor = new_astoids[0]
+                new_astoids[0].predecessor = before
+                before = _last_astoid(new_astoids[-1])
+            before.successor = after
+            if after is not None:
+                after.predecessor = before
+            if len(root_children) == 0:
+                #no statements are left, as in a freshly parsed empty module
+                self.astoids = []
+        else:
+            #module was empty or is backed by an AstoidTable - adopt the freshly parsed root
+            self.astoids = [] if snippet_root is None else [snippet_root]
+            self._shifts = None
+            if snippet_root is not None:
+                self._shifts = LineShifts(snippet_root,tree,tree.body)
+                snippet_root.cnode = self
+                snippet_root.source_lines = self.source_lines
+        self.source_lines.reset(new_lines)
+
+        #cnode tree
+        for child in new_children:
+            child.parent = self
+            for cnode in child.subtree():
+                cnode.module = self
+                cnode.source_lines = self.source_lines
+        left = children[first-1] if first > 0 else None
+        right = children[last+1] if last+1 < len(children) else None
+        #within a package the last descendant of the module is followed by the next module
+        following = right if right is not None else linked_final(self).successor
+        removed_children = children[first:last+1]
+        children[first:last+1] = new_children
+        prev_sibling = left
+        for child in new_children:
+            child.prev_sibling = prev_sibling
+            if prev_sibling is not None:
+                prev_sibling.next_sibling = child
+            prev_sibling = child
+        if prev_sibling is not None:
+            prev_sibling.next_sibling = right
+        if right is not None:
+            right.prev_sibling = prev_sibling
+        predecessor = linked_final(left) if left is not None else self
+        for child in new_children:
+            child.predecessor = predecessor
+            predecessor.successor = child
+            predecessor = linked_final(child)
+        predecessor.successor = following
+        if following is not None:
+            following.predecessor = predecessor
+        return removed_children,new_children
+
+def _common_lines(old_lines,new_lines):
+    """
+    Returns the number of lines (prefix,suffix) at the start and at the end that two SourceBuffers have in common, not overlapping
+    Both are found by bisecting on comparisons of whole runs of text, which is far faster than comparing line by line
+    """
+    if old_lines.path is not None:
+        #offsets of a mapped buffer count bytes
+        old_lines = SourceBuffer(old_lines.get_text())
+    old_text,old_offsets,old_count = old_lines.text,old_lines.offsets,len(old_lines)
+    new_text,new_offsets,new_count = new_lines.text,new_lines.offsets,len(new_lines)
+    low,high = 0,min(old_count,new_count)
+    while low < high:
+        middle = (low+high+1)//2
+        if old_offsets[middle] == new_offsets[middle] and old_text[:old_offsets[middle]] == new_text[:new_offsets[middle]]:
+            low = middle
+        else:
+            high = middle-1
+    prefix = low
+    low,high = 0,min(old_count,new_count)-prefix
+    while low < high:
+        middle = (low+high+1)//2
+        if old_text[old_offsets[old_count-middle]:] == new_text[new_offsets[new_count-middle]:]:
+            low = middle
+        else:
+            high = middle-1
+    return prefix,low
+
+def _statement_start(statement):
+    #line index of the first line of a statement, which for decorated definitions is the first decorator
+    return min([statement.lineno]+[decorator.lineno for decorator in getattr(statement,'decorator_list',[])])-1
+
+def _is_decorated(cnode):
+    return isinstance(cnode,CnodeDef) and len(cnode.astoids) > 0 and len(getattr(cnode.astoids[0].ast_node,'decorator_list',[])) > 0
+def _last_astoid(astoid):
+    while len(astoid.children) > 0:
+        astoid = astoid.children[-1]
+    return astoid
+
 class CnodeDef(Cnode):
     def process_astoid(self,astoid,parse_state):
         self.astoids.append(astoid)
@@ -272,7 +671,107 @@ class CnodeBlock(Cnode):
     def __str__(self):
         return 'CnodeBlock(%s,%d)' % (os.path.basename(self.module.path),self.line_index)
 
-def cnode_import(name):
+def package_items(path):
+    """
+    Yields the paths of the subpackages and python modules directly within a package folder, in sorted order
+    """
+    for item_name in sorted(os.listdir(path)):
+        item_path = os.path.join(path,item_name)
+        if os.path.isdir(item_path):
+            if os.path.exists(os.path.join(item_path,'__init__.py')):
+                yield item_path
+        elif os.path.splitext(item_name)[1].lower() in ['.py','.pyw']:
+            yield item_path
+def package_module_paths(path):
+    """
+    Returns the paths of all python modules within a package folder and its subpackages, in the order CnodePackage visits them
+    """
+    module_paths = []
+    for item_path in package_items(path):
+        if os.path.isdir(item_path):
+            module_paths.extend(package_module_paths(item_path))
+        else:
+            module_paths.append(item_path)
+    return module_paths
+
+def compact_module(path,mapped=False):
+    """
+    Parses a module and flattens its cnode tree into a picklable form: (path,source_lines,astoid_table,rows)
+    source_lines is the SourceBuffer of the module, which the astoid_table shares so it is pickled once
+    astoid_table is an AstoidTable of the module's astoids, or None for a module without statements
+    Each row describes one cnode in creation order as (class name,parent row,prev sibling row,predecessor row,astoid table indices)
+    Links that point outside of the module are stored as None
+    """
+    module_cnode = parse_module(path,mapped=mapped)
+    if len(module_cnode.astoids) == 0:
+        #comments and blank lines only - the text is still part of the module
+        return (path,module_cnode.source_lines,None,[('CnodeModule',None,None,None,())])
+    astoid_table = AstoidTable.from_astoid(module_cnode.astoids[0])
+    astoid_rows = {id(astoid):index for index,astoid in enumerate(module_cnode.astoids[0].walk())}
+    cnodes = []
+    stack = [module_cnode]
+    while len(stack) > 0:
+        cnode = stack.pop()
+        cnodes.append(cnode)
+        stack.extend(reversed(cnode.children))
+    cnode_rows = {id(cnode):index for index,cnode in enumerate(cnodes)}
+    rows = []
+    for cnode in cnodes:
+        rows.append((
+            cnode.__class__.__name__,
+            cnode_rows.get(id(cnode.parent)),
+            cnode_rows.get(id(cnode.prev_sibling)),
+            cnode_rows.get(id(cnode.predecessor)),
+            tuple(astoid_rows[id(astoid)] for astoid in cnode.astoids),
+            ))
+    return (path,module_cnode.source_lines,astoid_table,rows)
+
+def expand_module(compact,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None):
+    """
+    Rebuilds a CnodeModule from the output of compact_module, linking it into the given parent, sibling and predecessor
+    The rebuilt cnodes hold AstoidView objects onto the shipped AstoidTable
+    """
+    path,source_lines,astoid_table,rows = compact
+    cnodes = []
+    module_cnode = None
+    for class_name,parent_row,prev_sibling_row,predecessor_row,astoid_indices in rows:
+        cnode_class = cnode_classes[class_name]
+        if cnode_class is CnodeModule:
+            cnode = CnodeModule(path,parent_cnode,prev_sibling_cnode,predecessor_cnode)
+            module_cnode = cnode
+        else:
+            cnode = cnode_class(
+                    cnodes[parent_row] if parent_row is not None else None,
+                    cnodes[prev_sibling_row] if prev_sibling_row is not None else None,
+                    cnodes[predecessor_row] if predecessor_row is not None else None,
+                    module_cnode)
+        for astoid_index in astoid_indices:
+            astoid = astoid_table.view(astoid_index)
+            astoid.cnode = cnode
+            cnode.astoids.append(astoid)
+        if len(cnode.astoids) > 0:
+            cnode.init(cnode.astoids[0],None)
+        else:
+            cnode.line_index = None
+            cnode.indentation = None
+            cnode.source_lines = source_lines
+        cnodes.append(cnode)
+    return module_cnode
+
+class ParallelModuleLoader():
+    """
+    Module loader for CnodePackage that parses every module of a package in a process pool up front
+    and stitches each compact result into the tree in the main process as CnodePackage reaches it in sorted order
+    """
+    def __init__(self,path,workers=None,mapped=False):
+        module_paths = package_module_paths(path)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1,len(module_paths)//(4*(workers or os.cpu_count() or 1)))
+            self.compacts = dict(zip(module_paths,executor.map(partial(compact_module,mapped=mapped),module_paths,chunksize=chunksize)))
+    def __call__(self,path,parent_cnode=None,prev_sibling_cnode=None,predecessor_cnode=None):
+        return expand_module(self.compacts.pop(path),parent_cnode,prev_sibling_cnode,predecessor_cnode)
+
+def cnode_import(name,workers=None,mapped=False,lazy=False):
     spec = find_spec(name)
     if spec is not None:
         path = spec.origin
@@ -282,18 +781,31 @@ def cnode_import(name):
         else:
             #module
             pass
-        return cnode_load(path)
+        return cnode_load(path,workers,mapped,lazy)
 
     else:
         raise Exception('Not an importable name: %s' % name)
 
-def cnode_load(path):
+def cnode_load(path,workers=None,mapped=False,lazy=False):
+    """
+    Loads the cnode tree of a package folder or a module file
+    For packages, workers > 0 parses the modules in a process pool with that many processes
+    mapped=True memory maps each module instead of reading it (see parse_module)
+    lazy=True only lists the modules of packages and parses each one when it is first used, building the children
+    of definitions only when those are first used in turn (see Cnode.load); workers is ignored then
+    """
     if os.path.isdir(path):
         #package
+        if lazy:
+            return CnodePackage(path,module_loader=partial(lazy_module,mapped=mapped))
+        if workers:
+            return CnodePackage(path,module_loader=ParallelModuleLoader(path,workers,mapped))
+        if mapped:
+            return CnodePackage(path,module_loader=partial(parse_module,mapped=True))
         return CnodePackage(path)
     else:
         #module
-        return parse_module(path)
+        return parse_module(path,mapped=mapped,lazy=lazy)
 
 ast_type_map = {
         ast.Module:CnodeModule,
@@ -301,10 +813,12 @@ ast_type_map = {
         ast.FunctionDef:CnodeFunction,
         ast.AsyncFunctionDef:CnodeAsyncFunction,
         }
+cnode_classes = {cnode_class.__name__:cnode_class for cnode_class in [CnodePackage,CnodeModule,CnodeBlock,CnodeClass,CnodeFunction,CnodeAsyncFunction]}
 if __name__ == '__main__':
     os.environ['PYTHONINSPECT'] = '1'
     def _eh(exc_type,exc_value,exc_tb):
         traceback.print_exception(exc_type,exc_value,exc_tb)
         pdb.post_mortem(exc_tb)
     sys.excepthook = _eh
+    set_trace()
     ctree = cnode_import('simpler_test')
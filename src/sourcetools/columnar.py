@@ -0,0 +1,215 @@
+""" columnar flattens astoid and cnode trees into numpy column arrays, so that statistics over many files become vectorized operations
+Rows are in walk order, which makes every subtree a contiguous run of rows, and each row can be turned back into its astoid or cnode
+This module needs numpy, which the rest of sourcetools does not
+"""
+from cnode import CnodePackage, CnodeModule, CnodeBlock, CnodeClass, CnodeFunction, CnodeAsyncFunction
+from symbol_index import line_range
+import numpy as np
+import ast, sys
+
+#type codes index into these lists; ast types are sorted by name so that codes only change with the python version
+AST_TYPES = sorted((value for value in vars(ast).values() if isinstance(value,type) and issubclass(value,ast.AST)),key=lambda ast_type: ast_type.__name__)
+AST_TYPE_CODES = {ast_type:code for code,ast_type in enumerate(AST_TYPES)}
+CNODE_TYPES = [CnodePackage,CnodeModule,CnodeBlock,CnodeClass,CnodeFunction,CnodeAsyncFunction]
+CNODE_TYPE_CODES = {cnode_type:code for code,cnode_type in enumerate(CNODE_TYPES)}
+
+def module_cnodes(root):
+    #the modules of a package, or the module itself
+    if isinstance(root,CnodeModule):
+        return [root]
+    return [cnode for cnode in root.subtree() if isinstance(cnode,CnodeModule)]
+
+def astoid_key(astoid):
+    #AstoidViews are created on access, so they are identified by their table row
+    if hasattr(astoid,'table'):
+        return (id(astoid.table),astoid.index)
+    return id(astoid)
+
+def subtree_ends(parent):
+    """
+    Returns, for rows in walk order with the given parent rows, the row one past the last row of each subtree
+    """
+    count = len(parent)
+    end = np.full(count,count,dtype=np.int32)
+    stack = []
+    for row,parent_row in enumerate(parent.tolist()):
+        while len(stack) > 0 and stack[-1] != parent_row:
+            end[stack.pop()] = row
+        stack.append(row)
+    return end
+
+def depths(parent):
+    """
+    Returns the number of ancestors of every row, one vectorized step per level of nesting
+    """
+    depth = np.zeros(len(parent),dtype=np.int32)
+    ancestor = parent.copy()
+    while True:
+        has_ancestor = ancestor >= 0
+        if not has_ancestor.any():
+            return depth
+        depth += has_ancestor
+        ancestor = np.where(has_ancestor,parent[np.maximum(ancestor,0)],-1)
+
+def spans(line_index,end,module,module_lines):
+    """
+    Returns the number of lines from each row up to the next row outside of its subtree in the same module, or to the end of the module
+    Rows without a line index start at the top of the module
+    """
+    start = np.maximum(line_index,0)
+    following = np.minimum(end,len(end)-1)
+    inside = (end < len(end)) & (module[following] == module) & (line_index[following] >= 0)
+    stop = np.where(inside,line_index[following],module_lines[module])
+    return (stop-start).astype(np.int32)
+
+class AstoidColumns():
+    """
+    The astoids of one or more modules as numpy columns, one row per astoid in walk() order
+    type_code indexes AST_TYPES and clause_code is the value of the CodeClause, or 0 for none
+    parent is the row of the parent (-1 for module astoids), depth counts the ancestors, end is the row one past the subtree
+    line_index and col_offset are -1 where the astoid has none, span counts the lines up to the next astoid outside of the subtree
+    module indexes modules, the CnodeModules (or root astoids) the rows come from
+    """
+    def __init__(self,roots):
+        self.modules = list(roots)
+        self.astoids = []
+        type_code = []
+        clause_code = []
+        parent = []
+        line_index = []
+        col_offset = []
+        module = []
+        module_lines = []
+        for module_number,root in enumerate(self.modules):
+            if isinstance(root,CnodeModule) and len(root.astoids) == 0:
+                #empty module
+                module_lines.append(len(root.source_lines))
+                continue
+            root_astoid = root.astoids[0] if isinstance(root,CnodeModule) else root
+            module_lines.append(len(root_astoid.source_lines))
+            first_row = len(self.astoids)
+            rows = {}
+            for astoid in root_astoid.walk():
+                rows[astoid_key(astoid)] = len(self.astoids)
+                self.astoids.append(astoid)
+                type_code.append(AST_TYPE_CODES.get(type(astoid.ast_node),-1))
+                clause_code.append(0 if astoid.clause is None else astoid.clause.value)
+                astoid_parent = astoid.parent
+                parent.append(-1 if astoid_parent is None else rows[astoid_key(astoid_parent)])
+                line_index.append(-1 if astoid.line_index is None else astoid.line_index)
+                col_offset.append(-1 if astoid.col_offset is None else astoid.col_offset)
+            module.extend([module_number]*(len(self.astoids)-first_row))
+        self.type_code = np.array(type_code,dtype=np.int16)
+        self.clause_code = np.array(clause_code,dtype=np.int8)
+        self.parent = np.array(parent,dtype=np.int32)
+        self.line_index = np.array(line_index,dtype=np.int32)
+        self.col_offset = np.array(col_offset,dtype=np.int32)
+        self.module = np.array(module,dtype=np.int32)
+        self.module_lines = np.array(module_lines,dtype=np.int32)
+        self.depth = depths(self.parent)
+        self.end = subtree_ends(self.parent)
+        self.span = spans(self.line_index,self.end,self.module,self.module_lines)
+    @classmethod
+    def from_cnode(cls,root_cnode):
+        """
+        Columns of every module of a CnodePackage, or of one CnodeModule
+        """
+        return cls(module_cnodes(root_cnode))
+
+    def __len__(self):
+        return len(self.astoids)
+    def astoid(self,row):
+        return self.astoids[row]
+    def columns(self):
+        """
+        Returns the columns as a dictionary of equally long arrays, e.g. for pandas.DataFrame
+        """
+        return {name:getattr(self,name) for name in ['type_code','clause_code','parent','depth','end','line_index','col_offset','span','module']}
+    def rows(self,ast_type,clause=...):
+        """
+        Returns the rows of the astoids of an ast type (e.g. ast.If), optionally only those of one CodeClause (None for no clause)
+        """
+        mask = self.type_code == AST_TYPE_CODES[ast_type]
+        if clause is not ...:
+            mask &= self.clause_code == (0 if clause is None else clause.value)
+        return np.flatnonzero(mask)
+    def type_counts(self):
+        """
+        Returns a dictionary from ast type names to the number of astoids of that type
+        """
+        counts = np.bincount(self.type_code[self.type_code >= 0],minlength=len(AST_TYPES))
+        return {AST_TYPES[code].__name__:int(count) for code,count in enumerate(counts) if count > 0}
+
+class CnodeColumns():
+    """
+    The cnodes of a tree as numpy columns, one row per cnode in subtree() order
+    type_code indexes CNODE_TYPES, parent is the row of the parent (-1 for the root), depth counts the ancestors,
+    end is the row one past the subtree, line_index is -1 for packages and empty modules, span counts the lines of the cnode
+    including its decorators and body (as symbol_index.line_range), astoid_row is the row of its first astoid in astoid_columns
+    (-1 if it has none) and module is the row of its module (-1 for packages)
+    """
+    def __init__(self,root_cnode,astoid_columns=None):
+        self.cnodes = list(root_cnode.subtree())
+        self.astoid_columns = astoid_columns
+        rows = {id(cnode):row for row,cnode in enumerate(self.cnodes)}
+        astoid_rows = {}
+        if astoid_columns is not None:
+            astoid_rows = {astoid_key(astoid):row for row,astoid in enumerate(astoid_columns.astoids)}
+        type_code = []
+        parent = []
+        line_index = []
+        span = []
+        astoid_row = []
+        module = []
+        for row,cnode in enumerate(self.cnodes):
+            type_code.append(CNODE_TYPE_CODES[type(cnode)])
+            parent.append(rows.get(id(cnode.parent),-1))
+            if isinstance(cnode,CnodePackage):
+                line_index.append(-1)
+                span.append(0)
+                astoid_row.append(-1)
+                module.append(-1)
+                continue
+            line_index.append(-1 if cnode.line_index is None else cnode.line_index)
+            start,end = line_range(cnode)
+            span.append(end-start)
+            astoid_row.append(astoid_rows.get(astoid_key(cnode.astoids[0]),-1) if len(cnode.astoids) > 0 else -1)
+            module.append(row if isinstance(cnode,CnodeModule) else rows.get(id(cnode.module),-1))
+        self.type_code = np.array(type_code,dtype=np.int8)
+        self.parent = np.array(parent,dtype=np.int32)
+        self.line_index = np.array(line_index,dtype=np.int32)
+        self.span = np.array(span,dtype=np.int32)
+        self.astoid_row = np.array(astoid_row,dtype=np.int32)
+        self.module = np.array(module,dtype=np.int32)
+        self.depth = depths(self.parent)
+        self.end = subtree_ends(self.parent)
+
+    def __len__(self):
+        return len(self.cnodes)
+    def cnode(self,row):
+        return self.cnodes[row]
+    def columns(self):
+        return {name:getattr(self,name) for name in ['type_code','parent','depth','end','line_index','span','astoid_row','module']}
+    def rows(self,*cnode_types):
+        """
+        Returns the rows of the cnodes of the given classes (subclasses included, so CnodeDef selects every definition)
+        """
+        codes = [code for code,cnode_type in enumerate(CNODE_TYPES) if issubclass(cnode_type,cnode_types)]
+        return np.flatnonzero(np.isin(self.type_code,codes))
+
+def export(root_cnode):
+    """
+    Returns the (CnodeColumns,AstoidColumns) of a CnodePackage or CnodeModule, with the cnode rows pointing at their astoid rows
+    """
+    astoid_columns = AstoidColumns.from_cnode(root_cnode)
+    return CnodeColumns(root_cnode,astoid_columns),astoid_columns
+
+if __name__ == '__main__':
+    from cnode import cnode_load, CnodeDef
+    cnode_columns,astoid_columns = export(cnode_load(sys.argv[1]))
+    print('%d cnodes, %d astoids in %d modules' % (len(cnode_columns),len(astoid_columns),len(astoid_columns.modules)))
+    for name,count in sorted(astoid_columns.type_counts().items(),key=lambda item: -item[1])[:10]:
+        print('%8d  %s' % (count,name))
+    definitions = cnode_columns.rows(CnodeDef)
+    print('definitions: %d, mean span %.1f lines, max span %d lines' % (len(definitions),cnode_columns.span[definitions].mean(),cnode_columns.span[definitions].max()))
+    print('deepest astoid nesting: %d' % astoid_columns.depth.max())
@@ -0,0 +1,293 @@
+""" doctest_runner runs doctests of python source in a pool of warm worker processes instead of reloading modules in the caller
+It also runs the doctests of whole packages, discovered from their cnode trees, with results cached by docstring and module content
+"""
+from concurrent.futures import ProcessPoolExecutor
+from cnode import cnode_import, cnode_load, CnodeModule, CnodeClass, CnodeDef
+from symbol_index import SymbolIndex
+import multiprocessing, copy, doctest, importlib, linecache, os, os.path, sys, types, ast, hashlib, io, pickle, tempfile, time
+
+def _init_worker(sys_path,preload):
+    sys.path[:] = sys_path
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+def run_source_doctests(source,module_name,filepath):
+    """
+    Executes source as a fresh module named module_name and runs its doctests, returning (failcount,testcount)
+    The module is removed from sys.modules afterwards; the modules it imported stay loaded for the next run
+    """
+    module = types.ModuleType(module_name)
+    module.__file__ = filepath
+    if os.path.basename(filepath) == '__init__.py':
+        module.__path__ = [os.path.dirname(filepath)]
+        module.__package__ = module_name
+    else:
+        module.__package__ = module_name.rpartition('.')[0]
+    previous = sys.modules.get(module_name)
+    sys.modules[module_name] = module
+    #doctest reports line numbers from linecache, which would otherwise hold the file on disk rather than source
+    previous_lines = linecache.cache.get(filepath)
+    linecache.cache[filepath] = (len(source),None,source.splitlines(keepends=True),filepath)
+    try:
+        exec(compile(source,filepath,'exec'),module.__dict__)
+        runner = doctest.DocTestRunner(verbose=False)
+        for test in doctest.DocTestFinder().find(module,module_name):
+            #only the counts are returned, so the failure reports are dropped instead of printed
+            runner.run(test,out=lambda text: None)
+        #runner.summarize() would print its report to stdout
+        failcount,testcount = runner.failures,runner.tries
+    finally:
+        if previous_lines is None:
+            linecache.cache.pop(filepath,None)
+        else:
+            linecache.cache[filepath] = previous_lines
+        if previous is None:
+            sys.modules.pop(module_name,None)
+        else:
+            sys.modules[module_name] = previous
+    return failcount,testcount
+
+class DoctestPool():
+    """
+    Pool of worker processes that run doctests for module sources in isolation from the caller
+    Workers are started from a forkserver template (spawn where forkserver is unavailable) with the modules in preload
+    already imported, and they stay alive between runs so dependencies are only imported once per worker
+    """
+    def __init__(self,workers=None,preload=(),sys_path=None):
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        preload = list(preload)
+        if context.get_start_method() == 'forkserver':
+            context.set_forkserver_preload(preload)
+        self.executor = ProcessPoolExecutor(max_workers=workers,mp_context=context,initializer=_init_worker,
+                initargs=(list(sys.path if sys_path is None else sys_path),preload))
+    def __enter__(self):
+        return self
+    def __exit__(self,exc_type,exc_value,exc_tb):
+        self.shutdown()
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def submit(self,source,module_name,filepath):
+        """
+        Starts a doctest run of source and returns a future of (failcount,testcount)
+        The future raises whatever executing the module raised
+        """
+        return self.executor.submit(run_source_doctests,source,module_name,filepath)
+    def testsource(self,source,module_name,filepath,timeout=None):
+        return self.submit(source,module_name,filepath).result(timeout)
+    def submit_docstrings(self,module_name,docstrings):
+        """
+        Starts a run of DocstringTests of one module and returns a future of their DoctestResults
+        """
+        return self.executor.submit(run_docstring_tests,module_name,docstrings)
+
+_default_pool = None
+def default_pool():
+    """
+    Returns the shared DoctestPool, starting it on first use
+    """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = DoctestPool()
+    return _default_pool
+
+class DocstringTest():
+    """
+    The doctest examples of one docstring found in a cnode tree
+    lineno is the 0-based line index of the docstring within filepath
+    """
+    __slots__ = ('name','module_name','filepath','lineno','docstring','key')
+    def __init__(self,name,module_name,filepath,lineno,docstring,module_digest):
+        self.name = name
+        self.module_name = module_name
+        self.filepath = filepath
+        self.lineno = lineno
+        self.docstring = docstring
+        self.key = (name,hashlib.sha256(docstring.encode('utf-8','surrogatepass')).hexdigest(),module_digest)
+    def __getstate__(self):
+        return {name:getattr(self,name) for name in self.__slots__}
+    def __setstate__(self,state):
+        for name,value in state.items():
+            setattr(self,name,value)
+
+class DoctestResult():
+    """
+    Outcome of running one DocstringTest
+    examples holds (file line number,seconds,outcome) per example with outcome 'success', 'failure' or 'exception'
+    error is set instead when the module could not be imported
+    """
+    __slots__ = ('name','failcount','testcount','examples','report','error','cached')
+    def __init__(self,name,failcount,testcount,examples,report='',error=None):
+        self.name = name
+        self.failcount = failcount
+        self.testcount = testcount
+        self.examples = examples
+        self.report = report
+        self.error = error
+        self.cached = False
+    def __getstate__(self):
+        return {name:getattr(self,name) for name in self.__slots__}
+    def __setstate__(self,state):
+        for name,value in state.items():
+            setattr(self,name,value)
+    def __repr__(self):
+        return '<DoctestResult %s: %d failed of %d%s>' % (self.name,self.failcount,self.testcount,' (cached)' if self.cached else '')
+
+class _TimingRunner(doctest.DocTestRunner):
+    #records how long every example takes from the report hooks that DocTestRunner calls around it
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        self.examples = []
+        self._start = None
+    def report_start(self,out,test,example):
+        self._start = time.perf_counter()
+        super().report_start(out,test,example)
+    def _finish(self,test,example,outcome):
+        elapsed = time.perf_counter()-self._start if self._start is not None else 0.0
+        self.examples.append((test.lineno+example.lineno+1,elapsed,outcome))
+        self._start = None
+    def report_success(self,out,test,example,got):
+        self._finish(test,example,'success')
+        super().report_success(out,test,example,got)
+    def report_failure(self,out,test,example,got):
+        self._finish(test,example,'failure')
+        super().report_failure(out,test,example,got)
+    def report_unexpected_exception(self,out,test,example,exc_info):
+        self._finish(test,example,'exception')
+        super().report_unexpected_exception(out,test,example,exc_info)
+
+def run_docstring_tests(module_name,docstrings):
+    """
+    Imports module_name and runs the examples of each DocstringTest against a copy of its globals
+    The module is imported afresh every time, since a warm worker may hold a version of it that has been edited since
+    """
+    sys.modules.pop(module_name,None)
+    importlib.invalidate_caches()
+    try:
+        module = importlib.import_module(module_name)
+    except BaseException as e:
+        error = '%s: %s' % (type(e).__name__,e)
+        return [DoctestResult(docstring.name,0,0,[],error=error) for docstring in docstrings]
+    parser = doctest.DocTestParser()
+    results = []
+    for docstring in docstrings:
+        test = parser.get_doctest(docstring.docstring,module.__dict__.copy(),docstring.name,docstring.filepath,docstring.lineno)
+        runner = _TimingRunner(verbose=False)
+        report = io.StringIO()
+        runner.run(test,out=report.write)
+        #runner.summarize() would print its report to stdout
+        failcount,testcount = runner.failures,runner.tries
+        results.append(DoctestResult(docstring.name,failcount,testcount,runner.examples,report.getvalue()))
+    return results
+
+def find_docstring_tests(root_cnode):
+    """
+    Returns a DocstringTest for every module, class and function docstring with examples in a cnode tree
+    Like doctest.DocTestFinder, definitions are searched within modules and classes but not within functions or blocks
+    """
+    index = SymbolIndex(root_cnode)
+    docstrings = []
+    for module_cnode in root_cnode.subtree():
+        if not isinstance(module_cnode,CnodeModule):
+            continue
+        module_name = index.module_fqn(module_cnode)
+        module_digest = hashlib.sha256(module_cnode.source_lines.get_text().encode('utf-8','surrogatepass')).hexdigest()
+        stack = [(module_cnode,module_name)]
+        while len(stack) > 0:
+            cnode,name = stack.pop()
+            if len(cnode.astoids) > 0:
+                ast_node = cnode.astoids[0].ast_node
+                docstring = ast.get_docstring(ast_node,clean=False)
+                if docstring is not None and '>>>' in docstring:
+                    docstrings.append(DocstringTest(name,module_name,module_cnode.path,ast_node.body[0].lineno-1,docstring,module_digest))
+            for child in reversed(cnode.children):
+                if isinstance(child,CnodeDef) and isinstance(cnode,(CnodeModule,CnodeClass)):
+                    stack.append((child,name+'.'+child.name))
+    return docstrings
+
+class DoctestCache():
+    """
+    Results of DocstringTests keyed by (name,docstring hash,module hash), optionally persisted to a pickle file at path
+    An unchanged docstring in an unchanged module is not run again
+    """
+    def __init__(self,path=None):
+        self.path = path
+        self.results = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path,'rb') as f:
+                    self.results = pickle.load(f)
+            except (OSError,EOFError,pickle.UnpicklingError,AttributeError,ValueError):
+                self.results = {}
+    def get(self,docstring):
+        return self.results.get(docstring.key)
+    def put(self,docstring,result):
+        self.results[docstring.key] = result
+    def save(self):
+        if self.path is None:
+            return
+        fd,tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump(self.results,f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,self.path)
+
+def run_package_doctests(name_or_path,workers=None,cache=None,pool=None,shard_size=8):
+    """
+    Runs the doctests of every module, class and function of a package (an importable name or a path) in a process pool
+    The docstrings of each module are split into shards of at most shard_size docstrings, which are spread over the workers
+    Docstrings whose result is in cache (a DoctestCache) are skipped and their cached result is returned with cached=True
+    Returns the DoctestResults in source order
+    """
+    if os.path.exists(name_or_path):
+        root_cnode = cnode_load(name_or_path)
+        sys_path = [os.path.dirname(os.path.abspath(os.path.normpath(name_or_path)))]+sys.path
+    else:
+        root_cnode = cnode_import(name_or_path)
+        sys_path = list(sys.path)
+    docstrings = find_docstring_tests(root_cnode)
+    results = [None]*len(docstrings)
+    shards = {}
+    for position,docstring in enumerate(docstrings):
+        cached = cache.get(docstring) if cache is not None else None
+        if cached is not None:
+            #the entry stays as it was stored
+            cached = copy.copy(cached)
+            cached.cached = True
+            results[position] = cached
+            continue
+        module_shards = shards.setdefault(docstring.module_name,[[]])
+        if len(module_shards[-1]) >= shard_size:
+            module_shards.append([])
+        module_shards[-1].append((position,docstring))
+    if len(shards) > 0:
+        own_pool = pool is None
+        if own_pool:
+            pool = DoctestPool(workers,sys_path=sys_path)
+        try:
+            futures = []
+            for module_name,module_shards in shards.items():
+                for shard in module_shards:
+                    futures.append((shard,pool.submit_docstrings(module_name,[docstring for position,docstring in shard])))
+            for shard,future in futures:
+                for (position,docstring),result in zip(shard,future.result()):
+                    results[position] = result
+                    if cache is not None and result.error is None:
+                        cache.put(docstring,result)
+        finally:
+            if own_pool:
+                pool.shutdown()
+    if cache is not None:
+        cache.save()
+    return results
+
+def summarize(results):
+    """
+    Returns the total (failcount,testcount) of a list of DoctestResults, counting modules that failed to import as one failure
+    """
+    failcount = sum(result.failcount+(1 if result.error is not None else 0) for result in results)
+    testcount = sum(result.testcount for result in results)
+    return failcount,testcount
@@ -1,5 +1,9 @@
 import inspect, ast, re, sys, code, readline, importlib, os, doctest, os.path
 from io import StringIO
+import parse_cache
+from symbol_index import module_symbols
+from doctest_runner import default_pool
+from target_resolver import split_target, NoTargetError
 try:
     from importlib import reload
 except:
@@ -14,20 +18,17 @@ def get_target(target_fqn):
     """
     This function returns the target object, module object, and the module's fully qualified name based on the provided fully qualified target name.
     """
-    module_fqn = target_fqn.split('.')
-    while True:
-        try:
-            module = __import__('.'.join(module_fqn))
-            break
-        except ImportError:
-            module_fqn.pop()
-            if len(module_fqn) == 0:
-                raise Exception('Could not resolve target: %s' % repr(target_fqn))
+    #find the module portion statically so that only that module is imported, once
+    try:
+        module_fqn,spec,inner = split_target(target_fqn)
+    except NoTargetError:
+        raise Exception('Could not resolve target: %s' % repr(target_fqn))
+    module = __import__(module_fqn)
     pieces = target_fqn.split('.')
     obj = module
     for item in pieces[1:]:
         obj = getattr(obj,item)
-    return obj,module,'.'.join(module_fqn)
+    return obj,module,module_fqn
 get_target.__annotations__ = {'target_fqn':'fully qualified name of target','return':('target object','top-level target module','fully qualified name of module')}
 
 class _ModStdout(object):
@@ -59,115 +60,159 @@ def get_ast_obj(target_fqn,obj=None,module=None,module_fqn=None):
     """
     if obj is None or module is None or module_fqn is None:
         obj,module,module_fqn = get_target(target_fqn)
-    importlib.reload(module)
+    #the definition is read from the file, so the module does not need to be reloaded
+    filepath = get_source_path(obj)
+    source,tree = parse_cache.load(filepath)
+    ast_obj = find_ast_obj(obj,target_fqn,filepath,tree)
+    return ast_obj, filepath,source
+
+def defining_module_name(obj):
+    """
+    This function returns the name of the module in which obj is defined.
+    """
     if inspect.ismodule(obj):
-        importlib.reload(sys.modules[obj.__name__])
-    else:
-        importlib.reload(sys.modules[obj.__module__])
+        return obj.__name__
+    return obj.__module__
+
+def get_source_path(obj):
+    """
+    This function returns the absolute path of the file defining obj, refusing files outside of the current working directory.
+    """
     filepath = os.path.abspath(inspect.getsourcefile(obj))
     if not filepath.startswith(os.getcwd()):
         raise Exception('Referenced file is not in the current working directory or any subfolders - this is to protect you from modifying system or site-package code: %s' % repr(filepath))
-    filepath
+    return filepath
+
+def find_ast_obj(obj,target_fqn,filepath,tree):
+    """
+    This function returns the ast object defining obj within the parsed tree of its file.
+    """
     pieces = target_fqn.split('.')
-    with open(filepath,'r') as f:
-        src_lines = f.readlines()
-    source = ''.join(src_lines)
-    tree = ast.parse(source)
     if inspect.ismodule(obj):
         ast_obj = tree
-    elif inspect.isclass(obj):
-        ast_obj = [node for node in ast.walk(tree) if isinstance(node,ast.ClassDef) and node.name == pieces[-1]][0]
-    elif inspect.isfunction(obj):
-        ast_obj = [node for node in ast.walk(tree) if isinstance(node,ast.FunctionDef) and node.name == pieces[-1]][0]
+    else:
+        #look the definition up by its qualified name within its module instead of scanning the tree for a matching name
+        cnode = module_symbols(filepath).lookup(getattr(obj,'__qualname__',pieces[-1]))
+        if cnode is not None:
+            ast_obj = cnode.astoids[0].ast_node
+        elif inspect.isclass(obj):
+            ast_obj = [node for node in ast.walk(tree) if isinstance(node,ast.ClassDef) and node.name == pieces[-1]][0]
+        elif inspect.isfunction(obj):
+            ast_obj = [node for node in ast.walk(tree) if isinstance(node,ast.FunctionDef) and node.name == pieces[-1]][0]
+    return ast_obj
 
-    return ast_obj, filepath,source
+def doctest_insertion(ast_obj,src_lines):
+    """
+    This function determines where docstring lines for the definition ast_obj are inserted into src_lines.
+    It returns (start,end,head,tail,indentation,newline): the updated source is src_lines[:start]+head+docstring lines+tail+src_lines[end:]
+    """
+    if isinstance(ast_obj.body[0],ast.Expr) and isinstance(ast_obj.body[0].value,ast.Str):
+        #docstring already exists
+        ast_doc = ast_obj.body[0]
+
+        if hasattr(ast_doc,'end_lineno'):
+            #python 3.8+
+            line_index = ast_doc.end_lineno-1 #last line of docstring (line containing the ending quotes)
+        else:
+            #python 3.7-
+            line_index = ast_doc.lineno-1 #last line of docstring (line containing the ending quotes)
+        indentation = re.search('^\\s*',src_lines[line_index]).group(0) #use docstring end line to determine indentation
+        newline = re.search('[\r\n]+$',src_lines[line_index]).group(0) #use docstring end line to determine newline
+        last_line = src_lines[line_index] #entire docstring up to and including end line stays on top
+        ending = '"""'+last_line.split('"""')[-1] #get the trailing quotes and characters after doctsring
+        content = last_line[:-len(ending)] #remove trailing from top
+        if content.strip() == '':
+            content = ''
+        head = [content+newline]
+        tail = [indentation+ending] #add trailing to bottom
+        return line_index,line_index+1,head,tail,indentation,newline
+    elif len(ast_obj.body) == 1 and ast_obj.lineno == ast_obj.body[0].lineno:
+        #docstring does not exist for a single-line function
+        line_index = ast_obj.lineno-1 #line of function
+        indentation = re.search('^\\s*',src_lines[line_index]).group(0).strip('\r\n')+'    ' #use indentation of function plus four spaces
+        newline = re.search('[\r\n]+$',src_lines[line_index]).group(0) #use newline of function line
+        ast_first = ast_obj.body[0] #first (and only) element in body
+        byte_index = ast_first.col_offset #starting position of first element
+        first_element = src_lines[line_index][byte_index:] #first element text content
+        head = [src_lines[line_index][:byte_index]+newline] #remove first element text content from top
+        head.append(indentation+'"""'+newline) #add docstring starting quotes
+        tail = [indentation+'"""'+newline] #add docstring ending quotes
+        tail.append(indentation+first_element) #add first element text content to bottom
+        return line_index,line_index+1,head,tail,indentation,newline
+    else:
+        #docstring does not exist for a multi-line function
+        ast_first = ast_obj.body[0]
+        line_index = ast_first.lineno-1 #line number of first element in body of definition
+        indentation = re.search('^\\s*',src_lines[line_index]).group(0) #use first element line to determine indentation
+        newline = re.search('[\r\n]+$',src_lines[line_index]).group(0) #use first element line to determine newline
+        head = [indentation+'"""'+newline] #add new docstring starting quotes
+        tail = [indentation+'"""'+newline] #add docstring ending quotes
+        return line_index,line_index,head,tail,indentation,newline
+
+def splice_lines(src_lines,edits):
+    """
+    This function applies (start,end,lines) edits to a list of source lines: src_lines[start:end] is replaced by lines for each edit.
+    Edits are applied bottom-up so that the line numbers of the edits above stay valid, so they must not overlap.
+    """
+    src_lines = list(src_lines)
+    for start,end,lines in sorted(edits,key=lambda edit: edit[:2],reverse=True):
+        src_lines[start:end] = lines
+    return src_lines
+
+def indent_doctest_lines(middle,indentation,newline):
+    """
+    This function indents recorded doctest lines to sit inside of a docstring.
+    """
+    indented_middle = []
+    last_line = None
+    for line in middle:
+        line = re.sub(newline,newline+indentation,line)
+        if last_line is None: 
+            indented_middle.append(indentation+line)
+        else:
+            indented_middle.append(line)
+        last_line = line
+    indented_middle[-1] = indented_middle[-1].rstrip() + newline #don't indent the ending triple quotes
+    return indented_middle
 
 class DoctestInjector(object):
     """
     This class loads a target object by its fully qualified name and parses its source code to determine how to insert docstring lines for that object.
     """
-    def __init__(self,target_fqn):
+    def __init__(self,target_fqn,pool=None):
         self.target_fqn = target_fqn
         obj,module,module_fqn = get_target(target_fqn)
         self.obj = obj
         self.module=module
         self.module_fqn = module_fqn
+        self.module_name = defining_module_name(obj)
+        self.pool = pool
         ast_obj,self.filepath,self.original_source = get_ast_obj(target_fqn,obj,module,module_fqn)
-
-        if isinstance(ast_obj.body[0],ast.Expr) and isinstance(ast_obj.body[0].value,ast.Str):
-            #docstring already exists
-            ast_doc = ast_obj.body[0]
-
-            if hasattr(ast_doc,'end_lineno'):
-                #python 3.8+
-                line_index = ast_doc.end_lineno-1 #last line of docstring (line containing the ending quotes)
-            else:
-                #python 3.7-
-                line_index = ast_doc.lineno-1 #last line of docstring (line containing the ending quotes)
-            byte_index = ast_doc.col_offset
-            indentation = re.search('^\\s*',src_lines[line_index]).group(0) #use docstring end line to determine indentation
-            newline = re.search('[\r\n]+$',src_lines[line_index]).group(0) #use docstring end line to determine newline
-            top = src_lines[:line_index+1] #include entire docstring including end line 
-            bottom = src_lines[line_index+1:] #everything else
-            ending = '"""'+top[-1].split('"""')[-1] #get the trailing quotes and characters after doctsring
-            top[-1] = top[-1][len(indentation):-len(ending)]+newline #remove trailing from top
-            bottom.insert(0,indentation+ending) #add trailing to bottom
-        else:
-            if len(ast_obj.body) == 1 and ast_obj.lineno == ast_obj.body[0].lineno:
-                #docstring does not exist for a single-line function
-                line_index = ast_obj.lineno-1 #line of function
-                indentation = re.search('^\\s*',src_lines[line_index]).group(0).strip('\r\n')+'    ' #use indentation of function plus four spaces
-                newline = re.search('[\r\n]+$',src_lines[line_index]).group(0) #use newline of function line
-                top = src_lines[:line_index+1] #include funtion
-                bottom = src_lines[ast_obj.lineno:] #everything after function
-                ast_first = ast_obj.body[0] #first (and only) element in body
-                byte_index = ast_first.col_offset #starting position of first element
-                first_element = top[-1][byte_index:] #first element text content
-                top[-1] = top[-1][:byte_index]+newline #remove first element text content from top
-                bottom.insert(0,indentation+first_element) #add first element text content to bottom
-                top.append(indentation+'"""'+newline) #add docstring starting quotes
-                bottom.insert(0,indentation+'"""'+newline) #add docstring ending quotes
-            else:
-                #docstring does not exist for a multi-line function
-                ast_first = ast_obj.body[0]
-                line_index = ast_first.lineno-1 #line number of first element in body of definition
-                byte_index = ast_first.col_offset
-                indentation = re.search('^\\s*',src_lines[line_index]).group(0) #use first element line to determine indentation
-                newline = re.search('[\r\n]+$',src_lines[line_index]).group(0) #use first element line to determine newline
-                top = src_lines[:line_index] #everything up to but not including first element
-                top.append(indentation+'"""'+newline) #add new docstring starting quotes
-                bottom = src_lines[ast_obj.body[0].lineno-1:] #first element and everything after
-                bottom.insert(0,indentation+'"""'+newline) #add docstring ending quotes
+        src_lines = self.original_source.splitlines(keepends=True)
+        start,end,head,tail,indentation,newline = doctest_insertion(ast_obj,src_lines)
+        top = src_lines[:start]+head
+        bottom = tail+src_lines[end:]
         self.top = top
         self.bottom = bottom
         self.indentation = indentation
         self.newline = newline
         self.middle = []
-    __init__.__annotations__ = {'target_fqn':'fully qualified name of target','return':('target object','target module','fully qualified name of module')}
+    __init__.__annotations__ = {'target_fqn':'fully qualified name of target','pool':'doctest_runner.DoctestPool used to verify the source (defaults to the shared pool)','return':('target object','target module','fully qualified name of module')}
     def source(self):
         """
         This returns the updated source code with new inserted docstrings lines for the target object.
         """
-        indented_middle = []
-        last_line = None
-        for line in self.middle:
-            line = re.sub(self.newline,self.newline+self.indentation,line)
-            if last_line is None: 
-                indented_middle.append(self.indentation+line)
-            else:
-                indented_middle.append(line)
-            last_line = line
-        indented_middle[-1] = indented_middle[-1].rstrip() + self.newline #don't indent the ending triple quotes
-        return ''.join(self.top+ indented_middle + self.bottom)
+        return ''.join(self.top+ indent_doctest_lines(self.middle,self.indentation,self.newline) + self.bottom)
     def doctest_console(self):
         """
         This function runs doctests on the target file, loads the file, and enters a special interactive mode with inputs/outputs being recorded.
         When the console is done being used (via Ctrl+D), the recorded inputs/outputs will be inserted into the docstring of the target object.
         Doctests are then run for the udpated code and if there are no problems, the updated code is written to the file location.
         If there are problems, the updated code is saved to a file in the same folder as the target file but with the suffix ".failed_doctest_insert".
+        Doctests run in worker processes (see verify) so the module is never reloaded in this process.
         """
         print('Testing doctest execution of original file')
-        oldfailcount,oldtestcount = self.testmod()
+        oldfailcount,oldtestcount = self.verify(self.original_source)
         print('...done: Fail count = %d, Total count = %d' % (oldfailcount,oldtestcount))
         print('Entering interactive console')
         banner='''Doctest insertion targeting object %s within %s
@@ -196,36 +241,115 @@ To abort this session without writing anything into the targeted file, call the
         if len(iobuf) == 0:
             print('No lines were written - exiting')
         else:
-            print('Writing doctest lines to file')
             updated_source = self.source()
-            with open(self.filepath,'w') as f:
-                f.write(updated_source)
-            print('Testing doctest execution of new file')
+            print('Testing doctest execution of updated source')
             revert = False
             try:
-                newfailcount,newtestcount = self.testmod()
+                newfailcount,newtestcount = self.verify(updated_source)
                 print('...done: Fail count = %d (old=%d), Total count = %d (old=%d)' % (newfailcount,oldfailcount,newtestcount,oldtestcount))
             except:
                 revert = True
-                print('Failed to load new file - reverting back to original file')
+                print('Failed to load updated source - leaving original file unchanged')
             if revert is False and oldfailcount != newfailcount:
                 revert = True
-                print('Failcounts from before did not match after - reverting back to original file')
+                print('Failcounts from before did not match after - leaving original file unchanged')
             if revert:
-                with open(self.filepath,'w') as f:
-                    f.write(self.original_source)
                 print('Updated source code with problems located at: %s' % (self.filepath+'.failed_doctest_insert'))
                 with open(self.filepath+'.failed_doctest_insert','w') as f:
                     f.write(updated_source)
             else:
+                print('Writing doctest lines to file')
+                with open(self.filepath,'w') as f:
+                    f.write(updated_source)
                 print('File successfully updated')
+    def verify(self,source):
+        """
+        This runs the doctests of source as the target module in a worker process and returns the failcount and testcount
+        """
+        pool = self.pool if self.pool is not None else default_pool()
+        return pool.testsource(source,self.module_name,self.filepath)
     def testmod(self):
         """
-        This runs doctests on the target module and returns the failcount and testcount
+        This reloads the target module in this process, runs its doctests and returns the failcount and testcount
         """
         self.module = module = reload(sys.modules[self.module_fqn])
         failcount,testcount = doctest.testmod(module)
         return failcount,testcount
+class BatchDoctestInjector(object):
+    """
+    This class inserts recorded doctest lines into the docstrings of many target objects at once.
+    Targets are grouped by the file defining them: each file is parsed once, all of its insertions are applied bottom-up in a single write,
+    and doctests are run once per module before and after the write.
+    """
+    def __init__(self,sessions,pool=None):
+        self.pool = pool
+        self.files = {} #filepath -> _FileBatch
+        for target_fqn,middle in sessions.items():
+            obj,module,module_fqn = get_target(target_fqn)
+            module_name = defining_module_name(obj)
+            filepath = get_source_path(obj)
+            if filepath not in self.files:
+                source,tree = parse_cache.load(filepath)
+                self.files[filepath] = _FileBatch(filepath,module_name,source,tree)
+            batch = self.files[filepath]
+            ast_obj = find_ast_obj(obj,target_fqn,filepath,batch.tree)
+            batch.insertions.append((doctest_insertion(ast_obj,batch.src_lines),list(middle)))
+    __init__.__annotations__ = {'sessions':'dictionary from fully qualified target names to recorded doctest lines, in the format of DoctestInjector.middle','pool':'doctest_runner.DoctestPool used to verify the sources (defaults to the shared pool)'}
+    def source(self,filepath):
+        """
+        This returns the updated source code of one file with the docstring lines of all of its targets inserted.
+        """
+        batch = self.files[os.path.abspath(filepath)]
+        edits = []
+        for (start,end,head,tail,indentation,newline),middle in batch.insertions:
+            if len(middle) > 0:
+                edits.append((start,end,head+indent_doctest_lines(middle,indentation,newline)+tail))
+        return ''.join(splice_lines(batch.src_lines,edits))
+    def write(self):
+        """
+        Verifies and writes every updated file. The doctests of the original and updated source of all files run concurrently in worker processes.
+        A file is left unchanged when either version fails to load or the fail count changes; the updated code is then saved with the suffix ".failed_doctest_insert".
+        Returns a dictionary from file paths to (old fail count, old test count, new fail count, new test count, written).
+        """
+        pool = self.pool if self.pool is not None else default_pool()
+        pending = []
+        for filepath,batch in self.files.items():
+            updated_source = self.source(filepath)
+            pending.append((filepath,updated_source,
+                pool.submit(batch.original_source,batch.module_name,filepath),
+                pool.submit(updated_source,batch.module_name,filepath)))
+        results = {}
+        for filepath,updated_source,old_future,new_future in pending:
+            counts = []
+            for future in [old_future,new_future]:
+                try:
+                    counts.extend(future.result())
+                except:
+                    counts.extend([None,None])
+            oldfailcount,oldtestcount,newfailcount,newtestcount = counts
+            written = oldtestcount is not None and newtestcount is not None and oldfailcount == newfailcount
+            if written:
+                with open(filepath,'w') as f:
+                    f.write(updated_source)
+            else:
+                with open(filepath+'.failed_doctest_insert','w') as f:
+                    f.write(updated_source)
+            results[filepath] = (oldfailcount,oldtestcount,newfailcount,newtestcount,written)
+        return results
+class _FileBatch(object):
+    def __init__(self,filepath,module_name,original_source,tree):
+        self.filepath = filepath
+        self.module_name = module_name
+        self.original_source = original_source
+        self.tree = tree
+        self.src_lines = original_source.splitlines(keepends=True)
+        self.insertions = [] #(doctest_insertion(...),recorded lines)
+def inject_doctests(sessions,pool=None):
+    """
+    Write recorded doctest lines into the docstrings of many targets, given as a dictionary from fully qualified names to lines.
+    Each affected file is parsed once and written once; see BatchDoctestInjector.write for the returned summary.
+    """
+    return BatchDoctestInjector(sessions,pool).write()
 def set_end_interactive(value=True):
     """
     Setting value=True will make python go into interactive mode when the script terminates.
@@ -0,0 +1,237 @@
+""" lazy_imports moves module-level imports that are only used inside functions into those functions,
+so that importing the module no longer pays for them
+"""
+from cnode import parse_module
+from injector import splice_lines
+from doctest_runner import default_pool
+import parse_cache
+import ast, os.path, re
+
+class LazyImport():
+    """
+    One import alias that is moved: the module-level statement it comes from and the functions it is re-imported in
+    """
+    __slots__ = ('name','alias','statement','functions')
+    def __init__(self,name,alias,statement,functions):
+        self.name = name
+        self.alias = alias
+        self.statement = statement
+        self.functions = functions
+    def __repr__(self):
+        return '<LazyImport %s (line %d) into %s>' % (self.name,self.statement.lineno,', '.join(function.name for function in self.functions))
+
+def bound_name(alias):
+    if alias.asname is not None:
+        return alias.asname
+    return alias.name.split('.')[0]
+
+def candidate_statements(module_cnode):
+    """
+    Returns the import statements that sit directly in the module body on lines of their own
+    """
+    if len(module_cnode.astoids) == 0:
+        return []
+    statements = []
+    source_lines = module_cnode.source_lines
+    for statement in module_cnode.astoids[0].ast_node.body:
+        if not isinstance(statement,(ast.Import,ast.ImportFrom)):
+            continue
+        if isinstance(statement,ast.ImportFrom) and (statement.module == '__future__' or any(alias.name == '*' for alias in statement.names)):
+            continue
+        first_line = source_lines[statement.lineno-1]
+        last_line = source_lines[statement.end_lineno-1]
+        if first_line[:statement.col_offset].strip() != '' or last_line[statement.end_col_offset:].strip() != '':
+            continue
+        statements.append(statement)
+    return statements
+
+def _function_uses(ast_module,names):
+    """
+    Finds where names are used: returns (uses,blocked) where uses maps a name to the outermost functions loading it
+    and blocked holds the names that are loaded outside of any function body or bound anywhere besides their import
+    """
+    uses = {}
+    blocked = set()
+    stack = [(statement,None) for statement in ast_module.body]
+    while len(stack) > 0:
+        node,function = stack.pop()
+        if isinstance(node,(ast.FunctionDef,ast.AsyncFunctionDef)):
+            #decorators, defaults and annotations run when the function is defined
+            blocked.update(name for name in [node.name] if name in names)
+            outer = [node.decorator_list,node.args.defaults,[default for default in node.args.kw_defaults if default is not None]]
+            for nodes in outer:
+                stack.extend((child,function) for child in nodes)
+            for arg in node.args.posonlyargs+node.args.args+node.args.kwonlyargs+[node.args.vararg,node.args.kwarg]:
+                if arg is not None:
+                    if arg.arg in names:
+                        blocked.add(arg.arg)
+                    if arg.annotation is not None:
+                        stack.append((arg.annotation,function))
+            if node.returns is not None:
+                stack.append((node.returns,function))
+            stack.extend((child,function if function is not None else node) for child in node.body)
+            continue
+        if isinstance(node,ast.ClassDef) and node.name in names:
+            blocked.add(node.name)
+        if isinstance(node,ast.Name) and node.id in names:
+            if isinstance(node.ctx,ast.Load) and function is not None:
+                uses.setdefault(node.id,[])
+                if function not in uses[node.id]:
+                    uses[node.id].append(function)
+            else:
+                blocked.add(node.id)
+        elif isinstance(node,(ast.Global,ast.Nonlocal)):
+            blocked.update(name for name in node.names if name in names)
+        elif isinstance(node,ast.ExceptHandler) and node.name in names:
+            blocked.add(node.name)
+        elif isinstance(node,(ast.Import,ast.ImportFrom)) and function is not None:
+            blocked.update(bound_name(alias) for alias in node.names if bound_name(alias) in names)
+        stack.extend((child,function) for child in ast.iter_child_nodes(node))
+    return uses,blocked
+
+def exported_names(ast_module):
+    """
+    Returns the names listed in a literal __all__
+    """
+    names = set()
+    for statement in ast_module.body:
+        if isinstance(statement,ast.Assign) and any(isinstance(target,ast.Name) and target.id == '__all__' for target in statement.targets):
+            if isinstance(statement.value,(ast.List,ast.Tuple)):
+                names.update(element.value for element in statement.value.elts if isinstance(element,ast.Constant))
+    return names
+
+def plan_lazy_imports(module_cnode,keep=()):
+    """
+    Returns the LazyImports of a module: aliases of module-level import statements that are only loaded inside functions
+    Names in keep (e.g. names other modules import from this one), names in __all__, and names that are rebound,
+    shadowed by a function parameter or local import, or used at module level (including decorators, defaults and
+    annotations) stay where they are
+    """
+    if len(module_cnode.astoids) == 0:
+        return []
+    ast_module = module_cnode.astoids[0].ast_node
+    statements = candidate_statements(module_cnode)
+    counts = {}
+    for statement in ast_module.body:
+        if isinstance(statement,(ast.Import,ast.ImportFrom)):
+            for alias in statement.names:
+                counts[bound_name(alias)] = counts.get(bound_name(alias),0)+1
+    names = {bound_name(alias) for statement in statements for alias in statement.names}
+    uses,blocked = _function_uses(ast_module,names)
+    blocked.update(keep)
+    blocked.update(exported_names(ast_module))
+    lazy_imports = []
+    for statement in statements:
+        for alias in statement.names:
+            name = bound_name(alias)
+            if name in blocked or name not in uses or counts[name] > 1:
+                continue
+            functions = uses[name]
+            if any(function.body[0].lineno == function.lineno for function in functions):
+                #single line functions have no line to put the import on
+                continue
+            lazy_imports.append(LazyImport(name,alias,statement,functions))
+    return lazy_imports
+
+def _import_text(statement,aliases):
+    if isinstance(statement,ast.Import):
+        return ast.unparse(ast.Import(names=aliases))
+    return ast.unparse(ast.ImportFrom(module=statement.module,names=aliases,level=statement.level))
+
+def _insertion_line(function):
+    #after the docstring, before the first statement of the body
+    body = function.body
+    statement = body[0]
+    if len(body) > 1 and isinstance(statement,ast.Expr) and isinstance(statement.value,ast.Constant) and isinstance(statement.value.value,str):
+        statement = body[1]
+    return min([statement.lineno]+[decorator.lineno for decorator in getattr(statement,'decorator_list',[])])-1
+
+def lazy_import_edits(module_cnode,lazy_imports):
+    """
+    Returns the (start,end,lines) edits for injector.splice_lines that remove the moved aliases and re-import them in their functions
+    """
+    source_lines = module_cnode.source_lines
+    newline = '\r\n' if len(source_lines) > 0 and source_lines[0].endswith('\r\n') else '\n'
+    edits = []
+    moved = {}
+    insertions = {} #id(function) -> (function,[(statement,alias)])
+    for lazy_import in lazy_imports:
+        moved.setdefault(id(lazy_import.statement),(lazy_import.statement,[]))[1].append(lazy_import.alias)
+        for function in lazy_import.functions:
+            insertions.setdefault(id(function),(function,[]))[1].append((lazy_import.statement,lazy_import.alias))
+    for statement,aliases in moved.values():
+        remaining = [alias for alias in statement.names if alias not in aliases]
+        lines = [_import_text(statement,remaining)+newline] if len(remaining) > 0 else []
+        edits.append((statement.lineno-1,statement.end_lineno,lines))
+    for function,imports in insertions.values():
+        line_index = _insertion_line(function)
+        indentation = re.search('^\\s*',source_lines[line_index]).group(0).strip('\r\n')
+        lines = []
+        grouped = {}
+        for statement,alias in imports:
+            grouped.setdefault(id(statement),(statement,[]))[1].append(alias)
+        for statement,aliases in grouped.values():
+            lines.append(indentation+_import_text(statement,aliases)+newline)
+        edits.append((line_index,line_index,lines))
+    return edits
+
+class LazyImportRewriter():
+    """
+    Rewrites one module so that its imports used only inside functions are imported within those functions
+    write() checks that the module still executes and keeps its doctest fail count before replacing the file
+    """
+    def __init__(self,path,module_name=None,keep=()):
+        self.path = os.path.abspath(path)
+        self.module_name = module_name if module_name is not None else os.path.splitext(os.path.basename(path))[0]
+        self.module_cnode = parse_module(self.path)
+        self.original_source = self.module_cnode.source_lines.get_text()
+        self.lazy_imports = plan_lazy_imports(self.module_cnode,keep)
+    def source(self):
+        edits = lazy_import_edits(self.module_cnode,self.lazy_imports)
+        return ''.join(splice_lines(list(self.module_cnode.source_lines),edits))
+    def write(self,verify=True,pool=None):
+        """
+        Writes the rewritten module and returns (old fail count,old test count,new fail count,new test count,written)
+        If verification fails the file is left unchanged and the rewritten code is saved with the suffix ".failed_lazy_imports"
+        """
+        if len(self.lazy_imports) == 0:
+            return (None,None,None,None,False)
+        updated_source = self.source()
+        counts = [None,None,None,None]
+        if verify:
+            pool = pool if pool is not None else default_pool()
+            futures = [pool.submit(source,self.module_name,self.path) for source in [self.original_source,updated_source]]
+            for position,future in enumerate(futures):
+                try:
+                    counts[2*position:2*position+2] = future.result()
+                except:
+                    pass
+            written = counts[1] is not None and counts[3] is not None and counts[0] == counts[2]
+        else:
+            written = True
+        if written:
+            with open(self.path,'w') as f:
+                f.write(updated_source)
+            parse_cache.discard(self.path)
+        else:
+            with open(self.path+'.failed_lazy_imports','w') as f:
+                f.write(updated_source)
+        return tuple(counts)+(written,)
+
+def lazify(path,module_name=None,verify=True,pool=None,keep=()):
+    """
+    Moves the function-only imports of the module at path into the functions using them; see LazyImportRewriter.write
+    """
+    return LazyImportRewriter(path,module_name,keep).write(verify,pool)
+
+def lazify_project(graph,module_names=None,verify=True,pool=None):
+    """
+    Runs lazify over the modules of a project_layout.ImportGraph (all of them unless module_names is given)
+    Names that other project modules import from a module with 'from module import name' are kept in place
+    Returns a dictionary from module names to the results of LazyImportRewriter.write
+    """
+    results = {}
+    for module_name in (module_names if module_names is not None else sorted(graph.modules)):
+        keep = {name for edge in graph.importer_edges.get(module_name,[]) for name in edge.names}
+        results[module_name] = lazify(graph.modules[module_name].path,module_name,verify,pool,keep)
+    return results
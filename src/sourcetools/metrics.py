@@ -0,0 +1,192 @@
+""" metrics computes size and complexity metrics of every function, class and block of a module from one shared parse,
+and of every module of a package in a process pool
+"""
+from concurrent.futures import ProcessPoolExecutor
+from cnode import parse_module, package_module_paths, CnodeDef, CnodeBlock
+from symbol_index import line_range
+from astoid import CodeClause
+import ast, os, os.path, sys
+
+class Metrics():
+    """
+    Metrics of one CnodeClass, CnodeFunction, CnodeAsyncFunction or CnodeBlock
+    qualname is the dotted name of the definition within its module, or of the definition holding the block ('' at module level)
+    lines counts the lines of the cnode (for definitions including decorators and body) and code_lines those that are not blank or comments
+    nesting is the deepest nesting of clauses (if/elif/else, loops, try/except/finally, with) below the cnode, not counting nested definitions
+    complexity is the cyclomatic complexity: 1 plus the decision points of the statements of the cnode outside of nested definitions
+    callees are the dotted names called there and fan_out is their number
+    """
+    __slots__ = ('path','qualname','kind','line_index','lines','code_lines','nesting','complexity','fan_out','callees')
+    def __init__(self,path,qualname,kind,line_index,lines,code_lines,nesting,complexity,callees):
+        self.path = path
+        self.qualname = qualname
+        self.kind = kind
+        self.line_index = line_index
+        self.lines = lines
+        self.code_lines = code_lines
+        self.nesting = nesting
+        self.complexity = complexity
+        self.fan_out = len(callees)
+        self.callees = callees
+    def __getstate__(self):
+        return {name:getattr(self,name) for name in self.__slots__}
+    def __setstate__(self,state):
+        for name,value in state.items():
+            setattr(self,name,value)
+    def __repr__(self):
+        return '<Metrics %s %s line %d: %d lines, nesting %d, complexity %d, fan-out %d>' % (self.kind,self.qualname or '<module>',self.line_index+1,self.lines,self.nesting,self.complexity,self.fan_out)
+
+statement_lists = frozenset(['body','orelse','finalbody','handlers'])
+match_case_types = (ast.match_case,) if hasattr(ast,'match_case') else () #python 3.10+
+decision_clauses = {
+        (ast.If,CodeClause.BODY),(ast.If,CodeClause.ELIF),
+        (ast.For,CodeClause.BODY),(ast.AsyncFor,CodeClause.BODY),(ast.While,CodeClause.BODY),
+        (ast.ExceptHandler,CodeClause.EXCEPT),
+        }
+
+def own_expressions(astoid):
+    """
+    Returns the ast nodes an astoid evaluates itself: a simple statement as a whole, or the header of a clause (such as the test of an if)
+    The statements of clause bodies are astoids of their own
+    """
+    if astoid.clause is None:
+        return [astoid.ast_node]
+    if astoid.clause in (CodeClause.ELSE,CodeClause.FINALLY):
+        return []
+    expressions = []
+    for name,value in ast.iter_fields(astoid.ast_node):
+        if name in statement_lists:
+            continue
+        for item in (value if isinstance(value,list) else [value]):
+            if isinstance(item,ast.AST):
+                expressions.append(item)
+    return expressions
+
+def dotted_name(node):
+    pieces = []
+    while isinstance(node,ast.Attribute):
+        pieces.append(node.attr)
+        node = node.value
+    if not isinstance(node,ast.Name):
+        return None
+    pieces.append(node.id)
+    return '.'.join(reversed(pieces))
+
+def astoid_decisions(astoid,callees):
+    """
+    Returns the decision points of one astoid and adds the dotted names it calls to callees
+    if/elif, loops and except clauses count one, as do conditional expressions, comprehension loops and conditions
+    and match cases; boolean operators count one per extra operand
+    """
+    decisions = 1 if astoid.type in decision_clauses else 0
+    for expression in own_expressions(astoid):
+        for node in ast.walk(expression):
+            if isinstance(node,ast.BoolOp):
+                decisions += len(node.values)-1
+            elif isinstance(node,ast.IfExp):
+                decisions += 1
+            elif isinstance(node,ast.comprehension):
+                decisions += 1+len(node.ifs)
+            elif isinstance(node,match_case_types):
+                decisions += 1
+            elif isinstance(node,ast.Call):
+                name = dotted_name(node.func)
+                if name is not None:
+                    callees.add(name)
+    return decisions
+
+def is_definition(astoid):
+    return astoid.clause == CodeClause.BODY and isinstance(astoid.ast_node,(ast.FunctionDef,ast.AsyncFunctionDef,ast.ClassDef))
+
+def definition_astoids(def_astoid):
+    """
+    Yields (astoid,depth) for the astoids within a definition, not entering nested definitions
+    depth counts the clauses enclosing an astoid within the definition
+    """
+    stack = [(child,0) for child in reversed(def_astoid.children)]
+    while len(stack) > 0:
+        astoid,depth = stack.pop()
+        yield astoid,depth
+        if is_definition(astoid):
+            continue
+        stack.extend((child,depth+1) for child in reversed(astoid.children))
+
+def block_astoids(block_cnode):
+    """
+    Yields (astoid,depth) for the astoids of a block, with depth counting the clauses of the block enclosing them
+    """
+    depths = {}
+    for astoid in block_cnode.astoids:
+        parent = astoid.parent
+        depth = depths[id(parent)]+1 if parent is not None and id(parent) in depths else 0
+        depths[id(astoid)] = depth
+        yield astoid,depth
+
+def code_line_count(lines):
+    count = 0
+    for line in lines:
+        stripped = line.strip()
+        if stripped != '' and not stripped.startswith('#'):
+            count += 1
+    return count
+
+def cnode_metrics(cnode,qualname,path):
+    """
+    Returns the Metrics of a CnodeDef or CnodeBlock
+    """
+    start,end = line_range(cnode)
+    callees = set()
+    if isinstance(cnode,CnodeDef):
+        kind = type(cnode).__name__[len('Cnode'):].lower()
+        astoids = definition_astoids(cnode.astoids[0])
+        #decorators, arguments and bases are evaluated by the definition itself
+        decisions = astoid_decisions(cnode.astoids[0],callees)
+    else:
+        kind = 'block'
+        astoids = block_astoids(cnode)
+        decisions = 0
+    nesting = 0
+    for astoid,depth in astoids:
+        if is_definition(astoid):
+            continue
+        nesting = max(nesting,depth+(1 if astoid.clause is not None else 0))
+        decisions += astoid_decisions(astoid,callees)
+    return Metrics(path,qualname,kind,start,end-start,code_line_count(cnode.source_lines[start:end]),nesting,1+decisions,tuple(sorted(callees)))
+
+def module_metrics(path):
+    """
+    Returns the Metrics of every function, class and block of the module at path, in source order
+    """
+    module_cnode = parse_module(path)
+    results = []
+    stack = [(child,'') for child in reversed(module_cnode.children)]
+    while len(stack) > 0:
+        cnode,parent_qualname = stack.pop()
+        if isinstance(cnode,CnodeDef):
+            qualname = cnode.name if parent_qualname == '' else parent_qualname+'.'+cnode.name
+        else:
+            qualname = parent_qualname
+        if isinstance(cnode,(CnodeDef,CnodeBlock)) and len(cnode.astoids) > 0:
+            results.append(cnode_metrics(cnode,qualname,path))
+        stack.extend((child,qualname) for child in reversed(cnode.children))
+    return results
+
+def package_metrics(path,workers=None):
+    """
+    Returns the Metrics of every module of a package folder (or of one module file) in package order
+    The modules are measured in a process pool with workers processes; workers=1 measures them in this process
+    """
+    module_paths = package_module_paths(path) if os.path.isdir(path) else [path]
+    if workers == 1 or len(module_paths) < 2:
+        return [metrics for module_path in module_paths for metrics in module_metrics(module_path)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1,len(module_paths)//(4*(workers or os.cpu_count() or 1)))
+        return [metrics for results in executor.map(module_metrics,module_paths,chunksize=chunksize) for metrics in results]
+
+if __name__ == '__main__':
+    results = package_metrics(sys.argv[1])
+    print('%d functions, classes and blocks' % len(results))
+    print('%6s %7s %6s %7s  %s' % ('cc','nesting','lines','fan-out','definition'))
+    definitions = [metrics for metrics in results if metrics.kind != 'block']
+    for metrics in sorted(definitions,key=lambda metrics: -metrics.complexity)[:20]:
+        print('%6d %7d %6d %7d  %s %s:%s' % (metrics.complexity,metrics.nesting,metrics.lines,metrics.fan_out,metrics.kind,os.path.basename(metrics.path),metrics.qualname))
@@ -0,0 +1,151 @@
+""" name_dependencies works out which top-level statements of a module a definition needs, from the names each statement binds and references
+The analysis is static and conservative: a statement is needed if it binds any name that a needed statement loads anywhere within it
+"""
+import parse_cache
+import ast, builtins, os.path
+from bisect import bisect_right
+
+def bound_names(statement):
+    """
+    Returns the names a top-level statement binds in the module namespace, with '*' standing for a star import
+    The bodies of functions and classes are separate scopes and only contribute the name of the definition
+    """
+    names = set()
+    stack = [statement]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node,(ast.FunctionDef,ast.AsyncFunctionDef,ast.ClassDef)):
+            #the body is a separate scope, and decorators, defaults and bases do not bind names
+            names.add(node.name)
+            continue
+        if isinstance(node,(ast.Import,ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == '*':
+                    names.add('*')
+                elif alias.asname is not None:
+                    names.add(alias.asname)
+                else:
+                    names.add(alias.name.split('.')[0])
+            continue
+        if isinstance(node,ast.Name) and isinstance(node.ctx,(ast.Store,ast.Del)):
+            names.add(node.id)
+        elif isinstance(node,ast.ExceptHandler) and node.name is not None:
+            names.add(node.name)
+        stack.extend(ast.iter_child_nodes(node))
+    return names
+
+def root_name(ast_node):
+    """
+    Returns the name at the root of an attribute and subscript chain such as A.b[0].c, or None if it is not rooted at a name
+    """
+    while isinstance(ast_node,(ast.Attribute,ast.Subscript)):
+        ast_node = ast_node.value
+    return ast_node.id if isinstance(ast_node,ast.Name) else None
+
+def mutated_names(statement):
+    """
+    Returns the names whose objects a top-level statement may change without rebinding them:
+    names stored or deleted through an attribute or subscript (A.x = 1, REG['k'] = 1) and names a method is called on (REG.update(...))
+    Function bodies do not run when the statement does and are skipped, but class bodies, decorators and defaults do run
+    """
+    names = set()
+    stack = [statement]
+    while len(stack) > 0:
+        node = stack.pop()
+        for decorator in getattr(node,'decorator_list',[]):
+            #@REG.register calls a method of REG with the definition
+            if isinstance(decorator,ast.Attribute):
+                names.add(root_name(decorator.value))
+        if isinstance(node,(ast.FunctionDef,ast.AsyncFunctionDef,ast.Lambda)):
+            stack.extend(getattr(node,'decorator_list',[]))
+            stack.append(node.args)
+            continue
+        if isinstance(node,(ast.Attribute,ast.Subscript)) and isinstance(node.ctx,(ast.Store,ast.Del)):
+            names.add(root_name(node))
+        elif isinstance(node,ast.Call) and isinstance(node.func,ast.Attribute):
+            names.add(root_name(node.func.value))
+        stack.extend(ast.iter_child_nodes(node))
+    names.discard(None)
+    return names
+
+def referenced_names(ast_node):
+    """
+    Returns every name loaded anywhere within ast_node, including within nested function bodies, which may run later
+    """
+    return {node.id for node in ast.walk(ast_node) if isinstance(node,ast.Name) and isinstance(node.ctx,ast.Load)}
+
+class ModuleDependencies():
+    """
+    Bound and referenced names of the top-level statements of a module
+    A statement that mutates the object of a name (see mutated_names) is needed wherever the name is, as if it bound the name
+    """
+    def __init__(self,ast_module):
+        self.statements = list(ast_module.body)
+        self.bound = [bound_names(statement) | mutated_names(statement) for statement in self.statements]
+        self.referenced = [referenced_names(statement) for statement in self.statements]
+        self.binders = {} #name -> indices of the statements binding or mutating it
+        for index,names in enumerate(self.bound):
+            for name in names:
+                self.binders.setdefault(name,[]).append(index)
+        if 'sys' in self.binders:
+            #imports are found through sys.path, sys.modules and sys.meta_path, so they need the statements changing them
+            for index,statement in enumerate(self.statements):
+                if any(isinstance(node,(ast.Import,ast.ImportFrom)) for node in ast.walk(statement)):
+                    self.referenced[index].add('sys')
+        self.starts = [statement.lineno for statement in self.statements]
+
+    def statement_index(self,ast_node):
+        """
+        Returns the index of the top-level statement containing ast_node
+        """
+        index = bisect_right(self.starts,ast_node.lineno)-1
+        if index < 0 or self.statements[index].end_lineno < ast_node.lineno:
+            raise Exception('Node is not within the module: %s' % repr(ast_node))
+        return index
+
+    def slice(self,roots):
+        """
+        Returns the indices, in source order, of the statements needed to execute the statements at indices roots
+        A name bound by no statement is taken from a star import if there is one, unless it is a builtin
+        """
+        needed = set(roots)
+        stack = list(roots)
+        while len(stack) > 0:
+            index = stack.pop()
+            for name in self.referenced[index]:
+                binders = self.binders.get(name)
+                if binders is None:
+                    if hasattr(builtins,name):
+                        continue
+                    binders = self.binders.get('*',[])
+                for binder in binders:
+                    if binder not in needed:
+                        needed.add(binder)
+                        stack.append(binder)
+        return sorted(needed)
+
+    def slice_statements(self,ast_node):
+        """
+        Returns the top-level statements, in source order, needed to define ast_node
+        """
+        return [self.statements[index] for index in self.slice([self.statement_index(ast_node)])]
+
+def module_dependencies(path):
+    """
+    Returns the ModuleDependencies of the python file at path
+    They are kept with the parse cache entry of the file, so they are reused until the file changes or the entry is evicted
+    """
+    return parse_cache.derived(os.path.abspath(path),'dependencies',lambda source,tree: ModuleDependencies(tree))
+
+def dependency_slice(def_cnode):
+    """
+    Returns the top-level statements a CnodeDef needs, in source order, as (top-level cnode,ast statement) pairs
+    The cnode of a statement is the CnodeBlock or CnodeDef among the module's children that holds it
+    """
+    module_cnode = def_cnode.module
+    dependencies = ModuleDependencies(module_cnode.astoids[0].ast_node)
+    owners = {}
+    for child in module_cnode.children:
+        for astoid in child.astoids:
+            owners[id(astoid.ast_node)] = child
+    return [(owners.get(id(statement)),statement) for statement in dependencies.slice_statements(def_cnode.astoids[0].ast_node)]
@@ -0,0 +1,220 @@
+""" parse_cache shares source text and ast trees between the modules that parse python files
+Entries are held in an in-memory LRU and optionally in an on-disk store, keyed by file path and validated by mtime/size and content hash
+"""
+from collections import OrderedDict
+import ast, io, os, os.path, sys, hashlib, pickle, threading, tempfile, tokenize
+
+class ParseCacheEntry():
+    __slots__ = ('path','mtime_ns','size','digest','python_version','source','tree','derived')
+    def __init__(self,path,mtime_ns,size,digest,source,tree):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.python_version = sys.version
+        self.source = source
+        self.tree = tree
+        self.derived = {} #key -> value computed from source and tree by other modules, see ParseCache.derived
+    def __getstate__(self):
+        #derived values are not written to disk
+        return {name:getattr(self,name) for name in self.__slots__ if name != 'derived'}
+    def __setstate__(self,state):
+        for name,value in state.items():
+            setattr(self,name,value)
+        self.derived = {}
+
+class ParseCache():
+    """
+    Memory LRU of parsed python files with an optional on-disk store under cache_dir
+    A cached entry is reused without reading the file when its mtime and size are unchanged,
+    and reused after reading the file when its content hash is unchanged
+    Disk entries are kept in a directory per interpreter cache tag and are ignored when written by a different python version
+    """
+    def __init__(self,maxsize=256,cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.counts = {'hits':0,'disk_hits':0,'misses':0,'disk_writes':0,'evictions':0}
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['size'] = len(self.entries)
+            lookups = stats['hits']+stats['disk_hits']+stats['misses']
+            stats['hit_rate'] = (stats['hits']+stats['disk_hits'])/lookups if lookups > 0 else 0.0
+            return stats
+    def clear(self,disk=False):
+        with self.lock:
+            self.entries.clear()
+            for key in self.counts:
+                self.counts[key] = 0
+            if disk and self.cache_dir is not None:
+                disk_dir = self._disk_dir()
+                if os.path.isdir(disk_dir):
+                    for filename in os.listdir(disk_dir):
+                        os.remove(os.path.join(disk_dir,filename))
+
+    def discard(self,path):
+        """
+        Drops the in-memory entry for path, e.g. after its ast tree has been modified by the caller
+        """
+        with self.lock:
+            self.entries.pop(os.path.abspath(path),None)
+
+    def load(self,path):
+        """
+        Returns (source,tree) for the python file at path
+        """
+        entry = self._get_entry(path)
+        return entry.source,entry.tree
+    def read_source(self,path):
+        return self._get_entry(path).source
+    def parse_ast(self,path):
+        return self._get_entry(path).tree
+    def digest(self,path):
+        """
+        Returns the sha256 hex digest of the content of the python file at path
+        """
+        return self._get_entry(path).digest
+
+    def derived(self,path,key,build):
+        """
+        Returns a value computed by build(source,tree) for the python file at path, kept with its entry under key
+        It is computed again once the file changes, and is dropped along with the entry when the LRU evicts it
+        """
+        entry = self._get_entry(path)
+        with self.lock:
+            if key in entry.derived:
+                return entry.derived[key]
+        value = build(entry.source,entry.tree)
+        with self.lock:
+            return entry.derived.setdefault(key,value)
+
+    def _get_entry(self,path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self.entries.move_to_end(path)
+                self.counts['hits'] += 1
+                return entry
+        data = None
+        digest = None
+        if entry is not None:
+            data = _read_bytes(path)
+            digest = hashlib.sha256(data).hexdigest()
+            if digest == entry.digest:
+                #touched but unchanged
+                with self.lock:
+                    entry.mtime_ns = stat.st_mtime_ns
+                    entry.size = stat.st_size
+                    self._remember(entry)
+                    self.counts['hits'] += 1
+                return entry
+        disk_entry = self._disk_read(path)
+        if disk_entry is not None and (disk_entry.mtime_ns != stat.st_mtime_ns or disk_entry.size != stat.st_size):
+            if data is None:
+                data = _read_bytes(path)
+                digest = hashlib.sha256(data).hexdigest()
+            if digest == disk_entry.digest:
+                disk_entry.mtime_ns = stat.st_mtime_ns
+                disk_entry.size = stat.st_size
+                self._disk_write(disk_entry)
+            else:
+                disk_entry = None
+        if disk_entry is not None:
+            with self.lock:
+                self.counts['disk_hits'] += 1
+                self._remember(disk_entry)
+            return disk_entry
+        if data is None:
+            data = _read_bytes(path)
+            digest = hashlib.sha256(data).hexdigest()
+        source = _decode(data)
+        tree = ast.parse(source,filename=path)
+        entry = ParseCacheEntry(path,stat.st_mtime_ns,stat.st_size,digest,source,tree)
+        with self.lock:
+            self.counts['misses'] += 1
+            self._remember(entry)
+        self._disk_write(entry)
+        return entry
+    def _remember(self,entry):
+        self.entries[entry.path] = entry
+        self.entries.move_to_end(entry.path)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.counts['evictions'] += 1
+
+    def _disk_dir(self):
+        return os.path.join(self.cache_dir,sys.implementation.cache_tag or 'python')
+    def _disk_path(self,path):
+        return os.path.join(self._disk_dir(),hashlib.sha256(path.encode('utf-8')).hexdigest()+'.pickle')
+    def _disk_read(self,path):
+        if self.cache_dir is None:
+            return None
+        disk_path = self._disk_path(path)
+        try:
+            with open(disk_path,'rb') as f:
+                entry = pickle.load(f)
+        except (OSError,EOFError,pickle.UnpicklingError,AttributeError,ValueError):
+            return None
+        if not isinstance(entry,ParseCacheEntry) or entry.path != path or entry.python_version != sys.version:
+            return None
+        return entry
+    def _disk_write(self,entry):
+        if self.cache_dir is None:
+            return
+        disk_dir = self._disk_dir()
+        os.makedirs(disk_dir,exist_ok=True)
+        fd,tmp_path = tempfile.mkstemp(dir=disk_dir,suffix='.tmp')
+        try:
+            with os.fdopen(fd,'wb') as f:
+                pickle.dump(entry,f,protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path,self._disk_path(entry.path))
+        except (OSError,RecursionError,pickle.PicklingError):
+            #extremely deep trees cannot be pickled - they are still cached in memory
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self.lock:
+            self.counts['disk_writes'] += 1
+
+def _read_bytes(path):
+    with open(path,'rb') as f:
+        return f.read()
+def _decode(data):
+    #same decoding and newline translation as tokenize.open(path)
+    buffer = io.BytesIO(data)
+    encoding = tokenize.detect_encoding(buffer.readline)[0]
+    buffer.seek(0)
+    return io.TextIOWrapper(buffer,encoding).read()
+
+default_cache = ParseCache(cache_dir=os.environ.get('SOURCETOOLS_CACHE_DIR'))
+
+def configure(maxsize=None,cache_dir=...):
+    """
+    Changes the size of the shared memory LRU and/or the on-disk cache directory (None disables the disk store)
+    """
+    with default_cache.lock:
+        if maxsize is not None:
+            default_cache.maxsize = maxsize
+        if cache_dir is not ...:
+            default_cache.cache_dir = cache_dir
+def load(path):
+    return default_cache.load(path)
+def read_source(path):
+    return default_cache.read_source(path)
+def parse_ast(path):
+    return default_cache.parse_ast(path)
+def digest(path):
+    return default_cache.digest(path)
+def derived(path,key,build):
+    return default_cache.derived(path,key,build)
+def discard(path):
+    default_cache.discard(path)
+def cache_stats():
+    return default_cache.stats()
+def clear_cache(disk=False):
+    default_cache.clear(disk)
@@ -0,0 +1,350 @@
+""" project_layout analyses a whole source tree: the import graph between its modules, built from their cnode trees,
+and where the import time of a module goes, measured in fresh interpreters and attributed to top-level cnodes
+"""
+from cnode import cnode_load, package_items, CnodeModule
+from symbol_index import SymbolIndex
+import ast, os, os.path, sys, subprocess, tempfile, tokenize
+
+class ImportEdge():
+    """
+    One import of target (a module name) by the module importer
+    cnode is the top-level cnode of importer holding the import statement
+    deferred is True when the import sits within a function body and so does not run when importer is imported
+    """
+    __slots__ = ('importer','target','names','lineno','cnode','deferred')
+    def __init__(self,importer,target,names,lineno,cnode,deferred):
+        self.importer = importer
+        self.target = target
+        self.names = names
+        self.lineno = lineno
+        self.cnode = cnode
+        self.deferred = deferred
+    def __repr__(self):
+        return '<ImportEdge %s -> %s line %d%s>' % (self.importer,self.target,self.lineno,' (deferred)' if self.deferred else '')
+
+class ImportGraph():
+    """
+    Import graph of the modules of one or more package folders, module files or folders of them (such as a src folder)
+    modules maps module names to their CnodeModule and edges maps module names to the ImportEdges of their import statements
+    Edges are kept for imports of modules outside of the project as well
+    """
+    def __init__(self,*paths):
+        self.roots = []
+        self.modules = {} #module name -> CnodeModule
+        self.packages = set() #module names of packages
+        for path in paths:
+            if os.path.isdir(path) and not os.path.exists(os.path.join(path,'__init__.py')):
+                #a folder holding top-level packages and modules
+                for item_path in package_items(path):
+                    self._add_root(cnode_load(item_path))
+            else:
+                self._add_root(cnode_load(path))
+        self.edges = {module_name:module_imports(module_name,module_cnode,module_name in self.packages,self.modules) for module_name,module_cnode in self.modules.items()}
+        self.importer_edges = {}
+        for edges in self.edges.values():
+            for edge in edges:
+                self.importer_edges.setdefault(edge.target,[]).append(edge)
+    def _add_root(self,root_cnode):
+        self.roots.append(root_cnode)
+        index = SymbolIndex(root_cnode)
+        for cnode in root_cnode.subtree():
+            if isinstance(cnode,CnodeModule):
+                module_name = index.module_fqn(cnode)
+                self.modules[module_name] = cnode
+                if os.path.basename(cnode.path) == '__init__.py':
+                    self.packages.add(module_name)
+
+    def imports(self,module_name,deferred=False):
+        """
+        Returns the names of the modules imported by module_name, leaving out imports within functions unless deferred is True
+        """
+        return sorted({edge.target for edge in self.edges.get(module_name,[]) if deferred or not edge.deferred})
+    def importers(self,module_name,deferred=False):
+        return sorted({edge.importer for edge in self.importer_edges.get(module_name,[]) if deferred or not edge.deferred})
+    def dependencies(self,module_name,internal=True):
+        """
+        Returns the names of all modules that importing module_name imports directly or indirectly, within the project only if internal is True
+        Importing a submodule imports its parent packages first, so those are included as well
+        """
+        seen = set()
+        stack = [module_name]
+        while len(stack) > 0:
+            name = stack.pop()
+            for target in self.imports(name)+parent_packages(name):
+                if target not in seen and (not internal or target in self.modules):
+                    seen.add(target)
+                    stack.append(target)
+        seen.discard(module_name)
+        return sorted(seen)
+    def external(self):
+        """
+        Returns the top-level names of the modules imported from outside of the project
+        """
+        return sorted({edge.target.split('.')[0] for edges in self.edges.values() for edge in edges if edge.target not in self.modules and edge.target.split('.')[0] not in self.modules})
+    def cycles(self):
+        """
+        Returns the groups of project modules that import each other at module level (strongly connected components of more than one module)
+        """
+        index_of = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        groups = []
+        counter = 0
+        for start in sorted(self.modules):
+            if start in index_of:
+                continue
+            #iterative Tarjan
+            work = [(start,iter(self.imports(start)))]
+            index_of[start] = lowlink[start] = counter
+            counter += 1
+            stack.append(start)
+            on_stack.add(start)
+            while len(work) > 0:
+                name,targets = work[-1]
+                advanced = False
+                for target in targets:
+                    if target not in self.modules:
+                        continue
+                    if target not in index_of:
+                        index_of[target] = lowlink[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack.add(target)
+                        work.append((target,iter(self.imports(target))))
+                        advanced = True
+                        break
+                    elif target in on_stack:
+                        lowlink[name] = min(lowlink[name],index_of[target])
+                if advanced:
+                    continue
+                work.pop()
+                if len(work) > 0:
+                    lowlink[work[-1][0]] = min(lowlink[work[-1][0]],lowlink[name])
+                if lowlink[name] == index_of[name]:
+                    group = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        group.append(member)
+                        if member == name:
+                            break
+                    if len(group) > 1:
+                        groups.append(sorted(group))
+        return groups
+
+    def profile(self,module_name,python=None,sys_path=None):
+        """
+        Imports module_name in a fresh interpreter with -X importtime and returns its ImportProfile
+        """
+        return ImportProfile(self,module_name,import_times(module_name,python,sys_path if sys_path is not None else self.sys_path()))
+    def block_times(self,module_name,python=None,sys_path=None):
+        """
+        Executes the top-level cnodes of a project module one at a time in a fresh interpreter and returns [(cnode,seconds)]
+        """
+        return block_times(self.modules[module_name],module_name,module_name in self.packages,python,sys_path if sys_path is not None else self.sys_path())
+    def sys_path(self):
+        #folders the roots are importable from, ahead of the current sys.path
+        folders = []
+        for root_cnode in self.roots:
+            folder = os.path.dirname(os.path.abspath(os.path.normpath(root_cnode.path)))
+            if folder not in folders:
+                folders.append(folder)
+        return folders+[path for path in sys.path if path not in folders]
+
+def parent_packages(module_name):
+    pieces = module_name.split('.')
+    return ['.'.join(pieces[:i]) for i in range(1,len(pieces))]
+
+def module_imports(module_name,module_cnode,is_package,modules=()):
+    """
+    Returns the ImportEdges of every import statement of a module, resolving relative imports against its package
+    For 'from x import y' the target is the submodule x.y when the project has one, and x otherwise
+    """
+    if len(module_cnode.astoids) == 0:
+        return []
+    owners = {}
+    for child in module_cnode.children:
+        for astoid in child.astoids:
+            owners[id(astoid.ast_node)] = child
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    edges = []
+    stack = [(statement,owners.get(id(statement)),False) for statement in reversed(module_cnode.astoids[0].ast_node.body)]
+    while len(stack) > 0:
+        node,cnode,deferred = stack.pop()
+        if isinstance(node,ast.Import):
+            for alias in node.names:
+                edges.append(ImportEdge(module_name,alias.name,[],node.lineno,cnode,deferred))
+        elif isinstance(node,ast.ImportFrom):
+            base = import_base(package,node)
+            names = [alias.name for alias in node.names]
+            submodules = [base+'.'+name for name in names if base+'.'+name in modules]
+            for target in submodules:
+                edges.append(ImportEdge(module_name,target,[target.rpartition('.')[2]],node.lineno,cnode,deferred))
+            if len(submodules) < len(names):
+                edges.append(ImportEdge(module_name,base,[name for name in names if base+'.'+name not in modules],node.lineno,cnode,deferred))
+        else:
+            inner_deferred = deferred or isinstance(node,(ast.FunctionDef,ast.AsyncFunctionDef,ast.Lambda))
+            stack.extend((child,cnode,inner_deferred) for child in reversed(list(ast.iter_child_nodes(node))))
+    return edges
+
+def import_base(package,node):
+    """
+    Returns the absolute name of the module an ast.ImportFrom imports from, for a module within package
+    """
+    if node.level == 0:
+        return node.module or ''
+    anchor = package.split('.') if package else []
+    if node.level > 1:
+        anchor = anchor[:len(anchor)-(node.level-1)]
+    return '.'.join(anchor+([node.module] if node.module else []))
+
+def import_times(module_name,python=None,sys_path=None):
+    """
+    Imports module_name in a fresh interpreter with -X importtime
+    Returns a list of (module name,self microseconds,cumulative microseconds,depth) in the order python reports them:
+    a module follows the modules it imported, which have a depth one greater
+    """
+    env = dict(os.environ)
+    if sys_path is not None:
+        env['PYTHONPATH'] = os.pathsep.join(path for path in sys_path if path)
+    process = subprocess.run([python or sys.executable,'-X','importtime','-c','import %s' % module_name],capture_output=True,text=True,env=env)
+    if process.returncode != 0:
+        raise Exception('Importing %s failed:\n%s' % (module_name,'\n'.join(line for line in process.stderr.splitlines() if not line.startswith('import time:'))))
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us,cumulative_us,name_field = line[len('import time:'):].split('|')
+        name = name_field[1:]
+        depth = (len(name)-len(name.lstrip()))//2
+        times.append((name.strip(),int(self_us),int(cumulative_us),depth))
+    return times
+
+class ImportProfile():
+    """
+    Import times of a module and everything it imports, attributed to the top-level cnodes of the project modules
+    times maps module names to (self microseconds,cumulative microseconds), children maps module names to the modules first imported while they ran
+    """
+    def __init__(self,graph,module_name,times):
+        self.graph = graph
+        self.module_name = module_name
+        self.times = {}
+        self.children = {}
+        pending = {} #depth -> names waiting for their importer
+        for name,self_us,cumulative_us,depth in times:
+            self.times[name] = (self_us,cumulative_us)
+            self.children[name] = pending.pop(depth+1,[])
+            pending.setdefault(depth,[]).append(name)
+    def slowest(self,count=10,internal=False):
+        """
+        Returns the (module name,cumulative microseconds) of the modules with the largest cumulative import time
+        """
+        names = [name for name in self.times if not internal or name in self.graph.modules]
+        return sorted(((name,self.times[name][1]) for name in names),key=lambda item: -item[1])[:count]
+    def attribute(self,module_name):
+        """
+        Splits the cumulative import time of a project module between its top-level cnodes
+        Returns [(cnode,microseconds)] where each cnode is charged with the modules first imported by its import statements;
+        the module's own time (self) is charged to None, as are imports that no import statement accounts for
+        """
+        edges = [edge for edge in self.graph.edges.get(module_name,[]) if not edge.deferred]
+        charges = {}
+        order = []
+        def charge(cnode,microseconds):
+            if id(cnode) not in charges:
+                charges[id(cnode)] = [cnode,0]
+                order.append(id(cnode))
+            charges[id(cnode)][1] += microseconds
+        charge(None,self.times.get(module_name,(0,0))[0])
+        for child in self.children.get(module_name,[]):
+            owner = None
+            for edge in edges:
+                if edge.target == child or edge.target.startswith(child+'.'):
+                    owner = edge.cnode
+                    break
+            charge(owner,self.times[child][1])
+        return [tuple(charges[key]) for key in order]
+
+_block_timer = '''
+import sys, time, os
+path, module_name, is_package, encoding, ranges, times_path = sys.argv[1:7]
+module = type(sys)(module_name)
+module.__file__ = path
+module.__package__ = module_name if is_package == '1' else module_name.rpartition('.')[0]
+if is_package == '1':
+    module.__path__ = [os.path.dirname(path)]
+parent = module_name.rpartition('.')[0]
+if parent:
+    __import__(parent)
+sys.modules[module_name] = module
+with open(path, encoding=encoding) as f:
+    lines = f.read().split('\\n')
+#timings go to their own file, apart from whatever the module writes to stdout
+with open(times_path, 'w') as times:
+    for item in ranges.split(','):
+        start, end = [int(value) for value in item.split(':')]
+        code = compile('\\n'*start+'\\n'.join(lines[start:end]), path, 'exec')
+        began = time.perf_counter()
+        exec(code, module.__dict__)
+        times.write('%d %r\\n' % (start, time.perf_counter()-began))
+'''
+
+def block_times(module_cnode,module_name,is_package=False,python=None,sys_path=None):
+    """
+    Executes the top-level statements of a module one at a time in a fresh interpreter, in the module's own namespace,
+    and returns [(cnode,seconds)] for its top-level cnodes; the time of a cnode includes the imports its statements trigger
+    A compound statement (e.g. a try whose except clause holds a definition) runs as a whole and is charged to the cnode
+    of its first line, so cnodes that only hold parts of such a statement are charged nothing
+    """
+    children = [child for child in module_cnode.children if child.line_index is not None]
+    if len(children) == 0 or len(module_cnode.astoids) == 0:
+        return []
+    owners = {}
+    for child in children:
+        for astoid in child.astoids:
+            owners.setdefault(id(astoid.ast_node),child)
+    ranges = [] #[start,end,owner] of each top-level statement, merging statements that share a line
+    for statement in module_cnode.astoids[0].ast_node.body:
+        start = min([statement.lineno]+[decorator.lineno for decorator in getattr(statement,'decorator_list',[])])-1
+        if len(ranges) > 0 and start < ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1],statement.end_lineno)
+        else:
+            ranges.append([start,statement.end_lineno,owners.get(id(statement))])
+    with open(module_cnode.path,'rb') as f:
+        encoding = tokenize.detect_encoding(f.readline)[0]
+    env = dict(os.environ)
+    if sys_path is not None:
+        env['PYTHONPATH'] = os.pathsep.join(path for path in sys_path if path)
+    fd,times_path = tempfile.mkstemp(suffix='.times')
+    os.close(fd)
+    try:
+        process = subprocess.run([python or sys.executable,'-c',_block_timer,os.path.abspath(module_cnode.path),module_name,'1' if is_package else '0',encoding,
+                ','.join('%d:%d' % (start,end) for start,end,owner in ranges),times_path],
+                capture_output=True,text=True,env=env)
+        if process.returncode != 0:
+            raise Exception('Executing %s failed:\n%s' % (module_name,process.stderr))
+        with open(times_path) as f:
+            times = f.read()
+    finally:
+        os.remove(times_path)
+    seconds = {}
+    for line in times.splitlines():
+        start,elapsed = line.split()
+        seconds[int(start)] = float(elapsed)
+    charges = {id(child):0.0 for child in children}
+    for start,end,owner in ranges:
+        if owner is not None:
+            charges[id(owner)] += seconds.get(start,0.0)
+    return [(child,charges[id(child)]) for child in children]
+
+if __name__ == '__main__':
+    graph = ImportGraph(sys.argv[1])
+    module_name = sys.argv[2]
+    profile = graph.profile(module_name)
+    print('slowest imports of %s' % module_name)
+    for name,cumulative_us in profile.slowest():
+        print('%10.1f ms  %s' % (cumulative_us/1000,name))
+    print('top-level cnodes of %s' % module_name)
+    for cnode,seconds in graph.block_times(module_name):
+        print('%10.1f ms  %s' % (seconds*1000,cnode))
@@ -0,0 +1,205 @@
+""" source_buffer holds source text as one string with an index of line start offsets
+It stands in for the list of lines from str.splitlines(keepends=True) without copying every line up front
+A SourceBuffer can also be backed by a read-only memory map of a file, in which case lines are decoded only when accessed
+"""
+from array import array
+from collections import OrderedDict
+import mmap, re, threading, tokenize, weakref
+
+max_open_maps = 64 #memory maps held open at once, each holding a file descriptor; the least recently used are closed and reopened on access
+_open_maps = OrderedDict() #id(buffer) -> weak reference to a mapped SourceBuffer whose map is open, least recently used first
+_maps_lock = threading.RLock() #guards _open_maps and every access to a map, which another thread may close
+_lone_cr = re.compile(b'\r(?!\n)')
+
+def line_offsets(text,start=0):
+    """
+    Returns an array of the offsets at which each line of text starts, followed by len(text)
+    Lines end at '\\n' only, which matches the line numbering of the tokenizer and ast
+    text may also be bytes or a memory map, giving byte offsets
+    """
+    newline = '\n' if isinstance(text,str) else b'\n'
+    offsets = array('q',[start])
+    find = text.find
+    position = find(newline,start)
+    while position != -1:
+        offsets.append(position+1)
+        position = find(newline,position+1)
+    if offsets[-1] != len(text):
+        offsets.append(len(text))
+    return offsets
+
+class SourceBuffer():
+    """
+    Sequence of the lines of a source text, each including its line ending
+    Indexing with an int returns one line; slicing returns a LineSpan view that copies nothing until its text is requested
+    """
+    def __init__(self,text,offsets=None):
+        self.text = text
+        self.path = None #file of the memory map backing the buffer when created by map_file
+        self._data = None #that memory map while it is open
+        self.encoding = None
+        self.offsets = line_offsets(text) if offsets is None else offsets
+    @classmethod
+    def map_file(cls,path):
+        """
+        Maps the python file at path into memory instead of reading it
+        The text is never decoded as a whole: lines are decoded with the file's PEP 263 encoding as they are accessed,
+        text is None and offsets/spans are byte offsets into the file
+        At most max_open_maps maps are open at a time, so that mapping every module of a large package does not exhaust
+        file descriptors; a buffer whose map was closed maps the file again when its lines are next read
+        Files with lone '\r' line endings, which the tokenizer counts as line ends but the byte offsets would not, are read as text instead
+        """
+        with open(path,'rb') as f:
+            if f.seek(0,2) == 0:
+                #empty files cannot be mapped
+                return cls('')
+        buffer = cls.__new__(cls)
+        buffer.text = None
+        buffer.path = path
+        buffer._data = None
+        with _maps_lock:
+            data = buffer._map()
+            if _lone_cr.search(data) is not None:
+                buffer._close_map()
+                with tokenize.open(path) as f:
+                    return cls(f.read())
+            encoding = tokenize.detect_encoding(data.readline)[0]
+            start = 0
+            if encoding == 'utf-8-sig':
+                #skip the byte order mark
+                encoding = 'utf-8'
+                start = 3
+            buffer.encoding = encoding
+            buffer.offsets = line_offsets(data,start)
+        return buffer
+    def _map(self):
+        #the open memory map of a mapped buffer, mapping the file again if it was closed; call with _maps_lock held
+        if self._data is None:
+            with open(self.path,'rb') as f:
+                self._data = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            if hasattr(self,'offsets') and len(self._data) != self.offsets[-1]:
+                self._close_map()
+                raise Exception('Mapped file changed size since it was parsed: %s' % self.path)
+        key = id(self)
+        if key in _open_maps:
+            _open_maps.move_to_end(key)
+        else:
+            _open_maps[key] = weakref.ref(self)
+            while len(_open_maps) > max_open_maps:
+                buffer = _open_maps.popitem(last=False)[1]()
+                if buffer is not None:
+                    buffer._data.close()
+                    buffer._data = None
+        return self._data
+    def _close_map(self):
+        with _maps_lock:
+            if self._data is not None:
+                self._data.close()
+                self._data = None
+            _open_maps.pop(id(self),None)
+    def read_bytes(self):
+        """
+        Returns the bytes of a mapped file as a whole, e.g. for ast.parse
+        """
+        with _maps_lock:
+            return self._map()[:]
+    def reset(self,text,offsets=None):
+        """
+        Replaces the contents in place, so every astoid and cnode sharing this buffer sees the new text
+        """
+        if isinstance(text,SourceBuffer):
+            text,offsets = text.get_text(),(text.offsets if text.path is None else None)
+        if self.path is not None:
+            self._close_map()
+        self.text = text
+        self.path = None
+        self.encoding = None
+        self.offsets = line_offsets(text) if offsets is None else offsets
+    def __getstate__(self):
+        #mapped buffers are pickled as their decoded text
+        if self.path is not None:
+            return {'text':self.get_text(),'offsets':None}
+        return {'text':self.text,'offsets':self.offsets}
+    def __setstate__(self,state):
+        self.path = None
+        self._data = None
+        self.reset(state['text'],state['offsets'])
+
+    def __len__(self):
+        return len(self.offsets)-1
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            start,stop,step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start,stop,step)]
+            return LineSpan(self,start,max(start,stop))
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('line index out of range')
+        if self.path is not None:
+            return self._decode(self.offsets[index],self.offsets[index+1])
+        return self.text[self.offsets[index]:self.offsets[index+1]]
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    def __eq__(self,other):
+        if isinstance(other,SourceBuffer) and self.path is None and other.path is None:
+            return self.text == other.text
+        return list(self) == list(other)
+    __hash__ = None
+    def __repr__(self):
+        return '<SourceBuffer: %d lines%s>' % (len(self),', mapped' if self.path is not None else '')
+
+    def span(self,start_line=0,end_line=None):
+        """
+        Returns the (start,end) character offsets (byte offsets when mapped) of lines start_line up to but not including end_line
+        """
+        if end_line is None or end_line > len(self):
+            end_line = len(self)
+        return (self.offsets[start_line],self.offsets[end_line])
+    def get_text(self,start_line=0,end_line=None):
+        start,end = self.span(start_line,end_line)
+        if self.path is not None:
+            return self._decode(start,end)
+        return self.text[start:end]
+    def _decode(self,start,end):
+        #same newline translation as reading the file in text mode
+        with _maps_lock:
+            data = self._map()[start:end]
+        return str(data,self.encoding).replace('\r\n','\n')
+
+class LineSpan():
+    """
+    View onto a contiguous run of lines of a SourceBuffer
+    """
+    __slots__ = ('buffer','start','stop')
+    def __init__(self,buffer,start,stop):
+        self.buffer = buffer
+        self.start = start
+        self.stop = stop
+    def __len__(self):
+        return self.stop-self.start
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            start,stop,step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start,stop,step)]
+            return LineSpan(self.buffer,self.start+start,self.start+max(start,stop))
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('line index out of range')
+        return self.buffer[self.start+index]
+    def __iter__(self):
+        for index in range(self.start,self.stop):
+            yield self.buffer[index]
+    def __eq__(self,other):
+        return list(self) == list(other)
+    __hash__ = None
+    def __repr__(self):
+        return repr(list(self))
+    def span(self):
+        return self.buffer.span(self.start,self.stop)
+    def get_text(self):
+        return self.buffer.get_text(self.start,self.stop)
@@ -1,44 +1,29 @@
-import ast, os, os.path, inspect
-from importlib.util import find_spec
-from enum import Enumeration
-
-class NoTargetError(Exception): pass
+import ast, os, os.path, inspect, types, asyncio
+import parse_cache
+from parse_cache import parse_ast as ast_parse
+from target_resolver import split_target, NoTargetError
+from name_dependencies import module_dependencies
 
 def resolve(target,path=None):
-    orig_cwd = os.getcwd() 
-    try:
-        if path is not None:
-            os.chdir(path)
-
-        outer_target_list = target.split('.')
-        inner_target_list = []
-        spec = None
-        while len(outer_target_list) > 0:
-            spec = find_spec('.'.join(outer_target_list))
-            if spec is not None:
-                break
-            else:
-                inner_target_list.insert(0,outer_target_list.pop(-1))
-        if spec is None:
-            raise NoTargetError('Target %s could not be found' % target)
-    finally:
-        if path is not None:
-            os.chdir(orig_cwd)
-    outer_target_list = outer_target_list
-    inner_target_list = inner_target_list
+    """
+    Returns the runner object for a dotted target name without importing anything
+    path, if given, is searched for top-level packages and modules before sys.path
+    """
+    module_name,spec,inner_target_list = split_target(target,path)
 
-    #self.spec is defined
-    #self.outer_target_list is the portion of the target path composed of package and module names
-    #self.inner_target_list is the portion of the target path composed of class and function names
+    #module_name is the portion of the target path composed of package and module names
+    #inner_target_list is the portion of the target path composed of class and function names
 
-    if self.spec.origin.lower().endswith('__init__.py'):
+    if spec.submodule_search_locations is not None and len(inner_target_list) == 0:
         #package
         return Package(target,spec)
-    elif len(self.inner_target_list) == 0:
+    elif len(inner_target_list) == 0:
         #module
         return Module(target,spec)
     else:
-        ast_node,ast_lineage = ast_get(spec.origin,inner_target_list)
+        if spec.origin is None or not os.path.exists(spec.origin):
+            raise NoTargetError('Target %s is not defined in python source' % target)
+        ast_node,ast_lineage = ast_code_get(spec.origin,inner_target_list)
         if ast_node is None:
             raise NoTargetError('Target %s could not be found' % target)
         
@@ -47,47 +32,125 @@ def resolve(target,path=None):
         elif isinstance(ast_node,ast.ClassDef):
             return Class(target,spec,ast_node,ast_lineage)
         elif isinstance(ast_node,ast.AsyncFunctionDef):
-            return AsyncFunctionDef(target,spec,ast_node,ast_lineage)
+            return AsyncFunction(target,spec,ast_node,ast_lineage)
         else:
             raise Exception('Unexpected ast node type: %s' % repr(ast_node))
 
+code_node_types = (ast.ClassDef,ast.FunctionDef,ast.AsyncFunctionDef)
+statement_types = (ast.stmt,ast.excepthandler)+((ast.match_case,) if hasattr(ast,'match_case') else ())
+
+def ast_walk(ast_node):
+    """
+    Walks the statements of an ast tree in source order, yielding (ast_lineage,nodes) for each of them
+    ast_lineage is the list of nodes from ast_node down to the statement
+    nodes is the list of statements directly within the statement that will be walked next - clearing it prunes the walk
+    """
+    stack = [[ast_node]]
+    while len(stack) > 0:
+        ast_lineage = stack.pop()
+        nodes = []
+        for field,value in ast.iter_fields(ast_lineage[-1]):
+            if isinstance(value,list):
+                nodes.extend(node for node in value if isinstance(node,statement_types))
+        yield ast_lineage,nodes
+        for node in reversed(nodes):
+            stack.append(ast_lineage+[node])
+
+def get_code_ast_lineage(ast_lineage):
+    """
+    Returns the names of the classes and functions within an ast lineage
+    """
+    return [node.name for node in ast_lineage if isinstance(node,code_node_types)]
 
 def ast_code_get(origin,inner_target_list):
     """
     Gets an ast object representing the provided code context lineage in inner_target_list
     origin is the source code file
+    Returns (ast node,ast lineage) or (None,None) if there is no such definition
     """
-    ast_module = ast_parse(origin)
-    for ast_lineage,nodes in ast_walk(ast_module):
-        code_ast_lineage = get_code_ast_lineage(ast_lineage)
-        ast_lineage_len = len(code_ast_lineage)
-        if inner_target_list[:ast_lineage_len] == code_ast_lineage:
-            if len(inner_target_list) == ast_lineage_len:
-                return ast_lineage[-1],ast_lineage[:-1]
-        else:
-            del nodes[:] #do not further traverse this path
-    return None,None
+    return ast_code_tree(origin).get(tuple(inner_target_list),(None,None))
 
-def ast_code_tree(origin):
+def build_code_tree(ast_module):
+    """
+    Maps the name tuple of every class and function in an ast tree to (ast node,ast lineage) in a single traversal
+    The ast lineage holds the module, class and function nodes enclosing the definition, outermost first
+    Definitions within blocks (if, try, ...) are named as if the block were not there, and a name that is defined
+    more than once maps to its last definition, as it would at runtime
+
+    >>> code_tree = build_code_tree(ast.parse('''
+    ... class A():
+    ...     class B():
+    ...         async def f(self):
+    ...             pass
+    ...     def g(self):
+    ...         async def h():
+    ...             pass
+    ... if True:
+    ...     async def k():
+    ...         pass
+    ... '''))
+    >>> sorted('.'.join(name) for name in code_tree)
+    ['A', 'A.B', 'A.B.f', 'A.g', 'A.g.h', 'k']
+    >>> ast_node,ast_lineage = code_tree[('A','B','f')]
+    >>> type(ast_node).__name__, [type(node).__name__ for node in ast_lineage]
+    ('AsyncFunctionDef', ['Module', 'ClassDef', 'ClassDef'])
+    >>> [node.name for node in code_tree[('A','g','h')][1][1:]]
+    ['A', 'g']
+    >>> [type(node).__name__ for node in code_tree[('k',)][1]]
+    ['Module']
+    """
     code_tree = {}
-    ast_module = ast_parse(origin)
     for ast_lineage,nodes in ast_walk(ast_module):
-        code_ast_lineage = tuple(get_code_ast_lineage(ast_lineage))
-        code_ast_lineages.add(code_ast_line
-        ast_lineage_len = len(code_ast_lineage)
-        if inner_target_list[:ast_lineage_len] == code_ast_lineage:
-            if len(inner_target_list) == ast_lineage_len:
-                return ast_lineage[-1],ast_lineage[:-1]
-        else:
-            del nodes[:] #do not further traverse this path
-    return None,None
+        ast_node = ast_lineage[-1]
+        if isinstance(ast_node,code_node_types):
+            code_lineage = [node for node in ast_lineage[:-1] if isinstance(node,(ast.Module,)+code_node_types)]
+            code_tree[tuple(get_code_ast_lineage(ast_lineage))] = (ast_node,code_lineage)
+    return code_tree
+
+def ast_code_tree(origin):
+    """
+    Returns the code tree of the python file origin (see build_code_tree)
+    The code tree is kept with the parse cache entry of the file, so it is reused until the file changes or the entry is evicted
+    """
+    return parse_cache.derived(os.path.abspath(origin),'code_tree',lambda source,ast_module: build_code_tree(ast_module))
 
 class SourceRunner():
+    """
+    Compiles and executes a package, module, class or function target from its source
+    Compiled code is kept per target with the parse cache entry of the file, so running an unchanged target again skips parsing and compiling
+    """
     def __init__(self,target,spec,ast_node,ast_lineage):
         self.target = target
         self.spec = spec
         self.ast_node = ast_node
         self.ast_lineage = ast_lineage
+    def statements(self):
+        """
+        Returns the top-level statements of the module that are executed for this target
+        """
+        return self.ast_lineage[0].body if len(self.ast_lineage) > 0 else self.ast_node.body
+    def compile(self):
+        return parse_cache.derived(self.spec.origin,('code',self.target),
+                lambda source,ast_module: compile(ast.Module(body=list(self.statements()),type_ignores=[]),self.spec.origin,'exec'))
+    def new_module(self):
+        module = types.ModuleType(self.spec.name)
+        module.__file__ = self.spec.origin
+        if self.spec.submodule_search_locations is not None:
+            module.__path__ = list(self.spec.submodule_search_locations)
+            module.__package__ = self.spec.name
+        else:
+            module.__package__ = self.spec.parent
+        module.__spec__ = self.spec
+        return module
+    def load(self):
+        """
+        Executes the compiled code in a new module object, which is not added to sys.modules, and returns the target object
+        """
+        module = self.new_module()
+        exec(self.compile(),module.__dict__)
+        return module
+    def run(self,*args,**kwargs):
+        return self.load()
 class OuterRunner(SourceRunner):
     """
     SourceRunner object for a package or a module
@@ -101,6 +164,8 @@ class OuterRunner(SourceRunner):
 class InnerRunner(SourceRunner):
     """
     SourceRunner object for a function, class, or async function
+    Only the top-level statement containing the target and the top-level statements binding the names it depends on
+    (see name_dependencies) are executed, so that the module's other top-level code does not run
     """
     def __init__(self,target,spec,ast_node,ast_lineage):
         target = target
@@ -108,18 +173,34 @@ class InnerRunner(SourceRunner):
         ast_node = ast_node
         ast_lineage = ast_lineage
         super().__init__(target,spec,ast_node,ast_lineage)
+    def statements(self):
+        return module_dependencies(self.spec.origin).slice_statements(self.ast_node)
+    def load(self):
+        obj = super().load()
+        for ast_node in self.ast_lineage[1:]+[self.ast_node]:
+            if not isinstance(obj,(types.ModuleType,type)):
+                raise NoTargetError('Target %s is local to a function and cannot be loaded' % self.target)
+            obj = getattr(obj,ast_node.name)
+        return obj
 class Package(OuterRunner):
     ...
-class Module(SourceRunner):
+class Module(OuterRunner):
     ...
 class Class(InnerRunner):
-    ...
+    def run(self,*args,**kwargs):
+        """
+        Loads the class and returns an instance created with the given arguments
+        """
+        return self.load()(*args,**kwargs)
 class Function(InnerRunner):
-    ...
-class AsyncFUnction(InnerRunner):
-    ...
-
-
-
-
-
+    def run(self,*args,**kwargs):
+        """
+        Loads the function and returns the result of calling it with the given arguments
+        """
+        return self.load()(*args,**kwargs)
+class AsyncFunction(InnerRunner):
+    def run(self,*args,**kwargs):
+        """
+        Loads the async function and runs it to completion in a new event loop
+        """
+        return asyncio.run(self.load()(*args,**kwargs))
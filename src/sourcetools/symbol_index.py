@@ -0,0 +1,185 @@
+""" symbol_index maps fully qualified names to the definitions of a cnode tree for constant time lookup
+"""
+import os.path
+from cnode import CnodePackage, CnodeModule, CnodeDef, parse_module
+import parse_cache
+
+class SymbolIndex():
+    """
+    Dictionary from fully qualified names (pkg.mod.Class.method) to the CnodePackage/CnodeModule/CnodeDef they name
+    Built once from a root cnode and kept current with update() or reindex_module() when a module changes
+    Names that are defined more than once resolve to the definition appearing last in the module, as they would at runtime
+    """
+    def __init__(self,root_cnode,prefix=None):
+        self.root = root_cnode
+        self.prefix = cnode_name(root_cnode) if prefix is None else prefix
+        self.names = {} #fqn -> list of cnodes in source order
+        self.fqns = {} #id(cnode) -> fqn
+        self._add(root_cnode,None,self.prefix)
+
+    def __len__(self):
+        return len(self.names)
+    def __contains__(self,fqn):
+        return fqn in self.names
+    def __iter__(self):
+        return iter(self.names)
+    def lookup(self,fqn,default=None):
+        cnodes = self.names.get(fqn)
+        if cnodes is None:
+            return default
+        return cnodes[-1]
+    def __getitem__(self,fqn):
+        cnode = self.lookup(fqn)
+        if cnode is None:
+            raise KeyError(fqn)
+        return cnode
+    def astoid(self,fqn):
+        """
+        Returns the first astoid of the named definition (the body astoid of a class or function)
+        """
+        cnode = self[fqn]
+        return cnode.astoids[0] if cnode.astoids else None
+    def line_range(self,fqn):
+        return line_range(self[fqn])
+    def qualified_name(self,cnode):
+        return self.fqns.get(id(cnode))
+    def module_fqn(self,module_cnode):
+        """
+        Qualified name under which the definitions of module_cnode are indexed
+        """
+        if id(module_cnode) in self.fqns:
+            return self.fqns[id(module_cnode)]
+        #package __init__ modules are not indexed themselves
+        return self.fqns[id(module_cnode.parent)]
+
+    def update(self,module_cnode,new_source):
+        """
+        Calls module_cnode.update(new_source) and reindexes only the top-level children it replaced
+        """
+        removed_children,added_children = module_cnode.update(new_source)
+        module_fqn = self.module_fqn(module_cnode)
+        for child in removed_children:
+            self._remove(child)
+        for child in added_children:
+            self._add(child,module_fqn)
+        return removed_children,added_children
+    def reindex_module(self,old_module_cnode,new_module_cnode,parent_fqn):
+        """
+        Replaces the entries of a module that was reloaded as a new cnode tree
+        parent_fqn is the qualified name of the package containing the module
+        """
+        self._remove(old_module_cnode)
+        self._add(new_module_cnode,parent_fqn)
+
+    def _add(self,cnode,parent_fqn,fqn=None):
+        stack = [(cnode,parent_fqn,fqn)]
+        while len(stack) > 0:
+            cnode,parent_fqn,fqn = stack.pop()
+            if fqn is None:
+                name = cnode_name(cnode)
+                if name is None:
+                    continue #blocks are not named and cannot contain definitions
+                if name == '':
+                    #package __init__ module - its definitions belong to the package name
+                    for child in reversed(cnode.children):
+                        stack.append((child,parent_fqn,None))
+                    continue
+                fqn = join_name(parent_fqn,name)
+            cnodes = self.names.setdefault(fqn,[])
+            cnodes.append(cnode)
+            if len(cnodes) > 1:
+                cnodes.sort(key=_source_order)
+            self.fqns[id(cnode)] = fqn
+            for child in reversed(cnode.children):
+                stack.append((child,fqn,None))
+    def _remove(self,cnode):
+        for descendant in cnode.subtree():
+            fqn = self.fqns.pop(id(descendant),None)
+            if fqn is not None:
+                cnodes = self.names[fqn]
+                cnodes[:] = [other for other in cnodes if other is not descendant]
+                if len(cnodes) == 0:
+                    del self.names[fqn]
+
+def find_cnode(root_cnode,fqn):
+    """
+    Returns the cnode named fqn within root_cnode, or None; the first part of fqn is the name of root_cnode itself
+    Only the modules and definitions along the way are built when the tree was loaded with cnode_load(lazy=True)
+    """
+    pieces = fqn.split('.')
+    if cnode_name(root_cnode) != pieces[0]:
+        return None
+    cnode = root_cnode
+    for piece in pieces[1:]:
+        found = None
+        if isinstance(cnode,CnodePackage):
+            names = [cnode_name(child) for child in cnode.children]
+            if piece in names:
+                found = cnode.children[names.index(piece)]
+            elif '' in names:
+                #definitions of the __init__ module are named after the package
+                found = _last_named(cnode.children[names.index('')].children,piece)
+        elif isinstance(cnode,(CnodeModule,CnodeDef)):
+            found = _last_named(cnode.children,piece)
+        if found is None:
+            return None
+        cnode = found
+    return cnode
+def _last_named(children,name):
+    #the definition appearing last wins, as at runtime
+    found = None
+    for child in children:
+        if isinstance(child,CnodeDef) and child.name == name:
+            found = child
+    return found
+
+def _source_order(cnode):
+    return -1 if cnode.line_index is None else cnode.line_index
+
+def join_name(parent_fqn,name):
+    if parent_fqn:
+        return parent_fqn+'.'+name
+    return name
+
+def cnode_name(cnode):
+    """
+    The name a cnode contributes to a qualified name, or None for unnamed blocks
+    A package's __init__ module contributes nothing, so its definitions are named after the package
+    """
+    if isinstance(cnode,CnodeDef):
+        return cnode.name
+    if isinstance(cnode,CnodePackage):
+        return os.path.basename(os.path.normpath(cnode.path))
+    if isinstance(cnode,CnodeModule):
+        name = os.path.splitext(os.path.basename(cnode.path))[0]
+        if name == '__init__' and isinstance(cnode.parent,CnodePackage):
+            return ''
+        return name
+    return None
+
+def line_range(cnode):
+    """
+    Returns (first line index,end line index) of a definition including its decorators and its whole body
+    """
+    if isinstance(cnode,CnodePackage):
+        return None
+    if isinstance(cnode,CnodeModule):
+        return (0,len(cnode.source_lines))
+    start = cnode.line_index
+    decorators = getattr(cnode.astoids[0].ast_node,'decorator_list',[]) if cnode.astoids else []
+    if len(decorators) > 0:
+        start = min(start,min(decorator.lineno-1 for decorator in decorators))
+    following = cnode.final().successor
+    if following is not None and following.module is cnode.module and following.line_index is not None:
+        end = following.line_index
+    else:
+        end = len(cnode.source_lines)
+    return (start,end)
+
+def module_symbols(path):
+    """
+    Returns a SymbolIndex of the module at path with names relative to the module (e.g. 'Class.method')
+    The index is kept with the parse cache entry of the file, so it is reused until the file changes or the entry is evicted
+    """
+    path = os.path.abspath(path)
+    return parse_cache.derived(path,'symbols',lambda source,tree: SymbolIndex(parse_module(path),prefix=''))
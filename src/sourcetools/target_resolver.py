@@ -0,0 +1,127 @@
+""" target_resolver maps dotted names (pkg.mod.Class.method) to the files and definitions they name without importing or executing any module
+"""
+from importlib.machinery import PathFinder, BuiltinImporter, FrozenImporter
+from symbol_index import module_symbols
+import importlib, os.path, sys, threading
+
+class NoTargetError(Exception): pass
+
+class Resolution():
+    """
+    Result of resolving a dotted name
+    module_name/spec identify the module (or package) portion of the name and inner holds the remaining class and function names
+    cnode is the CnodeDef named by inner, or None when inner is empty
+    """
+    __slots__ = ('target','module_name','spec','inner','cnode')
+    def __init__(self,target,module_name,spec,inner,cnode):
+        self.target = target
+        self.module_name = module_name
+        self.spec = spec
+        self.inner = inner
+        self.cnode = cnode
+    @property
+    def origin(self):
+        return self.spec.origin
+    @property
+    def is_package(self):
+        return self.spec.submodule_search_locations is not None
+    def __repr__(self):
+        return '<Resolution %s: module %s, inner %s>' % (self.target,self.module_name,'.'.join(self.inner))
+
+class TargetResolver():
+    """
+    Resolves dotted names using module specs found by the path based finders, never importing parent packages as importlib.util.find_spec does
+    Specs are cached per module name prefix while sys.path is unchanged and definitions are looked up in the cnode symbol index of the module
+    Missing modules are not cached, so modules created after a failed lookup are found; call invalidate() after moving or removing modules
+    path, if given, is searched before sys.path for top-level names, in place of changing the working directory
+    Instances are safe to share between threads
+    """
+    def __init__(self,path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.specs = {} #module name -> spec
+        self.sys_path = tuple(sys.path) #sys.path the specs were found with
+
+    def clear(self):
+        with self.lock:
+            self.specs.clear()
+    def invalidate(self):
+        """
+        Forgets every spec and invalidates the caches of the import system finders, as importlib.invalidate_caches() does
+        """
+        self.clear()
+        importlib.invalidate_caches()
+
+    def find_spec(self,module_name):
+        sys_path = tuple(sys.path)
+        with self.lock:
+            if sys_path != self.sys_path:
+                self.specs.clear()
+                self.sys_path = sys_path
+            if module_name in self.specs:
+                return self.specs[module_name]
+        parent_name,_,name = module_name.rpartition('.')
+        if parent_name != '':
+            parent_spec = self.find_spec(parent_name)
+            if parent_spec is None or parent_spec.submodule_search_locations is None:
+                spec = None
+            else:
+                spec = PathFinder.find_spec(module_name,list(parent_spec.submodule_search_locations))
+        else:
+            search_path = sys.path if self.path is None else [self.path]+sys.path
+            spec = PathFinder.find_spec(module_name,search_path)
+            if spec is None:
+                spec = BuiltinImporter.find_spec(module_name) or FrozenImporter.find_spec(module_name)
+        if spec is None:
+            return None
+        with self.lock:
+            return self.specs.setdefault(module_name,spec)
+
+    def split(self,target):
+        """
+        Returns (module name,spec,inner names) for the longest prefix of target that names a module or package
+        """
+        pieces = target.split('.')
+        for split_index in range(len(pieces),0,-1):
+            module_name = '.'.join(pieces[:split_index])
+            spec = self.find_spec(module_name)
+            if spec is not None:
+                return module_name,spec,pieces[split_index:]
+        raise NoTargetError('Target %s could not be found' % target)
+
+    def resolve(self,target):
+        module_name,spec,inner = self.split(target)
+        cnode = None
+        if len(inner) > 0:
+            origin = spec.origin
+            if origin is None or os.path.splitext(origin)[1].lower() not in ['.py','.pyw'] or not os.path.exists(origin):
+                raise NoTargetError('Target %s is not defined in python source' % target)
+            cnode = module_symbols(origin).lookup('.'.join(inner))
+            if cnode is None:
+                raise NoTargetError('Target %s could not be found' % target)
+        return Resolution(target,module_name,spec,inner,cnode)
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+def get_resolver(path=None):
+    """
+    Returns the shared TargetResolver searching path before sys.path
+    """
+    with _resolvers_lock:
+        resolver = _resolvers.get(path)
+        if resolver is None:
+            resolver = _resolvers[path] = TargetResolver(path)
+        return resolver
+def invalidate():
+    """
+    Invalidates every shared TargetResolver and the import system caches; call instead of importlib.invalidate_caches()
+    """
+    with _resolvers_lock:
+        resolvers = list(_resolvers.values())
+    for resolver in resolvers:
+        resolver.clear()
+    importlib.invalidate_caches()
+def resolve(target,path=None):
+    return get_resolver(path).resolve(target)
+def split_target(target,path=None):
+    return get_resolver(path).split(target)
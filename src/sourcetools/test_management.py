@@ -0,0 +1,440 @@
+""" test_management selects the tests affected by a change
+Tests are mapped to the project definitions they exercise, from the names they reference in the cnode trees and optionally
+from a coverage run, and the changed line ranges of a git diff are mapped to the definitions holding them
+"""
+from cnode import CnodeClass, CnodeDef
+from symbol_index import SymbolIndex, line_range
+from doctest_runner import find_docstring_tests
+from project_layout import ImportGraph, import_base
+from name_dependencies import bound_names
+import ast, doctest, os, os.path, pickle, re, subprocess, sys, tempfile
+
+class ProjectReferences():
+    """
+    Static references between the modules and definitions of a project_layout.ImportGraph, named by their qualified names
+    refs maps a module or definition to the ones it may run: those named by the names it loads, the modules it imports,
+    its nested definitions and its enclosing definition or module. Attribute accesses that do not resolve statically
+    (such as self.method) refer to every method of that name, so that a test is run rather than missed
+    """
+    def __init__(self,graph):
+        self.graph = graph
+        self.definitions = {} #qualified name -> CnodeDef or CnodeModule
+        self.fqns = {} #id(cnode) -> qualified name
+        for root_cnode in graph.roots:
+            index = SymbolIndex(root_cnode)
+            for fqn in index:
+                self.definitions[fqn] = index[fqn]
+            self.fqns.update(index.fqns)
+        self.paths = {} #absolute path -> module name
+        for module_name,module_cnode in graph.modules.items():
+            self.definitions[module_name] = module_cnode
+            self.fqns[id(module_cnode)] = module_name
+            self.paths[os.path.abspath(module_cnode.path)] = module_name
+        self.methods = {} #method name -> qualified names of the methods
+        self.fixtures = {} #fixture name -> qualified names of the pytest fixtures
+        for fqn,cnode in self.definitions.items():
+            if isinstance(cnode,CnodeDef) and isinstance(cnode.parent,CnodeClass):
+                self.methods.setdefault(cnode.name,[]).append(fqn)
+            if isinstance(cnode,CnodeDef) and len(cnode.astoids) > 0 and any('fixture' in ast.unparse(decorator) for decorator in getattr(cnode.astoids[0].ast_node,'decorator_list',[])):
+                self.fixtures.setdefault(cnode.name,[]).append(fqn)
+        self.scopes = {module_name:module_scope(module_name,module_cnode,module_name in graph.packages) for module_name,module_cnode in graph.modules.items()}
+        self.refs = {}
+        for module_name,module_cnode in graph.modules.items():
+            self._add_module(module_name,module_cnode)
+        self._owners = {}
+
+    def resolve(self,dotted,depth=0):
+        """
+        Returns the qualified name of the project module or definition a dotted name refers to, or None
+        Names a module binds by importing them (such as the re-exports of a package) are followed to their definitions
+        """
+        pieces = dotted.split('.')
+        for split_index in range(len(pieces),0,-1):
+            prefix = '.'.join(pieces[:split_index])
+            if prefix not in self.definitions:
+                continue
+            if split_index == len(pieces) or prefix not in self.scopes or depth > 8:
+                return prefix
+            target = self.scopes[prefix][0].get(pieces[split_index])
+            if target is None or target == prefix:
+                return prefix
+            return self.resolve('.'.join([target]+pieces[split_index+1:]),depth+1) or prefix
+        return None
+
+    def name_references(self,module_name,ast_nodes):
+        """
+        Returns the qualified names of the project modules and definitions named by the names loaded within ast_nodes,
+        which are looked up in the namespace of module_name
+        """
+        names,star_modules = self.scopes[module_name]
+        found = set()
+        for ast_node in ast_nodes:
+            for node in ast.walk(ast_node):
+                if isinstance(node,ast.Name) and isinstance(node.ctx,ast.Load):
+                    chain = [node.id]
+                elif isinstance(node,ast.Attribute):
+                    chain = [node.attr]
+                    value = node.value
+                    while isinstance(value,ast.Attribute):
+                        chain.insert(0,value.attr)
+                        value = value.value
+                    chain = [value.id]+chain if isinstance(value,ast.Name) else None
+                else:
+                    continue
+                resolved = None
+                if chain is not None:
+                    if chain[0] in names:
+                        resolved = self.resolve('.'.join([names[chain[0]]]+chain[1:]))
+                    else:
+                        for star_module in star_modules:
+                            resolved = self.resolve('.'.join([star_module]+chain))
+                            if resolved is not None and resolved != star_module:
+                                break
+                            resolved = None
+                    if resolved is not None:
+                        found.add(resolved)
+                if isinstance(node,ast.Attribute) and (resolved is None or not (resolved == '.'.join(chain) or resolved.endswith('.'+node.attr))):
+                    found.update(self.methods.get(node.attr,[]))
+        return found
+
+    def _add_module(self,module_name,module_cnode):
+        if len(module_cnode.astoids) == 0:
+            self.refs[module_name] = set()
+            return
+        is_package = module_name in self.graph.packages
+        package = module_name if is_package else module_name.rpartition('.')[0]
+        #importing a module runs its top-level statements and the modules they import, but not the names it imports
+        module_refs = set()
+        statements = []
+        for statement in module_cnode.astoids[0].ast_node.body:
+            if isinstance(statement,ast.Import):
+                module_refs.update(self.resolve(alias.name) for alias in statement.names)
+            elif isinstance(statement,ast.ImportFrom):
+                base = import_base(package,statement)
+                module_refs.add(self.resolve(base))
+                module_refs.update(base+'.'+alias.name for alias in statement.names if base+'.'+alias.name in self.graph.modules)
+            elif not isinstance(statement,(ast.FunctionDef,ast.AsyncFunctionDef,ast.ClassDef)):
+                statements.append(statement)
+        module_refs.update(self.name_references(module_name,statements))
+        module_refs.update(parent for parent in parent_modules(module_name) if parent in self.graph.modules)
+        module_refs.discard(None)
+        module_refs.discard(module_name)
+        self.refs[module_name] = module_refs
+        fixture_module = is_test_module(module_cnode.path) or os.path.basename(module_cnode.path) == 'conftest.py'
+        for cnode in module_cnode.subtree():
+            fqn = self.fqns.get(id(cnode))
+            if not isinstance(cnode,CnodeDef) or fqn is None or len(cnode.astoids) == 0:
+                continue
+            ast_node = cnode.astoids[0].ast_node
+            refs = self.name_references(module_name,[ast_node])
+            refs.update(self.fqns[id(child)] for child in cnode.children if id(child) in self.fqns)
+            refs.add(self.fqns.get(id(cnode.parent),module_name))
+            if fixture_module and not isinstance(cnode,CnodeClass):
+                for arg in ast_node.args.posonlyargs+ast_node.args.args+ast_node.args.kwonlyargs:
+                    refs.update(self.fixtures.get(arg.arg,[]))
+            refs.discard(fqn)
+            self.refs[fqn] = refs
+
+    def closure(self,fqns):
+        """
+        Returns the qualified names of everything the modules and definitions in fqns may run, including themselves
+        """
+        seen = set(fqn for fqn in fqns if fqn in self.refs)
+        stack = list(seen)
+        while len(stack) > 0:
+            for ref in self.refs[stack.pop()]:
+                if ref not in seen and ref in self.refs:
+                    seen.add(ref)
+                    stack.append(ref)
+        return seen
+
+    def line_owners(self,module_name):
+        """
+        Returns the qualified name of the innermost definition holding each line of a module, or the module name for module-level lines
+        """
+        owners = self._owners.get(module_name)
+        if owners is None:
+            module_cnode = self.graph.modules[module_name]
+            owners = [module_name]*len(module_cnode.source_lines)
+            ranges = []
+            for cnode in module_cnode.subtree():
+                if isinstance(cnode,CnodeDef) and id(cnode) in self.fqns and cnode.line_index is not None:
+                    start,end = line_range(cnode)
+                    ranges.append((start,-end,self.fqns[id(cnode)]))
+            #enclosing definitions first, so that nested ones overwrite them
+            for start,negative_end,fqn in sorted(ranges):
+                owners[start:-negative_end] = [fqn]*(-negative_end-start)
+            self._owners[module_name] = owners
+        return owners
+
+def module_scope(module_name,module_cnode,is_package):
+    """
+    Returns (names,star modules) of the module namespace: names maps each top-level name to the dotted name it refers to,
+    which is the module itself for names bound by plain statements
+    """
+    names = {}
+    star_modules = []
+    if len(module_cnode.astoids) == 0:
+        return names,star_modules
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    for statement in module_cnode.astoids[0].ast_node.body:
+        if isinstance(statement,ast.Import):
+            for alias in statement.names:
+                if alias.asname is not None:
+                    names[alias.asname] = alias.name
+                else:
+                    names[alias.name.split('.')[0]] = alias.name.split('.')[0]
+        elif isinstance(statement,ast.ImportFrom):
+            base = import_base(package,statement)
+            for alias in statement.names:
+                if alias.name == '*':
+                    star_modules.append(base)
+                else:
+                    names[alias.asname or alias.name] = base+'.'+alias.name
+        elif isinstance(statement,(ast.FunctionDef,ast.AsyncFunctionDef,ast.ClassDef)):
+            names[statement.name] = module_name+'.'+statement.name
+        else:
+            for name in bound_names(statement):
+                names[name] = module_name
+    return names,star_modules
+
+def parent_modules(module_name):
+    pieces = module_name.split('.')
+    return ['.'.join(pieces[:i]) for i in range(1,len(pieces))]
+
+def is_test_module(path):
+    name = os.path.basename(path)
+    return re.match('^test_.*\\.py$',name) is not None or re.match('^.*_test\\.py$',name) is not None
+
+class SuiteItem():
+    """
+    One test: a pytest style test function or method, or the doctests of one docstring
+    nodeid is the pytest node id (path relative to the root folder, then '::' and the test or docstring name)
+    name is the qualified name of the test function or of the definition holding the docstring
+    roots are the qualified names of the project definitions the test refers to directly
+    """
+    __slots__ = ('nodeid','name','kind','roots')
+    def __init__(self,nodeid,name,kind,roots):
+        self.nodeid = nodeid
+        self.name = name
+        self.kind = kind
+        self.roots = roots
+    def __repr__(self):
+        return '<SuiteItem %s>' % self.nodeid
+
+def relative_path(path,root):
+    return os.path.relpath(os.path.abspath(path),root).replace(os.sep,'/')
+
+def find_suite_items(references,root='.',doctests=True):
+    """
+    Returns the SuiteItems of a project: functions named test* in modules named test_*.py or *_test.py, at module level
+    or in classes named Test* or deriving from a TestCase, and, if doctests is True, every docstring with examples
+    """
+    root = os.path.abspath(root)
+    items = []
+    for module_name,module_cnode in sorted(references.graph.modules.items()):
+        if not is_test_module(module_cnode.path):
+            continue
+        relpath = relative_path(module_cnode.path,root)
+        for child in module_cnode.children:
+            if not isinstance(child,CnodeDef) or id(child) not in references.fqns:
+                continue
+            if isinstance(child,CnodeClass):
+                bases = [ast.unparse(base) for base in child.astoids[0].ast_node.bases] if len(child.astoids) > 0 else []
+                if not child.name.startswith('Test') and not any(base.endswith('TestCase') for base in bases):
+                    continue
+                for method in child.children:
+                    if isinstance(method,CnodeDef) and not isinstance(method,CnodeClass) and method.name.startswith('test') and id(method) in references.fqns:
+                        fqn = references.fqns[id(method)]
+                        items.append(SuiteItem('%s::%s::%s' % (relpath,child.name,method.name),fqn,'function',[fqn]))
+            elif child.name.startswith('test'):
+                fqn = references.fqns[id(child)]
+                items.append(SuiteItem('%s::%s' % (relpath,child.name),fqn,'function',[fqn]))
+    if doctests:
+        parser = doctest.DocTestParser()
+        for root_cnode in references.graph.roots:
+            for docstring in find_docstring_tests(root_cnode):
+                roots = {docstring.name} if docstring.name in references.definitions else {docstring.module_name}
+                examples = []
+                for example in parser.get_examples(docstring.docstring):
+                    try:
+                        examples.append(ast.parse(example.source))
+                    except SyntaxError:
+                        pass
+                if docstring.module_name in references.scopes:
+                    roots.update(references.name_references(docstring.module_name,examples))
+                items.append(SuiteItem('%s::%s' % (relative_path(docstring.filepath,root),docstring.name),docstring.name,'doctest',sorted(roots)))
+    return items
+
+class ImpactMap():
+    """
+    Map from the pytest node ids of the tests of a project to the qualified names of the definitions they exercise
+    Built statically with build(), optionally extended from a coverage run with add_coverage(), and persisted with save()/load()
+    so that select() can pick the tests affected by a diff without analysing the tests again
+    paths are the package and module paths of the project and all paths are relative to root
+    """
+    def __init__(self,paths,root='.'):
+        self.root = os.path.abspath(root)
+        self.paths = [relative_path(path,self.root) for path in paths]
+        self.tests = {} #node id -> set of qualified names
+        self.names = {} #node id -> qualified name of the test
+        self.modules = {} #relative path -> module name
+        self._references = None
+
+    @classmethod
+    def build(cls,paths,root='.',doctests=True):
+        """
+        Builds the static map of the project at paths (as for project_layout.ImportGraph)
+        """
+        impact_map = cls(paths,root)
+        references = impact_map.references()
+        for item in find_suite_items(references,impact_map.root,doctests):
+            impact_map.tests[item.nodeid] = references.closure(item.roots)
+            impact_map.names[item.nodeid] = item.name
+        return impact_map
+
+    def references(self):
+        """
+        Returns the ProjectReferences of the project as it is now on disk, and updates the module names of its files
+        """
+        if self._references is None:
+            graph = ImportGraph(*[os.path.join(self.root,path) for path in self.paths])
+            self._references = ProjectReferences(graph)
+            for path,module_name in self._references.paths.items():
+                self.modules[relative_path(path,self.root)] = module_name
+        return self._references
+
+    def add_coverage(self,data_file):
+        """
+        Adds the definitions each test executed according to a coverage.py data file with per-test contexts,
+        as recorded by pytest --cov --cov-context=test or with dynamic_context = test_function; needs the coverage package
+        The data must come from the same version of the project as the map
+        """
+        try:
+            from coverage import CoverageData
+        except ImportError:
+            raise Exception('add_coverage needs the coverage package')
+        data = CoverageData(basename=data_file)
+        data.read()
+        references = self.references()
+        nodeids = {}
+        for nodeid,name in self.names.items():
+            nodeids[nodeid] = nodeid
+            nodeids[name] = nodeid
+        for filename in data.measured_files():
+            module_name = references.paths.get(os.path.abspath(filename))
+            if module_name is None:
+                continue
+            owners = references.line_owners(module_name)
+            for lineno,contexts in data.contexts_by_lineno(filename).items():
+                if not 0 < lineno <= len(owners):
+                    continue
+                for context in contexts:
+                    #pytest-cov contexts are node ids followed by |setup, |run or |teardown and parameters in brackets
+                    nodeid = nodeids.get(re.sub('\\[.*\\]$','',context.partition('|')[0]))
+                    if nodeid is not None:
+                        self.tests[nodeid].add(owners[lineno-1])
+
+    def changed_definitions(self,changes):
+        """
+        Returns the qualified names of the definitions and modules touched by changes, a dictionary from paths relative
+        to root to lists of changed (first line index,end line index) ranges, or to None for deleted files (see git_changes)
+        Deleted modules are returned with a trailing '.' standing for the module and everything within it
+        """
+        references = self.references()
+        changed = set()
+        for relpath,ranges in changes.items():
+            module_name = references.paths.get(os.path.abspath(os.path.join(self.root,relpath)))
+            if module_name is None:
+                module_name = self.modules.get(relpath)
+                if module_name is not None:
+                    changed.add(module_name+'.')
+                continue
+            if ranges is None:
+                changed.add(module_name+'.')
+                continue
+            owners = references.line_owners(module_name)
+            for start,end in ranges:
+                end = len(owners) if end is None else min(end,len(owners))
+                changed.update(owners[max(start,0):end])
+        return changed
+
+    def select(self,changes,new_tests=True):
+        """
+        Returns the node ids of the tests affected by changes (see changed_definitions)
+        With new_tests=True, tests found in the project that are not in the map yet are selected as well
+        """
+        changed = self.changed_definitions(changes)
+        removed = tuple(fqn for fqn in changed if fqn.endswith('.'))
+        selected = []
+        for nodeid,fqns in self.tests.items():
+            if not fqns.isdisjoint(changed) or (len(removed) > 0 and any(fqn.startswith(removed) or fqn+'.' in removed for fqn in fqns)):
+                selected.append(nodeid)
+        if new_tests:
+            for item in find_suite_items(self.references(),self.root):
+                if item.nodeid not in self.tests:
+                    selected.append(item.nodeid)
+        return selected
+
+    def save(self,path):
+        fd,tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump({'paths':self.paths,'tests':self.tests,'names':self.names,'modules':self.modules},f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,path)
+    @classmethod
+    def load(cls,path,root='.'):
+        with open(path,'rb') as f:
+            state = pickle.load(f)
+        impact_map = cls([],root)
+        impact_map.paths = state['paths']
+        impact_map.tests = state['tests']
+        impact_map.names = state['names']
+        impact_map.modules = state['modules']
+        return impact_map
+
+def git_changes(base='HEAD',root='.',untracked=True):
+    """
+    Returns the lines changed since the git revision base, including uncommitted changes, as a dictionary from paths
+    relative to root to lists of (first line index,end line index) ranges in the current files, or None for deleted files
+    Pure deletions mark the lines on either side of them. Untracked files count as changed throughout, with ranges [(0,None)]
+    """
+    process = subprocess.run(['git','diff','-U0','--no-color','--no-ext-diff','--no-renames','--no-prefix','--relative',base,'--'],cwd=root,capture_output=True,text=True)
+    if process.returncode != 0:
+        raise Exception('git diff failed:\n%s' % process.stderr)
+    changes = {}
+    old_path = None
+    path = None
+    for line in process.stdout.splitlines():
+        if line.startswith('--- '):
+            old_path = line[4:]
+        elif line.startswith('+++ '):
+            if line[4:] == '/dev/null':
+                changes[old_path] = None
+                path = None
+            else:
+                path = line[4:]
+                changes.setdefault(path,[])
+        elif line.startswith('@@') and path is not None:
+            match = re.match('^@@ -[0-9,]+ \\+([0-9]+)(?:,([0-9]+))? @@',line)
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count == 0:
+                changes[path].append((max(start-1,0),start+1))
+            else:
+                changes[path].append((start-1,start-1+count))
+    if untracked:
+        process = subprocess.run(['git','ls-files','--others','--exclude-standard'],cwd=root,capture_output=True,text=True)
+        if process.returncode != 0:
+            raise Exception('git ls-files failed:\n%s' % process.stderr)
+        for path in process.stdout.splitlines():
+            changes[path] = [(0,None)]
+    return changes
+
+if __name__ == '__main__':
+    #python test_management.py build MAP PATH... | python test_management.py select MAP [BASE]
+    if sys.argv[1] == 'build':
+        ImpactMap.build(sys.argv[3:]).save(sys.argv[2])
+    elif sys.argv[1] == 'select':
+        impact_map = ImpactMap.load(sys.argv[2])
+        for nodeid in impact_map.select(git_changes(sys.argv[3] if len(sys.argv) > 3 else 'HEAD')):
+            print(nodeid)
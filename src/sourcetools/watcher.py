@@ -0,0 +1,300 @@
+""" watcher keeps the cnode tree of a package or module up to date as its files change
+Changed modules are updated in place with CnodeModule.update, and added or removed modules and subpackages are linked into
+or out of the existing tree; every change is reported as a ChangeEvent
+Changes are found by comparing file stats, either on a polling interval or when inotify (on linux) reports activity
+"""
+from cnode import cnode_load, parse_module, package_items, built_subtree, linked_final, CnodePackage, CnodeModule
+import ctypes, ctypes.util, os, os.path, select, threading, time, tokenize
+
+class ChangeEvent():
+    """
+    One change applied to a watched tree
+    kind is 'modified', 'added', 'removed' or 'error' (a changed module that no longer parses, whose cnodes are left as they were)
+    cnode is the CnodeModule or CnodePackage concerned; for 'modified' removed and added hold the top-level children that
+    CnodeModule.update replaced, and for 'error' error holds the exception
+    When a watched module file is removed and created again, its 'added' event holds the root CnodeModule, updated in place
+    """
+    __slots__ = ('kind','path','cnode','removed','added','error')
+    def __init__(self,kind,path,cnode,removed=(),added=(),error=None):
+        self.kind = kind
+        self.path = path
+        self.cnode = cnode
+        self.removed = removed
+        self.added = added
+        self.error = error
+    def __repr__(self):
+        return '<ChangeEvent %s %s>' % (self.kind,self.path)
+
+def scan(path):
+    """
+    Returns ({module path:(mtime_ns,size)},[package paths]) of a package folder, or of a single module file
+    """
+    modules = {}
+    packages = []
+    if not os.path.isdir(path):
+        try:
+            stat = os.stat(path)
+            modules[path] = (stat.st_mtime_ns,stat.st_size)
+        except FileNotFoundError:
+            pass
+        return modules,packages
+    stack = [path] if os.path.exists(os.path.join(path,'__init__.py')) else []
+    while len(stack) > 0:
+        package_path = stack.pop()
+        packages.append(package_path)
+        try:
+            items = list(package_items(package_path))
+        except FileNotFoundError:
+            continue
+        for item_path in items:
+            if os.path.isdir(item_path):
+                stack.append(item_path)
+                continue
+            try:
+                stat = os.stat(item_path)
+            except FileNotFoundError:
+                continue
+            modules[item_path] = (stat.st_mtime_ns,stat.st_size)
+    return modules,packages
+
+class Inotify():
+    """
+    Minimal inotify binding through ctypes, used only to wake up a TreeWatcher when something in its folders changes
+    """
+    mask = 0x2|0x4|0x8|0x40|0x80|0x100|0x200|0x400|0x800 #modify, attrib, close_write, moved_from, moved_to, create, delete, delete_self, move_self
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK|os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(),'inotify_init1 failed')
+        self.folders = set()
+    def add(self,folder):
+        if folder not in self.folders and self.libc.inotify_add_watch(self.fd,os.fsencode(folder),self.mask) >= 0:
+            self.folders.add(folder)
+    def wait(self,timeout):
+        """
+        Waits up to timeout seconds for activity and returns True if there was any
+        """
+        ready = select.select([self.fd],[],[],timeout)[0]
+        if len(ready) == 0:
+            return False
+        try:
+            while len(os.read(self.fd,65536)) > 0:
+                pass
+        except BlockingIOError:
+            pass
+        return True
+    def close(self):
+        os.close(self.fd)
+
+def open_inotify():
+    #None where inotify is unavailable (not linux, or out of instances)
+    try:
+        return Inotify()
+    except (OSError,AttributeError):
+        return None
+
+class TreeWatcher():
+    """
+    Loads the cnode tree of a package folder or module file once (as cnode_load, optionally lazily) and keeps it current
+    poll() applies the changes made since the previous poll and returns their ChangeEvents; events() and start() poll repeatedly
+    lock is held while changes are applied, so threads querying the tree while start() runs should hold it too
+    """
+    def __init__(self,path,lazy=False,inotify=True):
+        self.path = path
+        self.lazy = lazy
+        self.lock = threading.RLock()
+        self.root = cnode_load(path,lazy=lazy)
+        self.modules = {} #module path -> CnodeModule
+        self.packages = {} #package path -> CnodePackage
+        for cnode in built_subtree(self.root):
+            self._register(cnode)
+        self.stats,package_paths = scan(path)
+        self.inotify = open_inotify() if inotify else None
+        self._watch_folders(package_paths)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _register(self,cnode):
+        if isinstance(cnode,CnodePackage):
+            self.packages[cnode.path] = cnode
+        elif isinstance(cnode,CnodeModule):
+            self.modules[cnode.path] = cnode
+    def _watch_folders(self,package_paths):
+        if self.inotify is not None:
+            for folder in (package_paths if os.path.isdir(self.path) else [os.path.dirname(os.path.abspath(self.path))]):
+                self.inotify.add(folder)
+
+    def poll(self):
+        """
+        Applies the changes made to the files since the last poll and returns their ChangeEvents
+        Removals come first, then additions, then modifications
+        """
+        stats,package_paths = scan(self.path)
+        events = []
+        with self.lock:
+            if isinstance(self.root,CnodePackage):
+                for package_path in sorted(set(self.packages)-set(package_paths),reverse=True):
+                    if package_path in self.packages and package_path != self.root.path:
+                        events.append(self._remove(self.packages[package_path]))
+                for module_path in sorted(set(self.stats)-set(stats)):
+                    if module_path in self.modules:
+                        events.append(self._remove(self.modules[module_path]))
+                for package_path in sorted(set(package_paths)-set(self.packages)):
+                    if package_path not in self.packages:
+                        events.append(self._add(package_path))
+                for module_path in sorted(set(stats)-set(self.modules)):
+                    events.append(self._add(module_path))
+            elif len(stats) == 0 and len(self.stats) > 0:
+                events.append(ChangeEvent('removed',self.path,self.root))
+            elif len(stats) > 0 and len(self.stats) == 0:
+                #a watched module file that was removed has been created again: the root is updated in place to its new source
+                event = self._modify(self.root)
+                if event.kind == 'modified':
+                    event.kind = 'added'
+                events.append(event)
+            for module_path,stat in sorted(stats.items()):
+                previous = self.stats.get(module_path)
+                if previous is not None and previous != stat and module_path in self.modules:
+                    events.append(self._modify(self.modules[module_path]))
+            self.stats = stats
+        self._watch_folders(package_paths)
+        return events
+
+    def _modify(self,module_cnode):
+        if module_cnode._loader is not None:
+            #not built yet, so it will be parsed from the changed file
+            return ChangeEvent('modified',module_cnode.path,module_cnode)
+        try:
+            with tokenize.open(module_cnode.path) as f:
+                new_source = f.read()
+            removed,added = module_cnode.update(new_source)
+        except (SyntaxError,ValueError,OSError) as e:
+            return ChangeEvent('error',module_cnode.path,module_cnode,error=e)
+        return ChangeEvent('modified',module_cnode.path,module_cnode,removed,added)
+
+    def _add(self,path):
+        parent = self.packages[os.path.dirname(path)]
+        if os.path.isdir(path):
+            cnode = cnode_load(path,lazy=self.lazy)
+        else:
+            cnode = parse_module(path,lazy=self.lazy)
+        link_child(parent,cnode)
+        for descendant in built_subtree(cnode):
+            self._register(descendant)
+        return ChangeEvent('added',path,cnode)
+
+    def _remove(self,cnode):
+        unlink_child(cnode)
+        for descendant in built_subtree(cnode):
+            if isinstance(descendant,CnodePackage):
+                self.packages.pop(descendant.path,None)
+            elif isinstance(descendant,CnodeModule):
+                self.modules.pop(descendant.path,None)
+        return ChangeEvent('removed',cnode.path,cnode)
+
+    def wait(self,timeout):
+        """
+        Waits up to timeout seconds, returning early when inotify reports activity in the watched folders
+        """
+        if self.inotify is not None:
+            self.inotify.wait(timeout)
+        else:
+            time.sleep(timeout)
+    def events(self,interval=1.0):
+        """
+        Yields ChangeEvents as they happen, polling every interval seconds (or as soon as inotify reports activity)
+        """
+        while not self._stop.is_set():
+            self.wait(interval)
+            yield from self.poll()
+    def start(self,callback,interval=1.0):
+        """
+        Polls in a daemon thread, calling callback with each ChangeEvent
+        """
+        def run():
+            for event in self.events(interval):
+                callback(event)
+        self._stop.clear()
+        self._thread = threading.Thread(target=run,name='TreeWatcher(%s)' % self.path,daemon=True)
+        self._thread.start()
+        return self
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    def close(self):
+        self.stop()
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+    def __enter__(self):
+        return self
+    def __exit__(self,exc_type,exc_value,exc_tb):
+        self.close()
+
+def watch(path,callback=None,interval=1.0,lazy=False):
+    """
+    Returns a TreeWatcher of the package folder or module file at path; with a callback it is already started (see TreeWatcher.start)
+    """
+    watcher = TreeWatcher(path,lazy)
+    if callback is not None:
+        watcher.start(callback,interval)
+    return watcher
+
+def link_child(package_cnode,cnode):
+    """
+    Links a standalone CnodeModule or CnodePackage into package_cnode at its sorted position, as CnodePackage would have placed it
+    """
+    children = package_cnode.children
+    name = os.path.basename(cnode.path)
+    index = 0
+    while index < len(children) and os.path.basename(children[index].path) < name:
+        index += 1
+    prev_sibling = children[index-1] if index > 0 else None
+    next_sibling = children[index] if index < len(children) else None
+    children.insert(index,cnode)
+    cnode.parent = package_cnode
+    cnode.prev_sibling = prev_sibling
+    cnode.next_sibling = next_sibling
+    if prev_sibling is not None:
+        prev_sibling.next_sibling = cnode
+    if next_sibling is not None:
+        next_sibling.prev_sibling = cnode
+    predecessor = linked_final(prev_sibling) if prev_sibling is not None else package_cnode
+    following = predecessor.successor
+    predecessor.successor = cnode
+    cnode.predecessor = predecessor
+    final = linked_final(cnode)
+    final.successor = following
+    if following is not None:
+        following.predecessor = final
+
+def unlink_child(cnode):
+    """
+    Unlinks a CnodeModule or CnodePackage from its package, leaving it a standalone tree
+    """
+    children = cnode.parent.children
+    children.remove(cnode)
+    if cnode.prev_sibling is not None:
+        cnode.prev_sibling.next_sibling = cnode.next_sibling
+    if cnode.next_sibling is not None:
+        cnode.next_sibling.prev_sibling = cnode.prev_sibling
+    final = linked_final(cnode)
+    following = final.successor
+    cnode.predecessor.successor = following
+    if following is not None:
+        following.predecessor = cnode.predecessor
+    cnode.parent = None
+    cnode.prev_sibling = None
+    cnode.next_sibling = None
+    cnode.predecessor = None
+    final.successor = None
+
+if __name__ == '__main__':
+    import sys
+    watcher = watch(sys.argv[1])
+    print('watching %s (%s)' % (sys.argv[1],'inotify' if watcher.inotify is not None else 'polling'))
+    for event in watcher.events():
+        print(event,'-%d +%d children' % (len(event.removed),len(event.added)) if event.kind == 'modified' else event.error or '')
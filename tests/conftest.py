@@ -0,0 +1,32 @@
+import sys, os.path
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../src/sourcetools')))
+
+import cnode
+
+def signature(root_cnode):
+    #structure, links and text of every cnode and astoid, with links as walk order positions
+    cnodes = list(root_cnode.walk())
+    rows = {id(c):row for row,c in enumerate(cnodes)}
+    row = lambda c: rows.get(id(c))
+    result = []
+    for c in cnodes:
+        result.append((type(c).__name__,c.line_index,getattr(c,'name',None),row(c.parent),row(c.prev_sibling),row(c.next_sibling),row(c.predecessor),row(c.successor),
+            None if isinstance(c,cnode.CnodePackage) or c.line_index is None else ''.join(c.get_lines())))
+        if isinstance(c,cnode.CnodeModule):
+            for astoid in (c.astoids[0].walk() if len(c.astoids) > 0 else []):
+                result.append((type(astoid.ast_node).__name__,astoid.clause,astoid.line_index,getattr(astoid.ast_node,'lineno',None)))
+    return result
+
+def write(path,source):
+    path.write_text(source)
+    return str(path)
+
+def make_package(tmp_path):
+    package = tmp_path/'package'
+    package.mkdir()
+    write(package/'__init__.py','# comments only\n\n# still part of the module\n')
+    write(package/'a.py','import os\n\ndef f(x):\n    if x:\n        return 1\n    return 2\n\nclass A():\n    def g(self):\n        pass\n')
+    (package/'sub').mkdir()
+    write(package/'sub'/'__init__.py','')
+    write(package/'sub'/'b.py','try:\n    import ssl\nexcept ImportError:\n    def ssl():\n        pass\nx = 1\n')
+    return str(package)
@@ -0,0 +1,53 @@
+import os, pytest
+import astoid
+
+sources = [
+        'if x:\n    a = 1\nelif y:\n    a = 2\nelif z:\n    a = 3\nelse:\n    a = 4\nb = 5\n',
+        'if x:\n    a = 1\nelif y:\n    a = 2\nb = 3\n',
+        'def f(x):\n    if x:\n        if y:\n            return 1\n        elif z:\n            return 2\n    elif w:\n        pass\n    return 3\n',
+        'try:\n    import foo\nexcept ImportError:\n    foo = None\nelse:\n    pass\nfinally:\n    x = 1\n',
+        'for i in r:\n    if i:\n        break\nelse:\n    q = 1\nwhile x:\n    x -= 1\n',
+        ]
+
+def navigation(astoid_tree,nodes):
+    rows = {}
+    for node in nodes:
+        rows[node.index if hasattr(node,'table') else id(node)] = len(rows)
+    row = lambda node: None if node is None else rows[node.index if hasattr(node,'table') else id(node)]
+    return [(row(node.parent),row(node.prev_sibling),row(node.next_sibling),row(node.successor),row(node.predecessor),row(node.skip_next()),row(node.skip_prev())) for node in nodes]
+
+@pytest.mark.parametrize('source',sources+[open(os.__file__).read()])
+def test_table_navigates_like_tree(source):
+    root = astoid.parse(source)
+    table = astoid.AstoidTable.from_astoid(root)
+    nodes = list(root.walk())
+    views = [table.view(index) for index in range(len(nodes))]
+    assert navigation(root,nodes) == navigation(table,views)
+
+@pytest.mark.parametrize('source',sources)
+def test_successors_follow_walk_order(source):
+    nodes = list(astoid.parse(source).walk())
+    assert [node.successor for node in nodes] == nodes[1:]+[None]
+    assert [node.predecessor for node in nodes] == [None]+nodes[:-1]
+
+def test_deep_nesting_does_not_recurse():
+    import ast, sys
+    #an elif chain nests each If in the orelse of the previous one, far deeper than the indentation limit allows
+    source = 'if x == 0:\n    a = 0\n'+''.join('elif x == %d:\n    a = %d\n' % (i,i) for i in range(1,2000))
+    source += ''.join('    '*depth+'def f%d():\n' % depth for depth in range(99))+'    '*99+'pass\n'
+    tree = ast.parse(source)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        root = astoid.parse(source,tree)
+        nodes = list(root.walk())
+    finally:
+        sys.setrecursionlimit(limit)
+    assert len(nodes) == 1+2*2000+99+1
+    assert [node.successor for node in nodes] == nodes[1:]+[None]
+
+@pytest.mark.parametrize('source',['','# comments only\n\n# and blank lines\n'])
+def test_parse_table_of_module_without_statements(source):
+    table = astoid.parse_table(source)
+    assert len(table) == 0 and table.root() is None
+    assert table.source_lines.get_text() == source
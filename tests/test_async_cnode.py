@@ -0,0 +1,37 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pytest
+import async_cnode, cnode, parse_cache
+from conftest import make_package, signature
+
+@pytest.mark.parametrize('executor_type',[None,ThreadPoolExecutor,ProcessPoolExecutor])
+def test_async_load_matches_cnode_load(tmp_path,executor_type):
+    path = make_package(tmp_path)
+    parse_cache.clear_cache()
+    expected = signature(cnode.cnode_load(path))
+    async def load():
+        if executor_type is None:
+            return await async_cnode.acnode_load(path,limit=2)
+        with executor_type(2) as executor:
+            return await async_cnode.acnode_load(path,executor,limit=2)
+    assert signature(asyncio.run(load())) == expected
+
+@pytest.mark.parametrize('executor_type',[ThreadPoolExecutor,ProcessPoolExecutor])
+def test_stream_and_parse_modules(tmp_path,executor_type):
+    path = make_package(tmp_path)
+    async def stream():
+        with executor_type(2) as executor:
+            streamed = [module_cnode async for module_cnode in async_cnode.astream_modules(path,executor,limit=2)]
+            single = await async_cnode.aparse_module(cnode.package_module_paths(path)[1],executor)
+        return streamed,single
+    streamed,single = asyncio.run(stream())
+    assert sorted(module_cnode.path for module_cnode in streamed) == sorted(cnode.package_module_paths(path))
+    assert all(module_cnode.parent is None for module_cnode in streamed)
+    assert signature(single) == signature(cnode.parse_module(cnode.package_module_paths(path)[1]))
+
+def test_async_lazy_load(tmp_path):
+    path = make_package(tmp_path)
+    parse_cache.clear_cache()
+    lazy = asyncio.run(async_cnode.acnode_load(path,lazy=True))
+    assert lazy.children[1]._loader is not None
+    assert signature(lazy) == signature(cnode.cnode_load(path))
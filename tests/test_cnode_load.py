@@ -0,0 +1,32 @@
+import cnode, parse_cache
+from conftest import make_package, signature, write
+
+def test_parallel_load_matches_serial(tmp_path):
+    path = make_package(tmp_path)
+    parse_cache.clear_cache()
+    serial = cnode.cnode_load(path)
+    parallel = cnode.cnode_load(path,workers=2)
+    assert signature(parallel) == signature(serial)
+    assert ''.join(parallel.children[0].get_lines()) == '# comments only\n\n# still part of the module\n'
+
+def test_lazy_load_matches_eager(tmp_path):
+    path = make_package(tmp_path)
+    parse_cache.clear_cache()
+    eager = cnode.cnode_load(path)
+    lazy = cnode.cnode_load(path,lazy=True)
+    #modules are listed but not parsed until they are used
+    module_cnode = lazy.children[1]
+    assert str(module_cnode) == "CnodeModule('a.py')" and module_cnode._loader is not None
+    assert 'children' not in module_cnode.__dict__
+    assert signature(lazy) == signature(eager)
+    assert module_cnode._loader is None
+
+def test_lazy_definitions_build_on_first_use(tmp_path):
+    path = write(tmp_path/'module.py','class A():\n    def g(self):\n        if x:\n            pass\n        return 1\nx = 1\n')
+    parse_cache.clear_cache()
+    lazy = cnode.cnode_load(path,lazy=True)
+    class_cnode = lazy.children[0]
+    assert class_cnode._loader is not None and class_cnode.successor is lazy.children[1]
+    assert [str(child) for child in class_cnode.children] == ["CnodeFunction('g')"]
+    assert class_cnode._loader is None
+    assert signature(lazy) == signature(cnode.cnode_load(path))
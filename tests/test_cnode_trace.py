@@ -0,0 +1,18 @@
+import astoid, cnode
+
+source = 'import os\ndef f():\n    return 1\nclass A():\n    def g(self):\n        pass\n'
+
+def test_tracing_is_opt_in():
+    steps = []
+    assert cnode.trace_callback is None
+    cnode.build_module('traced.py',source,astoid.parse(source))
+    cnode.set_trace(steps.append)
+    try:
+        module_cnode = cnode.build_module('traced.py',source,astoid.parse(source))
+    finally:
+        cnode.set_trace(None)
+    assert cnode.trace_callback is None
+    assert set(steps[0]) == {'astoid','state','next_state','starting_cnode','cnode','parent','prev_sibling','predecessor','stack'}
+    assert steps[0]['cnode'] is module_cnode
+    traced = set(id(step['cnode']) for step in steps)
+    assert all(id(c) in traced for c in module_cnode.walk())
@@ -0,0 +1,85 @@
+import pytest
+import cnode, parse_cache
+from conftest import signature, write
+
+def updated_and_fresh(tmp_path,old_source,new_source):
+    parse_cache.clear_cache()
+    module_cnode = cnode.parse_module(write(tmp_path/'module.py',old_source))
+    module_cnode.update(new_source)
+    return module_cnode,cnode.parse_module(write(tmp_path/'fresh.py',new_source))
+
+edits = [
+        #edit in a definition
+        ('def f():\n    return 1\n\nx = 1\n','def f():\n    return 2\n\nx = 1\n'),
+        #definitions in except/else clauses put the children out of line order
+        ('try:\n    from foo import bar\nexcept ImportError:\n    def bar():\n        pass\nelse:\n    pass\nx = 1\n',
+         'try:\n    from foo import bar\nexcept ImportError:\n    def bar():\n        return 2\nelse:\n    pass\nx = 1\n'),
+        ('x = 1\nfor i in r:\n    def h(): pass\nelse:\n    q=1\n','x = 1\nfor i in r:\n    def h(): pass\nelse:\n    q=1\ny = 2\n'),
+        #a child starting inside the else of a top-level try is not a statement boundary
+        ('x = 1\ndef f():\n    pass\ntry:\n    import ssl\nexcept ImportError:\n    ssl = None\nelse:\n    class T():\n        pass\n    y = 2\nz = 3\n',
+         'x = 1\ndef f():\n\n    pass\ntry:\n    import ssl\nexcept ImportError:\n    ssl = None\nelse:\n    class T():\n        pass\n    y = 2\nz = 3\n'),
+        #neighbouring blocks merge
+        ('x = 1\ndef f():\n    pass\n','x = 1\ny = 2\n'),
+        ('def f():\n    pass\nx = 1\n','y = 0\nx = 1\n'),
+        #decorators
+        ('x = 1\n@dec\ndef f():\n    pass\n','x = 1\n@dec\n@dec2\ndef f():\n    pass\n'),
+        #every statement removed, and added back
+        ('x = 1\n','# nothing\n'),
+        ('','def f():\n    pass\n'),
+        ]
+
+@pytest.mark.parametrize('old_source,new_source',edits)
+def test_update_matches_fresh_parse(tmp_path,old_source,new_source):
+    module_cnode,fresh_cnode = updated_and_fresh(tmp_path,old_source,new_source)
+    assert signature(module_cnode) == signature(fresh_cnode)
+
+def test_update_keeps_shared_ast_intact(tmp_path):
+    parse_cache.clear_cache()
+    path = write(tmp_path/'module.py','def a():\n    pass\n\n\ndef b():\n    pass\n')
+    first = cnode.parse_module(path)
+    second = cnode.parse_module(path)
+    before = signature(second)
+    first.update('x = 1\ny = 2\nz = 3\ndef a():\n    pass\n\n\ndef b():\n    pass\n')
+    signature(first) #applies the pending line shifts of the ast of first
+    assert signature(second) == before
+    assert len(parse_cache.parse_ast(path).body) == 2
+
+def test_update_keeps_link_to_next_module(tmp_path):
+    package = tmp_path/'package'
+    package.mkdir()
+    write(package/'__init__.py','')
+    write(package/'a.py','def f():\n    return 1\n')
+    write(package/'b.py','x = 1\n')
+    parse_cache.clear_cache()
+    package_cnode = cnode.cnode_load(str(package))
+    package_cnode.children[1].update('def f():\n    return 2\n')
+    write(package/'a.py','def f():\n    return 2\n')
+    parse_cache.clear_cache()
+    assert signature(package_cnode) == signature(cnode.cnode_load(str(package)))
+
+def test_successive_updates_match_fresh_parse(tmp_path):
+    #the ast of the statements after each edit is shifted lazily, possibly several times before it is used
+    sources = ['x = 1\ndef f():\n    return 1\nif x:\n    pass\nelif y:\n    def g(): pass\nelse:\n    z = 1\ndef h():\n    pass\n']
+    sources.append(sources[-1].replace('    return 1\n','    y = 1\n    return y\n'))
+    sources.append(sources[-1].replace('x = 1\n','x = 1\n\n\n'))
+    sources.append(sources[-1].replace('    y = 1\n',''))
+    parse_cache.clear_cache()
+    module_cnode = cnode.parse_module(write(tmp_path/'module.py',sources[0]))
+    for source in sources[1:]:
+        module_cnode.update(source)
+    assert signature(module_cnode) == signature(cnode.parse_module(write(tmp_path/'fresh.py',sources[-1])))
+
+def test_update_of_one_definition_is_faster_than_rebuild():
+    import time
+    source = ''.join('def f%d(x):\n    if x > %d:\n        return x\n    return -x\n\n' % (i,i) for i in range(400))
+    edited = source.replace('def f200(x):\n','def f200(x):\n    x += 1\n')
+    update_times,rebuild_times = [],[]
+    for repeat in range(3):
+        module_cnode = cnode.build_module('generated.py',source,cnode.astoid_parse(source))
+        start = time.perf_counter()
+        module_cnode.update(edited)
+        update_times.append(time.perf_counter()-start)
+        start = time.perf_counter()
+        cnode.build_module('generated.py',edited,cnode.astoid_parse(edited))
+        rebuild_times.append(time.perf_counter()-start)
+    assert min(update_times) < min(rebuild_times)
@@ -0,0 +1,35 @@
+import ast
+import pytest
+np = pytest.importorskip('numpy')
+import cnode, columnar, parse_cache
+from astoid import CodeClause
+from symbol_index import line_range
+from conftest import make_package
+
+def test_columns_round_trip_to_the_tree(tmp_path):
+    parse_cache.clear_cache()
+    root_cnode = cnode.cnode_load(make_package(tmp_path))
+    cnode_columns,astoid_columns = columnar.export(root_cnode)
+    astoids = [astoid for module_cnode in columnar.module_cnodes(root_cnode) if len(module_cnode.astoids) > 0 for astoid in module_cnode.astoids[0].walk()]
+    assert len(astoid_columns) == len(astoids)
+    for row,astoid in enumerate(astoids):
+        assert astoid_columns.astoid(row) is astoid
+        assert columnar.AST_TYPES[astoid_columns.type_code[row]] is type(astoid.ast_node)
+        assert astoid_columns.line_index[row] == (-1 if astoid.line_index is None else astoid.line_index)
+        parent_row = astoid_columns.parent[row]
+        assert (astoid.parent is None) if parent_row == -1 else (astoid_columns.astoid(parent_row) is astoid.parent)
+        assert astoid_columns.end[row]-row == len(list(astoid.walk()))
+    cnodes = list(root_cnode.subtree())
+    assert len(cnode_columns) == len(cnodes)
+    for row,c in enumerate(cnodes):
+        assert cnode_columns.cnode(row) is c
+        assert columnar.CNODE_TYPES[cnode_columns.type_code[row]] is type(c)
+        assert cnode_columns.end[row]-row == len(list(c.subtree()))
+        if cnode_columns.astoid_row[row] >= 0:
+            assert astoid_columns.astoid(cnode_columns.astoid_row[row]) is c.astoids[0]
+        if not isinstance(c,cnode.CnodePackage):
+            start,end = line_range(c)
+            assert cnode_columns.span[row] == end-start
+    assert [cnode_columns.cnode(row).name for row in cnode_columns.rows(cnode.CnodeDef)] == ['f','A','g','ssl']
+    assert len(astoid_columns.rows(ast.Try,CodeClause.BODY)) == len(astoid_columns.rows(ast.ExceptHandler,CodeClause.EXCEPT)) == 1
+    assert set(astoid_columns.columns()) == {'type_code','clause_code','parent','depth','end','line_index','col_offset','span','module'}
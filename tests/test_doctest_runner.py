@@ -0,0 +1,36 @@
+import os
+from doctest_runner import run_source_doctests
+
+source = '''
+def double(x):
+    """
+    >>> double(2)
+    4
+    >>> double(3)
+    7
+    """
+    return 2*x
+'''
+
+def test_run_source_doctests_counts_quietly(capsys):
+    assert run_source_doctests(source,'doubling','doubling.py') == (1,2)
+    assert capsys.readouterr().out == ''
+
+def test_package_doctests_see_edits_in_a_warm_pool(tmp_path):
+    import sys
+    from doctest_runner import DoctestPool, DoctestCache, run_package_doctests
+    package = tmp_path/'edited'
+    package.mkdir()
+    (package/'__init__.py').write_text('')
+    module = package/'tripling.py'
+    module.write_text('def triple(x):\n    """\n    >>> triple(2)\n    6\n    """\n    return 3*x\n')
+    cache = DoctestCache()
+    with DoctestPool(1,sys_path=[str(tmp_path)]+sys.path) as pool:
+        assert [(result.failcount,result.testcount) for result in run_package_doctests(str(package),cache=cache,pool=pool)] == [(0,1)]
+        #same size, so the mtime is moved on explicitly for the bytecode cache to notice
+        module.write_text('def triple(x):\n    """\n    >>> triple(2)\n    6\n    """\n    return 4*x\n')
+        stat = module.stat()
+        os.utime(module,ns=(stat.st_atime_ns,stat.st_mtime_ns+2*10**9))
+        assert [(result.failcount,result.testcount) for result in run_package_doctests(str(package),cache=cache,pool=pool)] == [(1,1)]
+        cached = run_package_doctests(str(package),cache=cache,pool=pool)
+    assert cached[0].cached and not any(result.cached for result in cache.results.values())
@@ -0,0 +1,59 @@
+import sys
+import pytest
+from doctest_runner import DoctestPool
+import injector
+
+source = '''def double(x):
+    """
+    Doubles x
+    """
+    return 2*x
+
+def triple(x): return 3*x
+
+def halve(x):
+    y = x/2
+    return y
+'''
+
+@pytest.fixture
+def pool(tmp_path,monkeypatch):
+    (tmp_path/'arith.py').write_text(source)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    sys.modules.pop('arith',None)
+    with DoctestPool(1,sys_path=[str(tmp_path)]+sys.path) as pool:
+        yield pool
+    sys.modules.pop('arith',None)
+
+def test_batch_injection_writes_each_file_once(tmp_path,pool):
+    sessions = {
+            'arith.double':['>>> double(2)\n','4\n'],
+            'arith.triple':['>>> triple(2)\n','6\n'],
+            'arith.halve':['>>> halve(3)\n','1.5\n'],
+            }
+    batch = injector.BatchDoctestInjector(sessions,pool)
+    assert list(batch.files) == [str(tmp_path/'arith.py')]
+    assert batch.write() == {str(tmp_path/'arith.py'):(0,0,0,3,True)}
+    updated = (tmp_path/'arith.py').read_text()
+    assert '    Doubles x\n\n    >>> double(2)\n    4\n    """\n' in updated
+    assert 'def triple(x): \n    """\n    >>> triple(2)\n    6\n    """\n    return 3*x\n' in updated
+    assert 'def halve(x):\n    """\n    >>> halve(3)\n    1.5\n    """\n    y = x/2\n' in updated
+    assert pool.testsource(updated,'arith',str(tmp_path/'arith.py')) == (0,3)
+
+def test_batch_injection_keeps_files_whose_failcount_changes(tmp_path,pool):
+    results = injector.inject_doctests({'arith.double':['>>> double(2)\n','5\n']},pool)
+    assert results[str(tmp_path/'arith.py')] == (0,0,1,1,False)
+    assert (tmp_path/'arith.py').read_text() == source
+    assert '5' in (tmp_path/'arith.py.failed_doctest_insert').read_text()
+
+def test_verify_runs_in_a_worker_without_reloading(tmp_path,pool):
+    doctest_injector = injector.DoctestInjector('arith.double',pool)
+    module = sys.modules['arith']
+    doctest_injector.middle.extend(['>>> double(2)\n','4\n'])
+    assert doctest_injector.verify(doctest_injector.original_source) == (0,0)
+    assert doctest_injector.verify(doctest_injector.source()) == (0,1)
+    #a source that fails to execute raises, and the caller's module is left alone
+    with pytest.raises(ZeroDivisionError):
+        doctest_injector.verify(source+'1/0\n')
+    assert sys.modules['arith'] is module and (tmp_path/'arith.py').read_text() == source
@@ -0,0 +1,45 @@
+import pytest
+import lazy_imports, parse_cache
+from doctest_runner import DoctestPool
+
+source = '''import os
+import json, re
+from collections import OrderedDict
+__all__ = ['OrderedDict']
+
+def to_json(value):
+    """
+    >>> to_json([1])
+    '[1]'
+    """
+    return json.dumps(value)
+
+def separator():
+    return os.sep
+
+SEP = os.sep
+
+def matches(pattern, text): return re.match(pattern, text)
+'''
+
+@pytest.fixture
+def module_path(tmp_path):
+    path = tmp_path/'lazymod.py'
+    path.write_text(source)
+    parse_cache.clear_cache()
+    return str(path)
+
+def test_plan_moves_only_function_only_imports(module_path):
+    rewriter = lazy_imports.LazyImportRewriter(module_path)
+    #os is used at module level, re only in a single line function and OrderedDict is exported
+    assert [(lazy_import.name,[function.name for function in lazy_import.functions]) for lazy_import in rewriter.lazy_imports] == [('json',['to_json'])]
+    assert rewriter.source() == source.replace('import json, re\n','import re\n').replace('    """\n    return json','    """\n    import json\n    return json')
+
+def test_write_verifies_and_rewrites(module_path):
+    with DoctestPool(1) as pool:
+        assert lazy_imports.lazify(module_path,pool=pool) == (0,1,0,1,True)
+    with open(module_path) as f:
+        rewritten = f.read()
+    assert 'import json' not in rewritten.splitlines()[:3] and '    import json\n' in rewritten
+    #nothing is left to move
+    assert lazy_imports.lazify(module_path,verify=False) == (None,None,None,None,False)
@@ -0,0 +1,38 @@
+import ast, importlib.util
+import metrics
+
+source = '''
+def f(x):
+    match x:
+        case 1:
+            return 'a'
+        case [y] if y:
+            return 'b'
+        case _:
+            return 'c'
+def g(x):
+    if x and x.y:
+        return h(x)
+    return 0
+'''
+
+def function_metrics(module,path):
+    return {m.qualname:m for m in module.module_metrics(path) if m.kind == 'function'}
+
+def test_complexity_and_callees(tmp_path):
+    path = tmp_path/'metricsmod.py'
+    path.write_text(source)
+    results = function_metrics(metrics,str(path))
+    #each match case is a decision point
+    assert results['f'].complexity == 4
+    assert (results['g'].complexity,results['g'].nesting,results['g'].callees) == (3,1,('h',))
+
+def test_ast_without_match_case(tmp_path,monkeypatch):
+    #python before 3.10 has no ast.match_case
+    monkeypatch.delattr(ast,'match_case')
+    spec = importlib.util.spec_from_file_location('metrics_without_match',metrics.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    path = tmp_path/'metricsmod.py'
+    path.write_text(source.partition('def g')[1]+source.partition('def g')[2])
+    assert function_metrics(module,str(path))['g'].complexity == 3
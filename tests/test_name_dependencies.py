@@ -0,0 +1,78 @@
+import ast, sys
+import parse_cache, sourcerunner, target_resolver
+from name_dependencies import ModuleDependencies, bound_names, mutated_names
+
+def sliced_source(source,name):
+    ast_module = ast.parse(source)
+    target = [statement for statement in ast_module.body if getattr(statement,'name',None) == name][0]
+    return [ast.unparse(statement) for statement in ModuleDependencies(ast_module).slice_statements(target)]
+
+def test_mutated_names():
+    assert mutated_names(ast.parse("A.extra = 5").body[0]) == {'A'}
+    assert mutated_names(ast.parse("REG['k'][0] = 7").body[0]) == {'REG'}
+    assert mutated_names(ast.parse("del REG['k']").body[0]) == {'REG'}
+    assert mutated_names(ast.parse("sys.path.insert(0,'lib')").body[0]) == {'sys'}
+    assert mutated_names(ast.parse("x = y.z").body[0]) == set()
+    #function bodies are not run by the statement, but decorators are
+    assert mutated_names(ast.parse("@REG.register\ndef f():\n    A.extra = 5\n").body[0]) == {'REG'}
+    assert bound_names(ast.parse("A.extra = 5").body[0]) == set()
+
+def test_slice_keeps_mutations_of_needed_names():
+    source = '''
+import os
+REG = {}
+class A():
+    pass
+A.extra = 5
+REG['k'] = 7
+REG.update(j=8)
+unused = {}
+unused['k'] = 1
+print('not needed')
+def f():
+    return A.extra,REG
+'''
+    assert sliced_source(source,'f') == ['REG = {}','class A:\n    pass','A.extra = 5',"REG['k'] = 7",'REG.update(j=8)','def f():\n    return (A.extra, REG)']
+
+def test_slice_keeps_sys_path_changes_before_imports():
+    source = '''
+import sys
+sys.path.insert(0,'lib')
+import helper
+x = 1
+def f():
+    return helper.value
+'''
+    assert sliced_source(source,'f') == ['import sys',"sys.path.insert(0, 'lib')",'import helper','def f():\n    return helper.value']
+
+def test_run_target_needing_mutations(tmp_path,monkeypatch):
+    (tmp_path/'lib').mkdir()
+    (tmp_path/'lib'/'slicehelper.py').write_text('value = 3\n')
+    (tmp_path/'slicemod.py').write_text('''
+import os, sys
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'lib'))
+import slicehelper
+class A():
+    pass
+A.extra = 5
+REG = {}
+REG['k'] = 7
+def f():
+    return A.extra,REG['k'],slicehelper.value
+''')
+    monkeypatch.setattr(sys,'path',list(sys.path))
+    monkeypatch.delitem(sys.modules,'slicehelper',raising=False)
+    parse_cache.clear_cache()
+    target_resolver.get_resolver(str(tmp_path)).clear()
+    assert sourcerunner.resolve('slicemod.f',str(tmp_path)).run() == (5,7,3)
+
+def test_module_dependencies_live_with_the_parse_cache_entry(tmp_path):
+    from name_dependencies import module_dependencies
+    path = tmp_path/'deps.py'
+    path.write_text('import os\ndef f():\n    return os.sep\n')
+    parse_cache.clear_cache()
+    dependencies = module_dependencies(str(path))
+    assert module_dependencies(str(path)) is dependencies
+    assert parse_cache.default_cache.entries[str(path)].derived['dependencies'] is dependencies
+    parse_cache.discard(str(path))
+    assert module_dependencies(str(path)) is not dependencies
@@ -0,0 +1,66 @@
+import os
+import pytest
+from parse_cache import ParseCache
+
+def touch(path,nanoseconds=10**9):
+    #moves the mtime on explicitly, as rewrites within one test may share a timestamp
+    stat = path.stat()
+    os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns+nanoseconds))
+
+@pytest.fixture
+def module(tmp_path):
+    path = tmp_path/'cached.py'
+    path.write_text('x = 1\n')
+    return path
+
+def test_hit_and_miss(module):
+    cache = ParseCache()
+    source,tree = cache.load(str(module))
+    assert source == 'x = 1\n' and cache.stats()['misses'] == 1
+    assert cache.load(str(module))[1] is tree
+    assert cache.stats()['hits'] == 1 and cache.stats()['hit_rate'] == 0.5
+
+def test_touched_but_unchanged_is_a_hit(module):
+    cache = ParseCache()
+    tree = cache.parse_ast(str(module))
+    touch(module)
+    assert cache.parse_ast(str(module)) is tree
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 1
+
+def test_changed_size_or_content_is_a_miss(module):
+    cache = ParseCache()
+    tree = cache.parse_ast(str(module))
+    digest = cache.digest(str(module))
+    module.write_text('x = 10\n')
+    changed = cache.parse_ast(str(module))
+    assert changed is not tree and changed.body[0].value.value == 10
+    #same size and a new mtime, but different content: only the hash tells them apart
+    module.write_text('x = 20\n')
+    touch(module)
+    assert cache.parse_ast(str(module)).body[0].value.value == 20
+    assert cache.digest(str(module)) != digest
+    assert cache.stats()['misses'] == 3
+
+def test_lru_evicts_the_least_recently_used(tmp_path):
+    cache = ParseCache(maxsize=2)
+    paths = []
+    for name in 'abc':
+        path = tmp_path/(name+'.py')
+        path.write_text('%s = 1\n' % name)
+        paths.append(str(path))
+    cache.load(paths[0])
+    cache.load(paths[1])
+    cache.load(paths[0])
+    cache.load(paths[2])
+    assert list(cache.entries) == [os.path.abspath(paths[0]),os.path.abspath(paths[2])]
+    assert cache.stats()['evictions'] == 1
+
+def test_disk_store_is_shared_and_validated(module,tmp_path):
+    cache_dir = str(tmp_path/'cache')
+    ParseCache(cache_dir=cache_dir).load(str(module))
+    cache = ParseCache(cache_dir=cache_dir)
+    assert cache.load(str(module))[0] == 'x = 1\n'
+    assert cache.stats()['disk_hits'] == 1
+    module.write_text('x = 2\n')
+    touch(module)
+    assert ParseCache(cache_dir=cache_dir).parse_ast(str(module)).body[0].value.value == 2
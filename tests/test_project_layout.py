@@ -0,0 +1,78 @@
+import ast
+import cnode, parse_cache, project_layout
+from conftest import write
+
+def test_block_times_runs_compound_statements_whole(tmp_path):
+    #the def in the except clause is a child of its own, but only the try statement as a whole compiles
+    path = tmp_path/'fallback.py'
+    path.write_text('import os\ntry:\n    from os import no_such_name\nexcept ImportError:\n    def no_such_name():\n        return 1\n\n@staticmethod\ndef decorated():\n    pass\nx = 1; y = 2\n')
+    parse_cache.clear_cache()
+    module_cnode = cnode.parse_module(str(path))
+    times = project_layout.block_times(module_cnode,'fallback',sys_path=[str(tmp_path)])
+    assert [child for child,seconds in times] == module_cnode.children
+    charged = {str(child):seconds for child,seconds in times}
+    assert charged["CnodeFunction('no_such_name')"] == 0.0
+    assert all(seconds >= 0.0 for child,seconds in times)
+
+def test_block_times_ignore_module_output(tmp_path):
+    #a module printing something that looks like a timing line does not disturb the timings
+    path = tmp_path/'noisy.py'
+    path.write_text('x = 1\nprint("0 99.0")\n')
+    parse_cache.clear_cache()
+    module_cnode = cnode.parse_module(str(path))
+    times = project_layout.block_times(module_cnode,'noisy',sys_path=[str(tmp_path)])
+    assert len(times) > 0 and all(0.0 <= seconds < 99.0 for child,seconds in times)
+
+def make_graph(tmp_path):
+    package = tmp_path/'pkg'
+    (package/'sub').mkdir(parents=True)
+    write(package/'__init__.py','from . import a\n')
+    write(package/'a.py','import os\n\ndef f():\n    import json\n\nfrom .b import g\nfrom . import c\n')
+    write(package/'b.py','from pkg import a\n\ndef g():\n    pass\n')
+    write(package/'c.py','x = 1\n')
+    write(package/'sub'/'__init__.py','')
+    write(package/'sub'/'d.py','from ..c import x\n')
+    parse_cache.clear_cache()
+    return project_layout.ImportGraph(str(package))
+
+def test_import_graph_edges(tmp_path):
+    graph = make_graph(tmp_path)
+    assert sorted(graph.modules) == ['pkg','pkg.a','pkg.b','pkg.c','pkg.sub','pkg.sub.d']
+    assert graph.packages == {'pkg','pkg.sub'}
+    #'from . import c' imports the submodule, 'from .b import g' a name of the module
+    edges = {edge.target:edge for edge in graph.edges['pkg.a']}
+    assert edges['pkg.c'].names == ['c'] and edges['pkg.b'].names == ['g']
+    assert edges['json'].deferred and not edges['os'].deferred
+    assert graph.imports('pkg.a') == ['os','pkg.b','pkg.c']
+    assert graph.imports('pkg.a',deferred=True) == ['json','os','pkg.b','pkg.c']
+    assert graph.importers('pkg.c') == ['pkg.a','pkg.sub.d']
+    assert graph.external() == ['json','os']
+
+def test_relative_imports_resolve_against_the_package(tmp_path):
+    graph = make_graph(tmp_path)
+    assert graph.imports('pkg.sub.d') == ['pkg.c']
+    assert graph.imports('pkg') == ['pkg.a']
+    node = ast.parse('from ..c import x').body[0]
+    assert project_layout.import_base('pkg.sub',node) == 'pkg.c'
+    assert project_layout.import_base('pkg',ast.parse('from . import a').body[0]) == 'pkg'
+    assert project_layout.import_base('pkg',ast.parse('from os import path').body[0]) == 'os'
+
+def test_cycles_and_dependencies(tmp_path):
+    graph = make_graph(tmp_path)
+    assert graph.cycles() == [['pkg.a','pkg.b']]
+    #parent packages are imported first, and pkg imports a, which imports b and c
+    assert graph.dependencies('pkg.sub.d') == ['pkg','pkg.a','pkg.b','pkg.c','pkg.sub']
+    assert graph.dependencies('pkg.sub.d',internal=False) == ['os','pkg','pkg.a','pkg.b','pkg.c','pkg.sub']
+    assert graph.dependencies('pkg.c') == ['pkg','pkg.a','pkg.b']
+
+def test_import_profile_attribute(tmp_path):
+    graph = make_graph(tmp_path)
+    #-X importtime order: modules follow the modules they imported, one level deeper
+    times = [('pkg.c',10,10,2),('pkg.b',20,20,2),('os',3,3,2),('pkg.a',7,40,1),('pkg',1,41,0)]
+    profile = project_layout.ImportProfile(graph,'pkg',times)
+    assert profile.children['pkg.a'] == ['pkg.c','pkg.b','os'] and profile.children['pkg'] == ['pkg.a']
+    assert profile.slowest(2) == [('pkg',41),('pkg.a',40)]
+    assert profile.slowest(internal=True)[-1] == ('pkg.c',10)
+    first,function,last = graph.modules['pkg.a'].children
+    assert str(function) == "CnodeFunction('f')"
+    assert profile.attribute('pkg.a') == [(None,7),(last,30),(first,3)]
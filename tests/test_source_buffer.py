@@ -0,0 +1,75 @@
+import ast, json
+import pytest
+import cnode, parse_cache
+import source_buffer
+from source_buffer import SourceBuffer
+from conftest import signature
+
+def test_mapped_buffers_bound_open_maps(tmp_path,monkeypatch):
+    monkeypatch.setattr(source_buffer,'max_open_maps',4)
+    texts = ['# module %d\nx = %d\r\ny = "\\u00e9"\n' % (i,i) for i in range(20)]
+    buffers = []
+    for i,text in enumerate(texts):
+        path = tmp_path/('m%d.py' % i)
+        path.write_bytes(text.encode('utf-8'))
+        buffers.append(SourceBuffer.map_file(str(path)))
+    assert sum(1 for buffer in buffers if buffer._data is not None) <= 4
+    #closed maps are mapped again on access
+    for buffer,text in zip(buffers,texts):
+        assert buffer.get_text() == text.replace('\r\n','\n')
+        assert list(buffer) == text.replace('\r\n','\n').splitlines(keepends=True)
+    assert sum(1 for buffer in buffers if buffer._data is not None) <= 4
+
+@pytest.mark.parametrize('name,data',[
+        ('bom.py','﻿x = "é"\ndef f():\n    return x\n'.encode('utf-8')),
+        ('crlf.py',b'x = 1\r\ndef f():\r\n    return x\r\n'),
+        ('cr.py',b'x = 1\rdef f():\r    return x\r'),
+        ('cookie.py','# -*- coding: latin-1 -*-\nx = "é"\ndef f():\n    return x\n'.encode('latin-1')),
+        ])
+def test_mapped_parse_matches_unmapped(tmp_path,name,data):
+    path = tmp_path/name
+    path.write_bytes(data)
+    parse_cache.clear_cache()
+    unmapped = cnode.parse_module(str(path))
+    mapped = cnode.parse_module(str(path),mapped=True)
+    assert signature(mapped) == signature(unmapped)
+    assert mapped.source_lines.get_text() == unmapped.source_lines.get_text()
+    assert [ast.dump(astoid.ast_node) for astoid in mapped.astoids] == [ast.dump(astoid.ast_node) for astoid in unmapped.astoids]
+
+def test_line_span_slicing_and_equality():
+    text = 'a = 1\nb = 2\nc = 3\nd = 4\n'
+    buffer = SourceBuffer(text)
+    lines = text.splitlines(keepends=True)
+    span = buffer[1:4]
+    assert isinstance(span,source_buffer.LineSpan)
+    assert span == lines[1:4] and list(span) == lines[1:4] and len(span) == 3
+    assert span[0] == 'b = 2\n' and span[-1] == 'd = 4\n'
+    assert span[1:] == lines[2:4] and span[1:][0] == 'c = 3\n'
+    assert span[::2] == lines[1:4:2]
+    assert span[5:] == [] and buffer[3:1] == []
+    assert span != lines[0:3]
+    assert span.get_text() == 'b = 2\nc = 3\nd = 4\n'
+    assert span.span() == (6,len(text))
+    with pytest.raises(IndexError):
+        span[3]
+
+def test_cnode_lines_text_and_span(tmp_path):
+    path = tmp_path/'spans.py'
+    path.write_bytes('x = "é"\ndef f():\n    return x\n\ny = 2\n'.encode('utf-8'))
+    parse_cache.clear_cache()
+    for module_cnode in [cnode.parse_module(str(path)),cnode.parse_module(str(path),mapped=True)]:
+        function = module_cnode.children[1]
+        assert function.get_lines() == ['def f():\n']
+        #a plain list, so callers can extend and serialize it
+        assert function.get_lines()+['    return x\n'] == ['def f():\n','    return x\n']
+        assert json.loads(json.dumps(function.get_lines())) == function.get_lines()
+        for child in module_cnode.walk():
+            assert isinstance(child.get_line_span(),source_buffer.LineSpan) and child.get_line_span() == child.get_lines()
+            assert child.get_text() == ''.join(child.get_lines())
+            start,end = child.get_span()
+            if module_cnode.source_lines.path is None:
+                assert module_cnode.source_lines.text[start:end] == child.get_text()
+            else:
+                #byte offsets into the file
+                assert path.read_bytes()[start:end].decode('utf-8') == child.get_text()
+        assert module_cnode.source_lines.get_text() == path.read_text(encoding='utf-8')
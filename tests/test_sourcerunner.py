@@ -0,0 +1,89 @@
+import ast, asyncio, doctest, sys
+import pytest
+import parse_cache, sourcerunner, target_resolver
+
+source = '''
+import asyncio
+class A():
+    class B():
+        async def f(self):
+            return 'A.B.f'
+        def g(self):
+            return 'A.B.g'
+    def h(self):
+        async def local():
+            pass
+        return local
+if True:
+    async def k(x):
+        await asyncio.sleep(0)
+        return x+1
+'''
+
+@pytest.fixture
+def module_path(tmp_path):
+    (tmp_path/'runnermod.py').write_text(source)
+    parse_cache.clear_cache()
+    target_resolver.get_resolver(str(tmp_path)).clear()
+    return str(tmp_path)
+
+def test_build_code_tree_doctests():
+    failures,tests = doctest.testmod(sourcerunner,extraglobs={'ast':ast})
+    assert failures == 0
+    assert tests > 0
+
+def test_code_tree_names_nested_and_async_definitions():
+    code_tree = sourcerunner.build_code_tree(ast.parse(source))
+    assert sorted('.'.join(name) for name in code_tree) == ['A','A.B','A.B.f','A.B.g','A.h','A.h.local','k']
+    assert isinstance(code_tree[('A','B','f')][0],ast.AsyncFunctionDef)
+    assert [node.name for node in code_tree[('A','B','f')][1][1:]] == ['A','B']
+    assert [type(node).__name__ for node in code_tree[('k',)][1]] == ['Module']
+
+def test_ast_code_tree_is_rebuilt_with_the_parse(module_path):
+    origin = module_path+'/runnermod.py'
+    code_tree = sourcerunner.ast_code_tree(origin)
+    assert sourcerunner.ast_code_tree(origin) is code_tree
+    parse_cache.clear_cache()
+    assert sourcerunner.ast_code_tree(origin) is not code_tree
+
+def test_compiled_code_is_dropped_with_the_parse_cache_entry(module_path):
+    runner = sourcerunner.resolve('runnermod.A.B.g',module_path)
+    code = runner.compile()
+    assert runner.compile() is code
+    open(module_path+'/other.py','w').close()
+    maxsize = parse_cache.default_cache.maxsize
+    parse_cache.configure(maxsize=1)
+    try:
+        parse_cache.parse_ast(module_path+'/other.py')
+        assert runner.compile() is not code
+        assert parse_cache.cache_stats()['size'] == 1
+    finally:
+        parse_cache.configure(maxsize=maxsize)
+
+@pytest.mark.parametrize('target,runner_type',[
+        ('runnermod',sourcerunner.Module),
+        ('runnermod.A',sourcerunner.Class),
+        ('runnermod.A.B',sourcerunner.Class),
+        ('runnermod.A.B.f',sourcerunner.AsyncFunction),
+        ('runnermod.A.B.g',sourcerunner.Function),
+        ('runnermod.A.h.local',sourcerunner.AsyncFunction),
+        ('runnermod.k',sourcerunner.AsyncFunction),
+        ])
+def test_resolve_runner_types(module_path,target,runner_type):
+    assert type(sourcerunner.resolve(target,module_path)) is runner_type
+
+def test_run_nested_and_async_targets(module_path):
+    instance = sourcerunner.resolve('runnermod.A.B',module_path).run()
+    assert type(instance).__qualname__ == 'A.B'
+    method = sourcerunner.resolve('runnermod.A.B.f',module_path).load()
+    assert asyncio.run(method(instance)) == 'A.B.f'
+    assert sourcerunner.resolve('runnermod.k',module_path).run(1) == 2
+    assert 'runnermod' not in sys.modules
+
+def test_function_locals_cannot_be_loaded(module_path):
+    with pytest.raises(target_resolver.NoTargetError):
+        sourcerunner.resolve('runnermod.A.h.local',module_path).load()
+
+def test_missing_target(module_path):
+    with pytest.raises(target_resolver.NoTargetError):
+        sourcerunner.resolve('runnermod.A.missing',module_path)
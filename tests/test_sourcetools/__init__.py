@@ -1,3 +0,0 @@
-import sys, os.path
-sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../../src')))
-from .myptkcmd import *
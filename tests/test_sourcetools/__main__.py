@@ -1,2 +0,0 @@
-from . import MyPtkCmd
-MyPtkCmd().cmdloop()
@@ -0,0 +1,26 @@
+import os
+import parse_cache, symbol_index
+
+def test_module_symbols_live_with_the_parse_cache_entry(tmp_path):
+    path = tmp_path/'shapes.py'
+    path.write_text('class Square():\n    def area(self):\n        pass\n')
+    parse_cache.clear_cache()
+    index = symbol_index.module_symbols(str(path))
+    assert index.lookup('Square.area') is not None
+    assert symbol_index.module_symbols(str(path)) is index
+    path.write_text('class Square():\n    def side(self):\n        pass\n')
+    stat = path.stat()
+    os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns+10**9))
+    changed = symbol_index.module_symbols(str(path))
+    assert changed is not index and changed.lookup('Square.area') is None and changed.lookup('Square.side') is not None
+    #evicting the entry drops the index with it
+    other = tmp_path/'other.py'
+    other.write_text('x = 1\n')
+    maxsize = parse_cache.default_cache.maxsize
+    parse_cache.configure(maxsize=1)
+    try:
+        parse_cache.parse_ast(str(other))
+        assert parse_cache.cache_stats()['size'] == 1
+        assert symbol_index.module_symbols(str(path)) is not changed
+    finally:
+        parse_cache.configure(maxsize=maxsize)
@@ -0,0 +1,69 @@
+import importlib, os, sys, threading
+import pytest
+from target_resolver import TargetResolver, NoTargetError
+
+@pytest.fixture
+def resolver(tmp_path):
+    package = tmp_path/'resolvepkg'
+    (package/'sub').mkdir(parents=True)
+    (package/'__init__.py').write_text('raise ImportError("never imported")\n')
+    (package/'sub'/'__init__.py').write_text('')
+    (package/'sub'/'shapes.py').write_text('class Square():\n    class Side():\n        def length(self):\n            pass\n    def area(self):\n        pass\ndef unit():\n    pass\n')
+    return TargetResolver(str(tmp_path))
+
+def test_resolve_dotted_names_without_importing(resolver):
+    resolution = resolver.resolve('resolvepkg.sub.shapes.Square.Side.length')
+    assert resolution.module_name == 'resolvepkg.sub.shapes'
+    assert resolution.inner == ['Square','Side','length']
+    assert resolution.cnode.name == 'length' and resolution.cnode.parent.name == 'Side'
+    assert resolution.origin.endswith('shapes.py') and not resolution.is_package
+    assert 'resolvepkg' not in sys.modules
+
+def test_resolve_packages_and_modules(resolver):
+    package = resolver.resolve('resolvepkg.sub')
+    assert package.is_package and package.inner == [] and package.cnode is None
+    assert resolver.resolve('resolvepkg.sub.shapes').cnode is None
+    assert resolver.split('resolvepkg.sub.shapes.unit')[2] == ['unit']
+
+def test_missing_names(resolver):
+    with pytest.raises(NoTargetError):
+        resolver.resolve('resolvepkg.sub.shapes.Square.perimeter')
+    with pytest.raises(NoTargetError):
+        resolver.resolve('no_such_package_anywhere.thing')
+    #builtin modules resolve, but their definitions are not in python source
+    with pytest.raises(NoTargetError):
+        resolver.resolve('sys.getrecursionlimit')
+
+def test_shared_between_threads(resolver):
+    results = []
+    def resolve():
+        results.append(resolver.resolve('resolvepkg.sub.shapes.Square.area').cnode)
+    threads = [threading.Thread(target=resolve) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 and all(cnode is results[0] for cnode in results)
+
+def test_modules_created_after_a_failed_lookup(tmp_path):
+    resolver = TargetResolver(str(tmp_path))
+    with pytest.raises(NoTargetError):
+        resolver.resolve('latemodule.later')
+    (tmp_path/'latemodule.py').write_text('def later():\n    pass\n')
+    importlib.invalidate_caches()
+    assert resolver.resolve('latemodule.later').cnode.name == 'later'
+    #found specs are kept until invalidate()
+    os.rename(str(tmp_path/'latemodule.py'),str(tmp_path/'movedmodule.py'))
+    assert resolver.find_spec('latemodule') is not None
+    resolver.invalidate()
+    assert resolver.find_spec('latemodule') is None
+    assert resolver.resolve('movedmodule.later').cnode.name == 'later'
+
+def test_sys_path_changes_reset_specs(tmp_path,monkeypatch):
+    resolver = TargetResolver()
+    assert resolver.find_spec('pathmodule') is None
+    resolver.find_spec('os')
+    (tmp_path/'pathmodule.py').write_text('x = 1\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    assert resolver.find_spec('pathmodule').origin == str(tmp_path/'pathmodule.py')
+    assert list(resolver.specs) == ['pathmodule']
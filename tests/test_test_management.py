@@ -0,0 +1,64 @@
+import os, subprocess
+import parse_cache
+from conftest import write
+from test_management import ImpactMap, git_changes
+
+def make_project(tmp_path):
+    (tmp_path/'proj').mkdir()
+    write(tmp_path/'proj'/'__init__.py','')
+    write(tmp_path/'proj'/'core.py','def add(a,b):\n    return a+b\n\ndef mul(a,b):\n    return a*b\n')
+    write(tmp_path/'proj'/'util.py','from proj.core import mul\n\ndef double(x):\n    return mul(x,2)\n')
+    write(tmp_path/'proj'/'extra.py','def unused():\n    return 0\n')
+    (tmp_path/'tests').mkdir()
+    write(tmp_path/'tests'/'test_core.py','from proj.core import add\nfrom proj import util\n\ndef test_add():\n    assert add(1,2) == 3\n\ndef test_double():\n    assert util.double(2) == 4\n')
+    write(tmp_path/'tests'/'test_extra.py','from proj.extra import unused\n\ndef test_unused():\n    assert unused() == 0\n')
+    return [str(tmp_path/'proj'),str(tmp_path/'tests')]
+
+def test_select_changed_lines(tmp_path):
+    parse_cache.clear_cache()
+    impact_map = ImpactMap.build(make_project(tmp_path),root=str(tmp_path),doctests=False)
+    assert sorted(impact_map.tests) == ['tests/test_core.py::test_add','tests/test_core.py::test_double','tests/test_extra.py::test_unused']
+    #the body of mul is only run through util.double
+    assert impact_map.changed_definitions({'proj/core.py':[(4,5)]}) == {'proj.core.mul'}
+    assert impact_map.select({'proj/core.py':[(4,5)]}) == ['tests/test_core.py::test_double']
+    assert impact_map.select({'proj/core.py':[(0,2)]}) == ['tests/test_core.py::test_add']
+    assert sorted(impact_map.select({'proj/util.py':[(2,4)]})) == ['tests/test_core.py::test_double']
+    assert impact_map.select({'tests/test_extra.py':[(3,4)]}) == ['tests/test_extra.py::test_unused']
+    assert impact_map.select({}) == []
+
+def test_save_load_and_deleted_module(tmp_path):
+    parse_cache.clear_cache()
+    impact_map = ImpactMap.build(make_project(tmp_path),root=str(tmp_path),doctests=False)
+    map_path = str(tmp_path/'impact.map')
+    impact_map.save(map_path)
+    loaded = ImpactMap.load(map_path,root=str(tmp_path))
+    assert (loaded.paths,loaded.tests,loaded.names,loaded.modules) == (impact_map.paths,impact_map.tests,impact_map.names,impact_map.modules)
+    assert loaded.select({'proj/core.py':[(4,5)]}) == ['tests/test_core.py::test_double']
+    #a module deleted since the map was built selects every test that used anything in it
+    os.remove(str(tmp_path/'proj'/'extra.py'))
+    parse_cache.clear_cache()
+    loaded = ImpactMap.load(map_path,root=str(tmp_path))
+    assert loaded.changed_definitions({'proj/extra.py':None}) == {'proj.extra.'}
+    assert loaded.select({'proj/extra.py':None}) == ['tests/test_extra.py::test_unused']
+
+def git(root,*args):
+    subprocess.run(['git','-c','user.name=test','-c','user.email=test@example.com']+list(args),cwd=root,check=True,capture_output=True)
+
+def test_git_changes_parses_zero_context_hunks(tmp_path):
+    root = str(tmp_path)
+    git(root,'init','-q')
+    write(tmp_path/'a.py',''.join('l%d\n' % i for i in range(1,7)))
+    write(tmp_path/'b.py','b1\nb2\nb3\n')
+    write(tmp_path/'c.py','c1\n')
+    git(root,'add','.')
+    git(root,'commit','-q','-m','base')
+    #l2 replaced, l4 deleted, two lines appended
+    write(tmp_path/'a.py','l1\nL2\nl3\nl5\nl6\nn1\nn2\n')
+    #the first line deleted
+    write(tmp_path/'b.py','b2\nb3\n')
+    os.remove(str(tmp_path/'c.py'))
+    write(tmp_path/'d.py','d1\n')
+    changes = git_changes(root=root)
+    #a pure deletion (+N,0) marks the lines on either side of it
+    assert changes == {'a.py':[(1,2),(2,4),(5,7)],'b.py':[(0,1)],'c.py':None,'d.py':[(0,None)]}
+    assert 'd.py' not in git_changes(root=root,untracked=False)
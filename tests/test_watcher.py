@@ -0,0 +1,65 @@
+import os
+import cnode, parse_cache, watcher
+from conftest import make_package, signature, write
+
+def touch(path):
+    #rewrites within one test may share a timestamp
+    stat = os.stat(path)
+    os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns+10**9))
+
+def fresh(path):
+    parse_cache.clear_cache()
+    return signature(cnode.cnode_load(path))
+
+def test_added_modified_and_removed_modules(tmp_path):
+    path = make_package(tmp_path)
+    with watcher.TreeWatcher(path,inotify=False) as tree_watcher:
+        assert tree_watcher.poll() == []
+        added = write(tmp_path/'package'/'c.py','def h():\n    return 3\n')
+        (tmp_path/'package'/'sub'/'deeper').mkdir()
+        write(tmp_path/'package'/'sub'/'deeper'/'__init__.py','x = 1\n')
+        events = tree_watcher.poll()
+        assert sorted((event.kind,os.path.basename(event.path)) for event in events) == [('added','c.py'),('added','deeper')]
+        assert signature(tree_watcher.root) == fresh(path)
+
+        modified = str(tmp_path/'package'/'a.py')
+        write(tmp_path/'package'/'a.py','import os\n\ndef f(x):\n    return 3\n\nclass A():\n    def g(self):\n        pass\n')
+        touch(modified)
+        events = tree_watcher.poll()
+        assert [(event.kind,event.path) for event in events] == [('modified',modified)]
+        assert "CnodeFunction('f')" in [str(child) for child in events[0].added]
+        assert signature(tree_watcher.root) == fresh(path)
+
+        os.remove(added)
+        events = tree_watcher.poll()
+        assert [(event.kind,event.path) for event in events] == [('removed',added)]
+        assert events[0].cnode.parent is None
+        assert signature(tree_watcher.root) == fresh(path)
+
+def test_module_that_no_longer_parses_is_kept(tmp_path):
+    path = write(tmp_path/'module.py','def f():\n    return 1\n')
+    with watcher.TreeWatcher(path,inotify=False) as tree_watcher:
+        before = signature(tree_watcher.root)
+        write(tmp_path/'module.py','def f(:\n    return 1\n')
+        touch(path)
+        events = tree_watcher.poll()
+        assert [event.kind for event in events] == ['error'] and isinstance(events[0].error,SyntaxError)
+        assert signature(tree_watcher.root) == before
+
+def test_module_removed_and_created_again(tmp_path):
+    path = write(tmp_path/'module.py','def f():\n    return 1\n')
+    with watcher.TreeWatcher(path,inotify=False) as tree_watcher:
+        root = tree_watcher.root
+        os.remove(path)
+        assert [event.kind for event in tree_watcher.poll()] == ['removed']
+        assert tree_watcher.poll() == []
+        write(tmp_path/'module.py','x = 1\n\ndef g():\n    return 2\n')
+        events = tree_watcher.poll()
+        assert [(event.kind,event.path) for event in events] == [('added',path)]
+        assert events[0].cnode is root and tree_watcher.root is root
+        assert signature(tree_watcher.root) == fresh(path)
+        #and it is watched for changes again
+        write(tmp_path/'module.py','x = 2\n')
+        touch(path)
+        assert [event.kind for event in tree_watcher.poll()] == ['modified']
+        assert signature(tree_watcher.root) == fresh(path)